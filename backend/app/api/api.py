@@ -1,13 +1,16 @@
 import os
 from dotenv import load_dotenv
-import shutil
+import hashlib
+from datetime import datetime, timezone
 from pathlib import Path
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Header
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from .. import models
+from . import idempotency
 from ..db.session import SessionLocal
-from shared.utils import logger
-from shared.utils.celery_app import celery_app
+from shared.utils import logger, metrics, tracing
 from shared.db import base
 import uuid
 
@@ -27,8 +30,21 @@ def get_db():
     finally:
         database.close()
 
-UPLOAD_DIR = Path("/app/uploads")
+UPLOAD_DIR = Path(os.getenv("UPLOAD_DIR", "/app/uploads")) # Shared volume, also read by the worker
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+def save_upload(file: UploadFile, path: Path):
+    """
+    Copies the upload to `path`, hashing it on the way, so idempotent retries are matched on the content too.
+    :return: The sha256 hex digest of the file.
+    """
+    digest = hashlib.sha256()
+    with path.open("wb") as buffer:
+        for chunk in iter(lambda: file.file.read(UPLOAD_CHUNK_BYTES), b""):
+            digest.update(chunk)
+            buffer.write(chunk)
+    return digest.hexdigest()
 
 
 '''
@@ -65,18 +81,37 @@ def create_job(
     # CHANGE THIS LINE:
     job_in: models.JobCreate = Depends(models.JobCreate.as_form), # <--- Here's the change!
     file: UploadFile = File(...),
+    idempotency_key: Optional[str] = Header(None), # Retries with the same key get the first response back
     db: Session = Depends(get_db),
 ):
     # Your existing logic remains the same, as job_in will now be correctly populated
     # ...
     logger.info('Inside create Job ')
-    if not file.filename.endswith('.jsonl'):
-        raise HTTPException(status_code=400, detail="Only JSONL files are allowed.")
+    # The worker converts every accepted format to canonical Parquet before training (worker/ingest_dataset.py)
+    if not file.filename.lower().endswith(('.csv', '.jsonl', '.parquet')):
+        raise HTTPException(status_code=400, detail="Only CSV, JSONL or Parquet files are allowed.")
 
-    # Save the uploaded file
+    idempotency.validate_key(idempotency_key)
+    # Written under a temporary name and only moved into place once the submission is accepted
     file_path = UPLOAD_DIR / file.filename
-    with file_path.open("wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    tmp_path = UPLOAD_DIR / f".{uuid.uuid4()}.upload"
+    try:
+        dataset_sha256 = save_upload(file, tmp_path)
+        if idempotency_key:
+            fingerprint = idempotency.request_fingerprint(
+                {**job_in.model_dump(), "dataset_filename": file.filename, "dataset_sha256": dataset_sha256}
+            )
+            record = idempotency.find_key(db, "jobs", idempotency_key, fingerprint)
+            if record is not None:
+                logger.info("Replaying job submission", extra={"job_id": record.job_id})
+                return idempotency.replay(record)
+        # Checked before the upload is moved into place; the unique index still catches a concurrent submission
+        if db.query(base.Job.id).filter(base.Job.new_model_name == job_in.new_model_name).first():
+            raise HTTPException(status_code=409, detail=f"A model named '{job_in.new_model_name}' already exists.")
+        tmp_path.replace(file_path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    metrics.UPLOAD_BYTES.labels("api").inc(file_path.stat().st_size)
     logger.info('job saving to db')
     job = base.Job(
         id=str(uuid.uuid4()),
@@ -84,19 +119,59 @@ def create_job(
         base_model=job_in.base_model,
         new_model_name=job_in.new_model_name,
         dataset_type=job_in.dataset_type,
+        owner=job_in.owner,
+        priority=job_in.priority,
         status="QUEUED"
     )
     db.add(job)
-    db.commit()
-    db.refresh(job)
-    return job
+    try:
+        db.flush() # Applies column defaults, so the response below is the one a refresh would give
+        response = models.Job.model_validate(job, from_attributes=True)
+        if idempotency_key:
+            idempotency.add_key(db, "jobs", idempotency_key, fingerprint, job.id, 201, response.model_dump(mode="json"))
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        # Either a concurrent retry with the same key got there first, or another submission took the name
+        record = idempotency.find_key(db, "jobs", idempotency_key, fingerprint) if idempotency_key else None
+        if record is not None:
+            return idempotency.replay(record)
+        raise HTTPException(status_code=409, detail=f"A model named '{job_in.new_model_name}' already exists.")
+    return response
 
 @api_router.get("/jobs/{job_id}", response_model=models.Job)
 def get_job_status(job_id: str, db: Session = Depends(get_db)):
     job = db.query(base.Job).filter(base.Job.id == job_id).first()
     if not job:
         raise HTTPException(status_code=404, detail="Job not found")
-    return job
+
+    response = models.Job.model_validate(job, from_attributes=True)
+    training_progress = job.training_progress or {}
+    step, total_steps = training_progress.get("step"), training_progress.get("total_steps")
+    if step is not None and total_steps:
+        response.progress = min(step / total_steps, 1.0)
+    if job.status == "RUNNING" and training_progress.get("eta_seconds") is not None:
+        # The ETA was computed when the metrics were reported; count down the time since then
+        eta_seconds = training_progress["eta_seconds"]
+        reported_at = training_progress.get("reported_at")
+        if reported_at:
+            eta_seconds -= (datetime.now(timezone.utc) - datetime.fromisoformat(reported_at)).total_seconds()
+        response.eta_seconds = max(eta_seconds, 0.0)
+    return response
+
+@api_router.get("/jobs/{job_id}/metrics", response_model=List[models.JobMetricPoint])
+def get_job_metrics(job_id: str, db: Session = Depends(get_db)):
+    """
+    Returns the (downsampled) loss / learning-rate / throughput curve recorded while the job trained.
+    """
+    if not db.query(base.Job.id).filter(base.Job.id == job_id).first():
+        raise HTTPException(status_code=404, detail="Job not found")
+    return (
+        db.query(base.JobMetric)
+        .filter(base.JobMetric.job_id == job_id)
+        .order_by(base.JobMetric.step)
+        .all()
+    )
 
 @api_router.post(
     "/inference/generate_text", # New endpoint for inference
@@ -104,39 +179,90 @@ def get_job_status(job_id: str, db: Session = Depends(get_db)):
     status_code=202, # 202 Accepted for async processing
     summary="Submit text for asynchronous inference via RunPod"
 )
-def submit_inference_request(input_data: models.InferenceRequestInput):
-    request_id = str(uuid.uuid4())
-    print(f'request_id for inference: {request_id}')
-    print(f'input_data submitted for inference: {input_data}')
+def submit_inference_request(
+    input_data: models.InferenceRequestInput,
+    idempotency_key: Optional[str] = Header(None), # Retries with the same key get the first response back
+):
+    idempotency.validate_key(idempotency_key)
     db = SessionLocal()
-    try:
-        # Create an entry in your database to track this inference request
-        # You might need to add a 'task_type' column to your Job model
-        # or create a new 'InferenceRequest' model if Job is strictly for finetuning.
-        new_job = base.Job(
-            id=request_id,
-            status="ACCEPTED",
-            task_type="inference", # New field
-            input_data={"text": input_data.prompt}, # Store input for tracking
-            base_model=input_data.huggingface_repo, # Example
-            # Other fields as necessary
-        )
-        db.add(new_job)
-        db.commit()
-        db.refresh(new_job) # Refresh to get auto-generated fields like created_at
-
-        # Delegate the actual inference task to the Celery worker
-        # This is the "call a method exposed from worker" part
-        logger.info('Before calling run_runpod_inference_task')
-        print("[INFO] Celery broker URL:", celery_app.conf.broker_url)
-        task = celery_app.send_task("run_runpod_inference_task", args=[request_id,input_data.prompt, input_data.huggingface_repo])
-        #run_runpod_inference_task.delay(input_data.job_id,input_data.prompt, input_data.huggingface_repo) # .delay() sends to message queue
-        return models.InferenceRequestResponse(job_id=request_id, status="accepted")
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"Failed to submit inference request: {e}")
-    finally:
-        db.close()
+    fingerprint = None
+    if idempotency_key:
+        fingerprint = idempotency.request_fingerprint(input_data.model_dump())
+        try:
+            record = idempotency.find_key(db, "inference", idempotency_key, fingerprint)
+        except HTTPException:
+            db.close()
+            raise
+        if record is not None:
+            logger.info("Replaying inference request", extra={"request_id": record.job_id})
+            db.close()
+            return idempotency.replay(record)
+
+    request_id = str(uuid.uuid4())
+    # The prompt itself is user data and can be large; only its size is logged
+    logger.info(
+        f"Inference request {request_id} submitted",
+        extra={"request_id": request_id, "huggingface_repo": input_data.huggingface_repo, "prompt_chars": len(input_data.prompt)},
+    )
+    span_attributes = {"inference.request_id": request_id, "inference.huggingface_repo": input_data.huggingface_repo}
+    # Root of the request's trace; the Celery task and the RunPod call continue it
+    with tracing.start_span("inference.submit", kind=tracing.SpanKind.SERVER, attributes=span_attributes):
+        key_committed = False # Only a key this request committed may be deleted again
+        try:
+            # Create an entry in your database to track this inference request
+            # You might need to add a 'task_type' column to your Job model
+            # or create a new 'InferenceRequest' model if Job is strictly for finetuning.
+            response = models.InferenceRequestResponse(job_id=request_id, status="accepted")
+            with tracing.start_span("db.create_inference_job"):
+                new_job = base.Job(
+                    id=request_id,
+                    status="ACCEPTED",
+                    task_type="inference", # New field
+                    input_data={"text": input_data.prompt}, # Store input for tracking
+                    base_model=input_data.huggingface_repo, # Example
+                    # Other fields as necessary
+                )
+                db.add(new_job)
+                if idempotency_key:
+                    # Committed with the job, before the task is sent, so a concurrent retry cannot send it twice
+                    idempotency.add_key(db, "inference", idempotency_key, fingerprint, request_id, 202, response.model_dump(mode="json"))
+                try:
+                    db.commit()
+                except IntegrityError:
+                    db.rollback()
+                    if not idempotency_key:
+                        raise
+                    # A concurrent request with the same key committed first; its key row is not ours to delete
+                    record = idempotency.find_key(db, "inference", idempotency_key, fingerprint)
+                    if record is None:
+                        raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is already being processed.")
+                    return idempotency.replay(record)
+                key_committed = bool(idempotency_key)
+                db.refresh(new_job) # Refresh to get auto-generated fields like created_at
+
+            # Delegate the actual inference task to the Celery worker
+            # This is the "call a method exposed from worker" part
+            # Imported here so the API process only loads Celery once inference is actually used
+            from shared.utils.celery_app import celery_app
+            with tracing.start_span("celery.send_task run_runpod_inference_task", kind=tracing.SpanKind.PRODUCER):
+                # The trace context rides along in the message headers
+                task = celery_app.send_task(
+                    "run_runpod_inference_task",
+                    args=[request_id,input_data.prompt, input_data.huggingface_repo],
+                    headers=tracing.task_headers(),
+                )
+            #run_runpod_inference_task.delay(input_data.job_id,input_data.prompt, input_data.huggingface_repo) # .delay() sends to message queue
+            return response
+        except HTTPException:
+            raise
+        except Exception as e:
+            db.rollback()
+            if key_committed:
+                # The task was never sent; forget the key so the client's retry submits again instead of replaying
+                idempotency.delete_key(db, "inference", idempotency_key)
+            raise HTTPException(status_code=500, detail=f"Failed to submit inference request: {e}")
+        finally:
+            db.close()
 
 
 @api_router.get(
@@ -0,0 +1,98 @@
+# idempotency.py
+# Idempotency-Key support for the job submission endpoints. A client that retries a submission after a
+# timeout sends the same key again; instead of creating a second job (and paying for a second GPU run)
+# the API answers with the response the first request got. Keys are kept for IDEMPOTENCY_KEY_TTL_SECONDS.
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta, timezone
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from sqlalchemy.orm import Session
+
+from shared.db import base
+from shared.utils import metrics
+
+IDEMPOTENCY_KEY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_KEY_TTL_SECONDS", str(24 * 3600)))
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+# Set on replayed responses so clients can tell a replay from a fresh submission
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+
+def utc_now():
+    return datetime.now(timezone.utc)
+
+
+def as_utc(value):
+    # SQLite and `DateTime` columns without a timezone hand back naive datetimes; they are stored in UTC
+    return value.replace(tzinfo=value.tzinfo or timezone.utc)
+
+
+def validate_key(key):
+    if key is not None and not 1 <= len(key) <= IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key must be 1 to {IDEMPOTENCY_KEY_MAX_LENGTH} characters.")
+    return key
+
+
+def request_fingerprint(fields):
+    """
+    :param fields: The request parameters that define the submission (a JSON-serializable dict).
+    :return: A stable sha256 hex digest of the parameters.
+    """
+    return hashlib.sha256(json.dumps(fields, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def find_key(db: Session, scope, key, fingerprint):
+    """
+    Looks up an unexpired key. An expired key is deleted so the submission proceeds as a new one.
+
+    :return: The stored IdempotencyKey row, or None if the key is new.
+    :raises HTTPException: 422 if the key was used for a request with different parameters.
+    """
+    record = db.query(base.IdempotencyKey).filter(
+        base.IdempotencyKey.scope == scope, base.IdempotencyKey.key == key
+    ).first()
+    if record is None:
+        return None
+    if as_utc(record.expires_at) <= utc_now():
+        db.delete(record)
+        db.commit()
+        return None
+    if record.request_fingerprint != fingerprint:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request.")
+    return record
+
+
+def add_key(db: Session, scope, key, fingerprint, job_id, status_code, body):
+    """
+    Adds the key to the session; the caller commits it in the same transaction as the job it created,
+    so a job never exists without its key or the other way round.
+    """
+    now = utc_now()
+    db.add(base.IdempotencyKey(
+        scope=scope,
+        key=key,
+        request_fingerprint=fingerprint,
+        job_id=job_id,
+        response_status_code=status_code,
+        response_body=body,
+        created_at=now,
+        expires_at=now + timedelta(seconds=IDEMPOTENCY_KEY_TTL_SECONDS),
+    ))
+
+
+def delete_key(db: Session, scope, key):
+    db.query(base.IdempotencyKey).filter(
+        base.IdempotencyKey.scope == scope, base.IdempotencyKey.key == key
+    ).delete(synchronize_session=False)
+    db.commit()
+
+
+def replay(record):
+    metrics.IDEMPOTENT_REPLAYS.labels(record.scope).inc()
+    return JSONResponse(
+        status_code=record.response_status_code,
+        content=record.response_body,
+        headers={REPLAYED_HEADER: "true"},
+    )
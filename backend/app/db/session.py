@@ -2,9 +2,11 @@ import os
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
+from shared.utils.lazy import LazyResource
 
 load_dotenv()
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
\ No newline at end of file
+# Created on first request rather than at import, so the app starts without touching the DB driver
+engine = LazyResource(lambda: create_engine(DATABASE_URL))
+SessionLocal = LazyResource(lambda: sessionmaker(autocommit=False, autoflush=False, bind=engine.get()))
\ No newline at end of file
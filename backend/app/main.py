@@ -1,14 +1,19 @@
-from fastapi import FastAPI
+import time
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from .api.api import api_router
-from .db.session import engine
+from .db.session import engine, SessionLocal
 from  shared.db import base
+from shared.utils import metrics, tracing
 
 # Create DB tables
 # base.Base.metadata.create_all(bind=engine)
 
 app = FastAPI(title="Finetuning Service API")
 
+# No-op unless TRACING_EXPORTER is set
+tracing.setup_tracing("backend")
+
 # CORS middleware for React frontend
 app.add_middleware(
     CORSMiddleware,
@@ -20,6 +25,29 @@ app.add_middleware(
 
 app.include_router(api_router, prefix="/api/v1")
 
+# Queue depth is read from the jobs table at scrape time; only the backend reports it
+metrics.register_collector(metrics.JobQueueCollector(SessionLocal))
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    start_time = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        # Label by route template (/api/v1/jobs/{job_id}), not the raw path, to keep cardinality bounded
+        route = request.scope.get("route")
+        metrics.HTTP_REQUEST_SECONDS.labels(
+            request.method, getattr(route, "path", "unmatched"), str(status_code)
+        ).observe(time.perf_counter() - start_time)
+
+@app.get("/metrics", include_in_schema=False)
+def read_metrics():
+    body, content_type = metrics.render_metrics()
+    return Response(content=body, media_type=content_type)
+
 @app.get("/")
 def read_root():
     return {"message": "Welcome to the Finetuning API"}
\ No newline at end of file
@@ -26,6 +26,8 @@ class JobCreate(BaseModel):
     base_model: Literal["unsloth/Qwen2-7b-bnb-4bit", "unsloth/gemma-7b-bnb-4bit","unsloth/llama-3-8b-Instruct"]
     dataset_type: Literal["Q&A", "Conversational", "Reasoning"]
     new_model_name: str = Field(..., min_length=3, max_length=50, pattern=r"^[a-zA-Z0-9_-]+$")
+    owner: Optional[str] = Field(None, max_length=100)
+    priority: int = Field(0, ge=-10, le=10)
 
     # This is the new class method to handle form data
     @classmethod
@@ -34,11 +36,15 @@ class JobCreate(BaseModel):
         base_model: Literal["unsloth/Qwen2-7b-bnb-4bit", "unsloth/gemma-7b-bnb-4bit","unsloth/llama-3-8b-Instruct"] = Form(...),
         dataset_type: Literal["Q&A", "Conversational", "Reasoning"] = Form(...),
         new_model_name: str = Form(..., min_length=3, max_length=50, pattern=r"^[a-zA-Z0-9_-]+$"),
+        owner: Optional[str] = Form(None, max_length=100),
+        priority: int = Form(0, ge=-10, le=10),
     ) -> "JobCreate": # The -> "JobCreate" is for type hinting, ensures it returns an instance of JobCreate
         return cls(
             base_model=base_model,
             dataset_type=dataset_type,
-            new_model_name=new_model_name
+            new_model_name=new_model_name,
+            owner=owner,
+            priority=priority,
         )
 
 class Job(BaseModel):
@@ -47,10 +53,26 @@ class Job(BaseModel):
     base_model: str
     new_model_name: Optional[str] = None
     error_message: Optional[str] = None
+    owner: Optional[str] = None
+    priority: Optional[int] = None
+    task_type: Optional[str] = None
+    merged_model_repo: Optional[str] = None
+    # Latest metrics reported by a running finetune (step, total_steps, loss, learning_rate, tokens_per_second, ...)
+    training_progress: Optional[dict] = None
+    dataset_stats: Optional[dict] = None # Rows in/out and duplicates removed before training
+    progress: Optional[float] = None # Fraction of training steps done, 0.0 - 1.0
+    eta_seconds: Optional[float] = None
 
 class Config:
         from_attributes = True       
 
+class JobMetricPoint(BaseModel):
+    step: int
+    epoch: Optional[float] = None
+    loss: Optional[float] = None
+    learning_rate: Optional[float] = None
+    tokens_per_second: Optional[float] = None
+
 # Define a Pydantic model for the request body (input string)
 class ChatInput(BaseModel):
     prompt: str
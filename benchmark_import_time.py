@@ -0,0 +1,98 @@
+# benchmark_import_time.py
+# Measures the cold import time of each service entry point with `python -X importtime` and checks it
+# against a budget, so heavy imports creeping back into module scope show up before they slow down
+# container restarts and Celery autoscaling. Exits with status 1 when a budget is exceeded.
+#
+#   python benchmark_import_time.py
+#   python benchmark_import_time.py --repeat 7 --output import_times.json
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Budgets are cumulative import times in milliseconds, with headroom for slower CI machines
+IMPORT_BUDGETS = [
+    {"name": "worker (GPU)", "module": "worker", "cwd": "worker", "env": {"WORKER_MODE": "GPU"}, "budget_ms": 800},
+    {
+        "name": "worker (GPU-SERVERLESS)",
+        "module": "worker",
+        "cwd": "worker",
+        "env": {"WORKER_MODE": "GPU-SERVERLESS", "RUNPOD_API_KEY": "benchmark", "RUNPOD_SERVERLESS_ENDPOINT_ID": "benchmark"},
+        "budget_ms": 800,
+    },
+    {"name": "worker (CPU_MOCK)", "module": "worker", "cwd": "worker", "env": {"WORKER_MODE": "CPU_MOCK"}, "budget_ms": 600},
+    {"name": "celery worker", "module": "celery_worker.worker", "cwd": ".", "env": {}, "budget_ms": 1500},
+    {"name": "backend", "module": "backend.app.main", "cwd": ".", "env": {}, "budget_ms": 2000},
+]
+
+
+def parse_cumulative_ms(stderr, module):
+    """
+    Returns the cumulative import time of `module` from -X importtime output, in milliseconds.
+    Lines look like: "import time:  self [us] | cumulative | imported package".
+    """
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) == 3 and parts[2].strip() == module:
+            return int(parts[1]) / 1000.0
+    return None
+
+
+def measure(target, repeat):
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT, PYTHONDONTWRITEBYTECODE="1", **target["env"])
+    env.setdefault("DATABASE_URL", "sqlite:///:memory:")
+    timings = []
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {target['module']}"],
+            cwd=os.path.join(REPO_ROOT, target["cwd"]),
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode != 0:
+            errors = [line for line in result.stderr.splitlines() if line.strip() and not line.startswith("import time:")]
+            return None, errors[-1] if errors else f"exit code {result.returncode}"
+        cumulative_ms = parse_cumulative_ms(result.stderr, target["module"])
+        if cumulative_ms is not None:
+            timings.append(cumulative_ms)
+    return statistics.median(timings) if timings else None, None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check service import times against their budgets")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per entry point; the median is reported.")
+    parser.add_argument("--output", type=str, default=None, help="Optional path to write results as JSON.")
+    args = parser.parse_args()
+
+    results = []
+    over_budget = False
+    print(f"{'entry point':<26} {'import ms':>10} {'budget ms':>10}  status")
+    for target in IMPORT_BUDGETS:
+        import_ms, error = measure(target, args.repeat)
+        if error is not None:
+            status = f"skipped ({error})"
+        elif import_ms is None:
+            status = "skipped (no -X importtime output)"
+        elif import_ms > target["budget_ms"]:
+            status = "OVER BUDGET"
+            over_budget = True
+        else:
+            status = "ok"
+        results.append({"name": target["name"], "module": target["module"], "import_ms": import_ms,
+                         "budget_ms": target["budget_ms"], "status": status})
+        shown_ms = f"{import_ms:.1f}" if import_ms is not None else "-"
+        print(f"{target['name']:<26} {shown_ms:>10} {target['budget_ms']:>10}  {status}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    sys.exit(1 if over_budget else 0)
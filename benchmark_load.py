@@ -0,0 +1,420 @@
+# benchmark_load.py
+# End-to-end load test of the platform against a local RunPod stand-in (worker/stub_executor_server.py).
+# Finetuning jobs and inference requests are submitted through the API at target rates and the latency
+# and throughput of every stage are reported:
+#
+#   finetune.submit, inference.submit   POST latency seen by the client
+#   *.queue_wait                        job created -> claimed by a worker (from job_status_history)
+#   *.run                               claimed -> terminal status
+#   *.end_to_end                        job created -> successful terminal status
+#   runpod.<route>                      requests served by the stand-in, including the injected latency
+#
+# Arrivals are Poisson and open loop: a request's latency is measured from its scheduled arrival time,
+# so a saturated system shows up as latency instead of silently lowering the offered load.
+#
+# The API (uvicorn) and the Celery inference worker run in this process; the polling worker runs as a
+# subprocess like in production. By default the database is SQLite in a temporary directory and the broker
+# is Celery's in-memory transport, which only works because the API and the Celery worker share this
+# process. SQLite serializes writers, so use --database-url (Postgres) and --broker-url (Redis) for numbers
+# that are meant to be compared with production. Exits with status 1 when a stage's p95 regressed against
+# --baseline by more than --max-regression.
+#
+#   python benchmark_load.py --duration 60 --job-rate 0.5 --inference-rate 5 --output load.json
+#   python benchmark_load.py --duration 60 --job-rate 0.5 --inference-rate 5 --baseline load.json
+import argparse
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import requests
+
+REPO_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+FINETUNE_TERMINAL_STATUSES = ("COMPLETED", "FAILED")
+INFERENCE_TERMINAL_STATUSES = ("COMPLETED_INFERENCE", "FAILED_INFERENCE")
+BENCHMARK_PROMPT = "Summarize the following support ticket in one sentence. "
+thread_local = threading.local()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def http_session():
+    # requests.Session is not thread safe; every client thread keeps its own keep-alive session
+    if not hasattr(thread_local, "session"):
+        thread_local.session = requests.Session()
+    return thread_local.session
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def timestamp(value):
+    # DateTime columns come back naive (SQLite, Postgres without time zone) but are written in UTC
+    return value.replace(tzinfo=value.tzinfo or timezone.utc).timestamp()
+
+
+def summarize(samples, errors):
+    """
+    :param samples: (start, end) pairs in epoch seconds.
+    :param errors: Counter of error kinds for the stage.
+    """
+    summary = {"count": len(samples), "errors": dict(errors)}
+    if samples:
+        durations_ms = [(end - start) * 1000.0 for start, end in samples]
+        window = max(end for _, end in samples) - min(start for start, _ in samples)
+        summary.update(
+            p50_ms=round(percentile(durations_ms, 0.50), 1),
+            p95_ms=round(percentile(durations_ms, 0.95), 1),
+            p99_ms=round(percentile(durations_ms, 0.99), 1),
+            mean_ms=round(sum(durations_ms) / len(durations_ms), 1),
+            max_ms=round(max(durations_ms), 1),
+            throughput_per_s=round(len(samples) / window, 3) if window > 0 else None,
+        )
+    return summary
+
+
+def generate_arrivals(rate, duration, rng):
+    """
+    :return: Poisson arrival offsets (seconds from the start) for `rate` requests per second.
+    """
+    offsets, offset = [], 0.0
+    while rate > 0:
+        offset += rng.expovariate(rate)
+        if offset >= duration:
+            break
+        offsets.append(offset)
+    return offsets
+
+
+# --- Clients ---
+def submit_job(api_url, name, dataset, scheduled_at):
+    """
+    :return: (job id or None, scheduled time, end time, error or None)
+    """
+    try:
+        response = http_session().post(
+            f"{api_url}/api/v1/jobs",
+            data={"base_model": "unsloth/llama-3-8b-Instruct", "dataset_type": "Q&A", "new_model_name": name},
+            files={"file": (f"{name}.jsonl", dataset, "application/jsonl")},
+            timeout=120,
+        )
+        response.raise_for_status()
+        return response.json()["id"], scheduled_at, time.time(), None
+    except requests.exceptions.RequestException as e:
+        return None, scheduled_at, time.time(), e
+
+
+def submit_inference(api_url, prompt, scheduled_at):
+    try:
+        response = http_session().post(
+            f"{api_url}/api/v1/inference/generate_text",
+            json={"prompt": prompt, "huggingface_repo": "benchmark/finetuned-adapter"},
+            timeout=120,
+        )
+        response.raise_for_status()
+        return response.json()["job_id"], scheduled_at, time.time(), None
+    except requests.exceptions.RequestException as e:
+        return None, scheduled_at, time.time(), e
+
+
+def error_kind(error):
+    response = getattr(error, "response", None)
+    return f"http_{response.status_code}" if response is not None else type(error).__name__
+
+
+# --- Services under test ---
+def start_stub_runpod(args):
+    from worker import stub_executor_server
+
+    handler = stub_executor_server.StubExecutorHandler
+    handler.duration = args.finetune_seconds
+    handler.tick = min(1.0, args.finetune_seconds / 10)
+    handler.latency_ms = args.runpod_latency_ms
+    handler.latency_sigma = args.runpod_latency_sigma
+    handler.error_rate = args.runpod_error_rate
+    handler.inference_ms = args.inference_ms
+    handler.inference_sigma = args.inference_sigma
+    server = stub_executor_server.create_server("127.0.0.1", 0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def start_api(port):
+    import uvicorn
+    from backend.app.main import app
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    deadline = time.time() + 30
+    while not server.started:
+        if time.time() > deadline:
+            raise RuntimeError("API did not start within 30 seconds.")
+        time.sleep(0.05)
+    return server
+
+
+def start_polling_worker(args, work_dir):
+    env = dict(
+        os.environ,
+        PYTHONPATH=REPO_ROOT,
+        WORKER_MODE="GPU",
+        WORKER_ID="benchmark-worker",
+        WORKER_MAX_CONCURRENCY=str(args.worker_concurrency),
+        WORKER_POLL_INTERVAL_SECONDS=str(args.poll_interval),
+        POLL_MIN_INTERVAL=str(args.poll_interval),
+        POLL_MAX_INTERVAL=str(max(args.poll_interval, 2.0)),
+        # The merge export is a second simulated run per job; leave it out of the measured pipeline
+        EXPORT_MERGED_MODELS="false",
+        METRICS_PORT="0",
+    )
+    log_file = open(os.path.join(work_dir, "worker.log"), "w")
+    process = subprocess.Popen(
+        [sys.executable, "worker.py"], cwd=os.path.join(REPO_ROOT, "worker"), env=env, stdout=log_file, stderr=subprocess.STDOUT
+    )
+    return process, log_file
+
+
+def stop_polling_worker(process, timeout):
+    process.send_signal(signal.SIGTERM) # Releases claimed jobs and drains like a deploy would
+    try:
+        process.wait(timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+# --- Results ---
+def chunks(items, size=500):
+    for index in range(0, len(items), size):
+        yield items[index:index + size]
+
+
+def count_unfinished(session_factory, job_ids, terminal_statuses):
+    from shared.db.base import Job
+
+    db = session_factory()
+    try:
+        return sum(
+            db.query(Job.id).filter(Job.id.in_(chunk), Job.status.notin_(terminal_statuses)).count()
+            for chunk in chunks(job_ids)
+        )
+    finally:
+        db.close()
+
+
+def collect_job_stages(session_factory, job_ids, prefix, claimed_status, terminal_statuses, samples, errors):
+    """
+    Derives queue wait, run time and end-to-end latency of the submitted jobs from their status history.
+    """
+    from shared.db.base import Job, JobStatusHistory
+
+    db = session_factory()
+    try:
+        created_at, history = {}, defaultdict(list)
+        for chunk in chunks(job_ids):
+            created_at.update(db.query(Job.id, Job.created_at).filter(Job.id.in_(chunk)).all())
+            rows = (
+                db.query(JobStatusHistory.job_id, JobStatusHistory.status, JobStatusHistory.created_at)
+                .filter(JobStatusHistory.job_id.in_(chunk))
+                .order_by(JobStatusHistory.created_at, JobStatusHistory.id)
+                .all()
+            )
+            for job_id, status, changed_at in rows:
+                history[job_id].append((status, timestamp(changed_at)))
+    finally:
+        db.close()
+
+    for job_id in job_ids:
+        created = timestamp(created_at[job_id])
+        claims = [changed_at for status, changed_at in history[job_id] if status == claimed_status]
+        terminal = next(((status, changed_at) for status, changed_at in reversed(history[job_id]) if status in terminal_statuses), None)
+        if claims:
+            samples[f"{prefix}.queue_wait"].append((created, claims[0]))
+        if terminal is None:
+            errors[f"{prefix}.end_to_end"]["unfinished"] += 1
+            continue
+        status, finished = terminal
+        if claims:
+            samples[f"{prefix}.run"].append((claims[-1], finished))
+        if status == terminal_statuses[0]:
+            samples[f"{prefix}.end_to_end"].append((created, finished))
+        else:
+            errors[f"{prefix}.end_to_end"][status] += 1
+
+
+def compare_with_baseline(stages, baseline_path, max_regression):
+    """
+    :return: Names of the stages whose p95 got worse than the baseline by more than max_regression.
+    """
+    with open(baseline_path) as f:
+        baseline = json.load(f)["stages"]
+    regressions = []
+    print(f"\n{'stage':<26} {'baseline p95':>12} {'p95':>10} {'change':>8}")
+    for name, summary in stages.items():
+        before, after = baseline.get(name, {}).get("p95_ms"), summary.get("p95_ms")
+        if not before or after is None:
+            continue
+        change = after / before - 1
+        flag = "  REGRESSION" if change > max_regression else ""
+        if flag:
+            regressions.append(name)
+        print(f"{name:<26} {before:>12.1f} {after:>10.1f} {change:>+8.0%}{flag}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="End-to-end load test against a local RunPod stand-in")
+    parser.add_argument("--duration", type=float, default=60.0, help="Seconds during which requests are submitted.")
+    parser.add_argument("--job-rate", type=float, default=0.5, help="Finetuning jobs submitted per second.")
+    parser.add_argument("--inference-rate", type=float, default=5.0, help="Inference requests submitted per second.")
+    parser.add_argument("--drain-timeout", type=float, default=300.0, help="Seconds to wait for submitted work to finish.")
+    parser.add_argument("--clients", type=int, default=64, help="Concurrent client connections.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dataset-rows", type=int, default=100, help="Rows in the uploaded JSONL dataset.")
+    parser.add_argument("--prompt-chars", type=int, default=500)
+    parser.add_argument("--database-url", type=str, default=None, help="Defaults to SQLite in a temporary directory.")
+    parser.add_argument("--broker-url", type=str, default="memory://", help="Celery broker, e.g. redis://localhost:6379/0.")
+    parser.add_argument("--worker-concurrency", type=int, default=8, help="Jobs the polling worker drives at once.")
+    parser.add_argument("--celery-concurrency", type=int, default=16, help="Celery inference worker threads.")
+    parser.add_argument("--poll-interval", type=float, default=0.5, help="Worker poll and pod status poll interval.")
+    parser.add_argument("--finetune-seconds", type=float, default=5.0, help="Simulated training run duration.")
+    parser.add_argument("--inference-ms", type=float, default=500.0, help="Median simulated inference time.")
+    parser.add_argument("--inference-sigma", type=float, default=0.3, help="Log-normal spread of the inference time.")
+    parser.add_argument("--runpod-latency-ms", type=float, default=20.0, help="Median latency added to every RunPod response.")
+    parser.add_argument("--runpod-latency-sigma", type=float, default=0.5)
+    parser.add_argument("--runpod-error-rate", type=float, default=0.0, help="Fraction of RunPod requests that fail with HTTP 500.")
+    parser.add_argument("--log-level", type=str, default="WARNING", help="LOG_LEVEL of the services under test.")
+    parser.add_argument("--output", type=str, default=None, help="Optional path to write results as JSON.")
+    parser.add_argument("--baseline", type=str, default=None, help="Results JSON of an earlier run to compare against.")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="Allowed relative p95 increase per stage.")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="finetune-load-")
+    upload_dir = os.path.join(work_dir, "uploads")
+    os.makedirs(upload_dir)
+    stub_server, runpod_url = start_stub_runpod(args)
+
+    # The services read their configuration at import time, so the environment is set before importing them
+    os.environ.update({
+        "DATABASE_URL": args.database_url or f"sqlite:///{os.path.join(work_dir, 'benchmark.db')}",
+        "REDIS_BROKER_URL": args.broker_url,
+        "UPLOAD_DIR": upload_dir,
+        "RUNPOD_IP": runpod_url,
+        "RUNPOD_ENDPOINT_BASE_URL": f"{runpod_url}/v2",
+        "RUNPOD_API_KEY": "benchmark",
+        "RUNPOD_SERVERLESS_ENDPOINT_ID": "benchmark",
+        "LOG_LEVEL": args.log_level,
+    })
+
+    from celery.contrib.testing.worker import start_worker
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    import celery_worker.worker # Registers the inference task
+    from shared.db import base
+    from shared.utils.celery_app import INFERENCE_QUEUE, celery_app
+
+    if args.broker_url.startswith("memory://"):
+        # The in-memory transport polls for messages (once a second by default) where Redis blocks on BRPOP
+        celery_app.conf.broker_transport_options = {**celery_app.conf.broker_transport_options, "polling_interval": 0.01}
+
+    engine = create_engine(os.environ["DATABASE_URL"])
+    base.Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(bind=engine)
+
+    api_url = f"http://127.0.0.1:{free_port()}"
+    api_server = start_api(int(api_url.rsplit(":", 1)[1]))
+    worker_process, worker_log = start_polling_worker(args, work_dir)
+    print(f"Load test for {args.duration:.0f}s: {args.job_rate}/s finetuning jobs, {args.inference_rate}/s inference requests "
+          f"(work dir {work_dir})")
+
+    rng = random.Random(args.seed)
+    run_id = uuid.uuid4().hex[:8]
+    dataset = "".join(
+        json.dumps({"question": f"Question {row}?", "answer": f"Answer {row}."}) + "\n" for row in range(args.dataset_rows)
+    ).encode()
+    prompt = (BENCHMARK_PROMPT * (args.prompt_chars // len(BENCHMARK_PROMPT) + 1))[:args.prompt_chars]
+    arrivals = sorted(
+        [(offset, "finetune") for offset in generate_arrivals(args.job_rate, args.duration, rng)]
+        + [(offset, "inference") for offset in generate_arrivals(args.inference_rate, args.duration, rng)]
+    )
+
+    samples, errors = defaultdict(list), defaultdict(Counter)
+    submitted = {"finetune": [], "inference": []}
+    with start_worker(celery_app, pool="threads", concurrency=args.celery_concurrency, queues=[INFERENCE_QUEUE],
+                      hostname="benchmark@localhost", perform_ping_check=False, loglevel=args.log_level):
+        futures = []
+        with ThreadPoolExecutor(max_workers=args.clients) as executor:
+            start_time = time.time()
+            for index, (offset, kind) in enumerate(arrivals):
+                delay = start_time + offset - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                if kind == "finetune":
+                    futures.append((kind, executor.submit(submit_job, api_url, f"bench-{run_id}-{index}", dataset, start_time + offset)))
+                else:
+                    futures.append((kind, executor.submit(submit_inference, api_url, prompt, start_time + offset)))
+            for kind, future in futures:
+                job_id, started, finished, error = future.result()
+                if error is not None:
+                    errors[f"{kind}.submit"][error_kind(error)] += 1
+                    continue
+                samples[f"{kind}.submit"].append((started, finished))
+                submitted[kind].append(job_id)
+
+        print(f"Submitted {len(submitted['finetune'])} jobs and {len(submitted['inference'])} inference requests, draining...")
+        deadline = time.time() + args.drain_timeout
+        while time.time() < deadline:
+            unfinished = (count_unfinished(session_factory, submitted["finetune"], FINETUNE_TERMINAL_STATUSES)
+                          + count_unfinished(session_factory, submitted["inference"], INFERENCE_TERMINAL_STATUSES))
+            if not unfinished:
+                break
+            time.sleep(0.5)
+
+    stop_polling_worker(worker_process, timeout=60)
+    worker_log.close()
+    api_server.should_exit = True
+    stub_server.shutdown()
+
+    collect_job_stages(session_factory, submitted["finetune"], "finetune", "RUNNING", FINETUNE_TERMINAL_STATUSES, samples, errors)
+    collect_job_stages(session_factory, submitted["inference"], "inference", "PROCESSING_INFERENCE", INFERENCE_TERMINAL_STATUSES,
+                       samples, errors)
+    from worker.stub_executor_server import snapshot_stats
+    for route, requests_served in snapshot_stats().items():
+        samples[f"runpod.{route}"] = [(started, finished) for started, finished, _ in requests_served]
+        errors[f"runpod.{route}"].update(f"http_{status_code}" for _, _, status_code in requests_served if status_code >= 400)
+
+    stages = {name: summarize(samples[name], errors[name]) for name in sorted(set(samples) | set(errors))}
+    print(f"\n{'stage':<26} {'count':>6} {'errors':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'per s':>8}")
+    for name, summary in stages.items():
+        columns = [f"{summary.get(key):>9.1f}" if summary.get(key) is not None else f"{'-':>9}" for key in ("p50_ms", "p95_ms", "p99_ms")]
+        throughput = summary.get("throughput_per_s")
+        print(f"{name:<26} {summary['count']:>6} {sum(summary['errors'].values()):>6} {' '.join(columns)} "
+              f"{throughput if throughput is not None else '-':>8}")
+
+    regressions = compare_with_baseline(stages, args.baseline, args.max_regression) if args.baseline else []
+
+    if args.output:
+        config = {key: value for key, value in vars(args).items() if key not in ("output", "baseline", "database_url", "broker_url")}
+        with open(args.output, "w") as f:
+            json.dump({"run_at": datetime.now(timezone.utc).isoformat(), "config": config, "stages": stages}, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    sys.exit(1 if regressions else 0)
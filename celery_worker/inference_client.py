@@ -1,16 +1,20 @@
 import requests
-import json
 import os
 import uuid # For generating a unique job_id
 import time # For polling in asynchronous calls
+from shared.utils import logger, metrics, tracing
+
+logger = logger.setup_logger('inference_client')
 
 # --- Configuration ---
 # Set these environment variables or replace with your actual values
 RUNPOD_API_KEY = os.getenv("RUNPOD_API_KEY", "YOUR_RUNPOD_API_KEY")
 RUNPOD_ENDPOINT_ID = os.getenv("RUNPOD_SERVERLESS_ENDPOINT_ID", "YOUR_RUNPOD_ENDPOINT_ID")
 
-# The base URL for RunPod Serverless API
-RUNPOD_API_BASE_URL = f"https://api.runpod.ai/v2/{RUNPOD_ENDPOINT_ID}"
+# The base URL for RunPod Serverless API; same variable as the runpod SDK, so a local stand-in
+# (worker/stub_executor_server.py) can replace it for development and load tests
+RUNPOD_ENDPOINT_BASE_URL = os.getenv("RUNPOD_ENDPOINT_BASE_URL", "https://api.runpod.ai/v2")
+RUNPOD_API_BASE_URL = f"{RUNPOD_ENDPOINT_BASE_URL}/{RUNPOD_ENDPOINT_ID}"
 
 # Headers for authentication and content type
 HEADERS = {
@@ -24,10 +28,10 @@ def call_runpod_sync(job_id: str = None, prompt: str = None, huggingface_repo: s
     This is best for quick inferences (under ~30 seconds) where you want an immediate result.
     """
     if not RUNPOD_API_KEY or RUNPOD_API_KEY == "YOUR_RUNPOD_API_KEY":
-        print("Error: RUNPOD_API_KEY not set or is default. Please configure it.")
+        logger.error("RUNPOD_API_KEY not set or is default. Please configure it.")
         return None
     if not RUNPOD_ENDPOINT_ID or RUNPOD_ENDPOINT_ID == "YOUR_RUNPOD_ENDPOINT_ID":
-        print("Error: RUNPOD_ENDPOINT_ID not set or is default. Please configure it.")
+        logger.error("RUNPOD_ENDPOINT_ID not set or is default. Please configure it.")
         return None
 
     job_id = job_id if job_id else str(uuid.uuid4())
@@ -42,29 +46,34 @@ def call_runpod_sync(job_id: str = None, prompt: str = None, huggingface_repo: s
     if huggingface_repo:
         payload["input"]["huggingface_repo"] = huggingface_repo
 
-    print(f"\n--- Calling /runsync for Job ID: {job_id} ---")
-    print(f"Sending payload: {json.dumps(payload, indent=2)}")
+    # Only the size of the prompt is logged; the payload is user data and can be large
+    logger.info(f"Calling /runsync for job {job_id}", extra={"request_id": job_id, "huggingface_repo": huggingface_repo,
+                                                            "prompt_chars": len(prompt or "")})
 
     try:
-        response = requests.post(url, headers=HEADERS, json=payload, timeout=600) # Increased timeout
-        response.raise_for_status() # Raise an exception for HTTP errors (4xx or 5xx)
+        with tracing.start_span("runpod POST /runsync", kind=tracing.SpanKind.CLIENT, attributes={"runpod.job_id": job_id}) as span, \
+                metrics.track_runpod_call("serverless_runsync"):
+            # traceparent lets RunPod-side logs be tied back to this trace
+            response = requests.post(url, headers=tracing.inject_headers(HEADERS), json=payload, timeout=600) # Increased timeout
+            span.set_attribute("http.response.status_code", response.status_code)
+            response.raise_for_status() # Raise an exception for HTTP errors (4xx or 5xx)
 
         result = response.json()
-        print(f"--- Received Sync Response for Job ID: {job_id} ---")
-        print(json.dumps(result, indent=2))
+        logger.info(f"Received /runsync response for job {job_id} with status {result.get('status')}",
+                    extra={"request_id": job_id, "delay_time": result.get("delayTime"), "execution_time": result.get("executionTime")})
         return result
 
     except requests.exceptions.HTTPError as e:
-        print(f"HTTP Error: {e.response.status_code} - {e.response.text}")
+        logger.error(f"HTTP Error: {e.response.status_code}", extra={"request_id": job_id, "response_text": e.response.text})
         return {"error": f"HTTP Error: {e.response.status_code} - {e.response.text}", "job_id": job_id}
     except requests.exceptions.ConnectionError as e:
-        print(f"Connection Error: {e}")
+        logger.error(f"Connection Error: {e}", extra={"request_id": job_id})
         return {"error": f"Connection Error: {e}", "job_id": job_id}
     except requests.exceptions.Timeout:
-        print(f"Timeout Error: Request timed out after 90 seconds.")
+        logger.error("Timeout Error: Request timed out after 600 seconds.", extra={"request_id": job_id})
         return {"error": "Request timed out", "job_id": job_id}
     except Exception as e:
-        print(f"An unexpected error occurred: {e}")
+        logger.error(f"An unexpected error occurred: {e}", exc_info=True, extra={"request_id": job_id})
         return {"error": f"Unexpected error: {e}", "job_id": job_id}
 
 def call_runpod_async(prompt: str, huggingface_repo: str = None, custom_job_id: str = None, timeout_seconds: int = 300, poll_interval: int = 5):
@@ -73,10 +82,10 @@ def call_runpod_async(prompt: str, huggingface_repo: str = None, custom_job_id:
     This is ideal for longer-running inferences where you don't want to block your client.
     """
     if not RUNPOD_API_KEY or RUNPOD_API_KEY == "YOUR_RUNPOD_API_KEY":
-        print("Error: RUNPOD_API_KEY not set or is default. Please configure it.")
+        logger.error("RUNPOD_API_KEY not set or is default. Please configure it.")
         return None
     if not RUNPOD_ENDPOINT_ID or RUNPOD_ENDPOINT_ID == "YOUR_RUNPOD_ENDPOINT_ID":
-        print("Error: RUNPOD_ENDPOINT_ID not set or is default. Please configure it.")
+        logger.error("RUNPOD_ENDPOINT_ID not set or is default. Please configure it.")
         return None
 
     job_id = custom_job_id if custom_job_id else str(uuid.uuid4())
@@ -92,13 +101,16 @@ def call_runpod_async(prompt: str, huggingface_repo: str = None, custom_job_id:
     if huggingface_repo:
         payload["input"]["huggingface_repo"] = huggingface_repo
 
-    print(f"\n--- Submitting Async Job ID: {job_id} ---")
-    print(f"Sending payload: {json.dumps(payload, indent=2)}")
+    logger.info(f"Submitting async job {job_id}", extra={"request_id": job_id, "huggingface_repo": huggingface_repo,
+                                                         "prompt_chars": len(prompt or "")})
 
     try:
         # Step 1: Submit the job
-        response = requests.post(run_url, headers=HEADERS, json=payload)
-        response.raise_for_status()
+        with tracing.start_span("runpod POST /run", kind=tracing.SpanKind.CLIENT, attributes={"runpod.job_id": job_id}) as span, \
+                metrics.track_runpod_call("serverless_run"):
+            response = requests.post(run_url, headers=tracing.inject_headers(HEADERS), json=payload)
+            span.set_attribute("http.response.status_code", response.status_code)
+            response.raise_for_status()
         
         initial_response = response.json()
         runpod_job_id = initial_response.get('id')
@@ -107,7 +119,7 @@ def call_runpod_async(prompt: str, huggingface_repo: str = None, custom_job_id:
         if not runpod_job_id:
             raise ValueError(f"RunPod did not return a job ID: {initial_response}")
 
-        print(f"RunPod Job submitted. RunPod Job ID: {runpod_job_id}. Initial status: {status}")
+        logger.info(f"RunPod job submitted. RunPod job ID: {runpod_job_id}. Initial status: {status}", extra={"request_id": job_id})
 
         # Step 2: Poll for job status
         start_time = time.time()
@@ -118,9 +130,14 @@ def call_runpod_async(prompt: str, huggingface_repo: str = None, custom_job_id:
             if elapsed_time > timeout_seconds:
                 raise TimeoutError(f"Job {runpod_job_id} timed out after {timeout_seconds} seconds.")
 
-            print(f"[{time.strftime('%H:%M:%S', time.localtime())}] Polling status for RunPod Job ID: {runpod_job_id} (Elapsed: {elapsed_time:.0f}s)...")
-            status_response = requests.get(status_url, headers=HEADERS)
-            status_response.raise_for_status()
+            # Logged for every poll, so sampled
+            logger.info(f"Polling status for RunPod job {runpod_job_id} (elapsed: {elapsed_time:.0f}s)...",
+                        extra={"request_id": job_id, "sample_every": 10})
+            with tracing.start_span("runpod GET /status", kind=tracing.SpanKind.CLIENT) as span, \
+                    metrics.track_runpod_call("serverless_status"):
+                status_response = requests.get(status_url, headers=tracing.inject_headers(HEADERS))
+                span.set_attribute("http.response.status_code", status_response.status_code)
+                status_response.raise_for_status()
             status_data = status_response.json()
             current_status = status_data.get('status')
 
@@ -128,15 +145,13 @@ def call_runpod_async(prompt: str, huggingface_repo: str = None, custom_job_id:
                 output_data = status_data.get('output')
                 if output_data:
                     output_data['job_id'] = job_id # Add our original job_id for consistency
-                    print(f"--- RunPod Async Job {runpod_job_id} COMPLETED ---")
-                    print(json.dumps(output_data, indent=2))
+                    logger.info(f"RunPod async job {runpod_job_id} COMPLETED", extra={"request_id": job_id})
                     return output_data
                 else:
                     raise ValueError(f"RunPod job completed but no output found: {status_data}")
             elif current_status in ["FAILED", "CANCELED", "EXPIRED"]:
                 error_message = status_data.get('error', 'No specific error message provided by RunPod.')
-                print(f"--- RunPod Async Job {runpod_job_id} {current_status} ---")
-                print(json.dumps(status_data, indent=2))
+                logger.error(f"RunPod async job {runpod_job_id} {current_status}", extra={"request_id": job_id, "status_data": status_data})
                 return {
                     "inference_output": None,
                     "job_id": job_id,
@@ -147,16 +162,16 @@ def call_runpod_async(prompt: str, huggingface_repo: str = None, custom_job_id:
             time.sleep(poll_interval) # Wait before polling again
 
     except requests.exceptions.HTTPError as e:
-        print(f"HTTP Error: {e.response.status_code} - {e.response.text}")
+        logger.error(f"HTTP Error: {e.response.status_code}", extra={"request_id": job_id, "response_text": e.response.text})
         return {"error": f"HTTP Error: {e.response.status_code} - {e.response.text}", "job_id": job_id}
     except requests.exceptions.ConnectionError as e:
-        print(f"Connection Error: {e}")
+        logger.error(f"Connection Error: {e}", extra={"request_id": job_id})
         return {"error": f"Connection Error: {e}", "job_id": job_id}
     except requests.exceptions.Timeout:
-        print(f"Timeout Error: Polling timed out after {timeout_seconds} seconds.")
+        logger.error(f"Timeout Error: Polling timed out after {timeout_seconds} seconds.", extra={"request_id": job_id})
         return {"error": f"Polling timed out after {timeout_seconds} seconds.", "job_id": job_id}
     except Exception as e:
-        print(f"An unexpected error occurred: {e}")
+        logger.error(f"An unexpected error occurred: {e}", exc_info=True, extra={"request_id": job_id})
         return {"error": f"Unexpected error: {e}", "job_id": job_id}
 
 
@@ -1,42 +1,52 @@
 import os
 import time
+from datetime import datetime, timedelta, timezone
 from sqlalchemy import create_engine, update
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
-from celery import Celery
 import json # New import for Redis communication
 from .inference_client import call_runpod_sync, call_runpod_async # Assuming these are the functions you want to use
 from shared.utils.celery_app import celery_app
+from celery.signals import worker_init, worker_process_shutdown
 
-from shared.utils import logger
+from shared.utils import logger, metrics, tracing
+from shared.utils.lazy import LazyResource
 logger = logger.setup_logger('celery-worker')
 
 # Load environment variables
 load_dotenv()
 
 #celery_app.autodiscover_tasks(['celery_worker.worker']) # Tells Celery to find tasks in this package
-print("[INFO] Celery broker URL:", celery_app.conf.broker_url)
 # Add the parent directory to the path to import from backend
 # sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from shared.db.base import Job # Assuming Job model is in shared.db.base
+from shared.db.base import IdempotencyKey, Job # Assuming Job model is in shared.db.base
+from shared.db.status_writer import JobStatusWriter
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 WORKER_MODE = "GPU-SERVERLESS" #os.getenv("WORKER_MODE", "GPU")
+INFERENCE_TERMINAL_STATUSES = ("COMPLETED_INFERENCE", "FAILED_INFERENCE")
+# Inference requests still pending after this long are failed by the housekeeping task
+INFERENCE_STALE_SECONDS = float(os.getenv("INFERENCE_STALE_SECONDS", "3600"))
 
 # --- End Celery App Setup ---
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Created by the first task rather than at import, so autoscaled workers come up faster
+engine = LazyResource(lambda: create_engine(DATABASE_URL))
+SessionLocal = LazyResource(lambda: sessionmaker(autocommit=False, autoflush=False, bind=engine.get()))
+status_writer = JobStatusWriter(SessionLocal)
 
-def update_job_status(db, job_id, status, error_message=None, result_data=None):
-    stmt = (
-        update(Job)
-        .where(Job.id == job_id)
-        .values(status=status, error_message=error_message, result_data=result_data) # Add result_data if your Job model supports it
-    )
-    db.execute(stmt)
-    db.commit()
-    print(f"Updated job {job_id} to status {status}")
+# --- Metrics and tracing ---
+# The main worker process serves /metrics on METRICS_PORT. With the prefork pool, set
+# PROMETHEUS_MULTIPROC_DIR so samples recorded in the child processes are aggregated there.
+# Tracing is set up before the pool forks; children inherit the provider.
+@worker_init.connect
+def start_metrics_server(**kwargs):
+    metrics.start_metrics_server()
+    tracing.setup_tracing("celery-worker")
+
+@worker_process_shutdown.connect
+def mark_metrics_process_dead(pid=None, **kwargs):
+    metrics.mark_process_dead(pid or os.getpid())
 
 # --- Celery Task for Inference ---
 # This method will be called by the backend service
@@ -44,8 +54,19 @@ def update_job_status(db, job_id, status, error_message=None, result_data=None):
 def run_runpod_inference_task(self, job_id: str, prompt: str, huggingface_repo:str):
     """
     Celery task to delegate an inference job to RunPod.
+    Continues the trace started by the API request that sent it.
+    """
+    carrier = tracing.headers_from_task_request(self.request)
+    with tracing.task_span("run_runpod_inference_task", carrier, attributes={"inference.request_id": job_id}):
+        run_inference_job(job_id, prompt, huggingface_repo)
+
+def run_inference_job(job_id, prompt, huggingface_repo):
+    """
+    Calls RunPod for one inference request and records the result on its Job.
     """
     db = SessionLocal()
+    start_time = time.time()
+    status = None
     try:
         logger.info(f"Worker received inference task for request_id: {job_id}")
         
@@ -63,7 +84,8 @@ def run_runpod_inference_task(self, job_id: str, prompt: str, huggingface_repo:s
         # In a real app, backend creates the Job/InferenceRequest, and worker updates it.
         
         # Find the job by request_id (assuming request_id is stored in job.id or a new column)
-        job_to_process = db.query(Job).filter(Job.id == job_id).first()
+        with tracing.start_span("db.load_inference_job"):
+            job_to_process = db.query(Job).filter(Job.id == job_id).first()
         if not job_to_process:
             logger.error(f"Inference Job with ID {job_id} not found in DB.")
             # Create a dummy job or handle error
@@ -74,11 +96,22 @@ def run_runpod_inference_task(self, job_id: str, prompt: str, huggingface_repo:s
             job_to_process = new_job
             logger.info(f"Created new dummy Job for inference: {job_id}")
 
+        # With late acks a task can be redelivered after it already ran; do not call RunPod twice
+        if job_to_process.status in INFERENCE_TERMINAL_STATUSES:
+            logger.info(f"Inference job {job_id} is already {job_to_process.status}, skipping redelivered task.")
+            return
+        if job_to_process.created_at is not None:
+            created_at = job_to_process.created_at.replace(tzinfo=job_to_process.created_at.tzinfo or timezone.utc)
+            metrics.JOB_QUEUE_WAIT_SECONDS.labels("inference").observe((datetime.now(timezone.utc) - created_at).total_seconds())
 
-        update_job_status(db, job_to_process.id, "PROCESSING_INFERENCE")
+        # Buffered: the terminal status below flushes it, so a fast inference costs one write
+        status_writer.record(job_to_process.id, "PROCESSING_INFERENCE")
 
         # --- CALL YOUR RUNPOD INFERENCE LOGIC HERE ---
-        logger.info(f"Calling RunPod inference for {job_id} with text: {prompt} and huggingface repo {huggingface_repo}...")
+        logger.info(
+            f"Calling RunPod inference for {job_id} with huggingface repo {huggingface_repo}...",
+            extra={"request_id": job_id, "prompt_chars": len(prompt or "")},
+        )
         
         # The `runpod_inference` module should contain a function like `run_inference`
         # that handles communication with RunPod and returns the inference result.
@@ -86,13 +119,71 @@ def run_runpod_inference_task(self, job_id: str, prompt: str, huggingface_repo:s
 
         inference_output_text = inference_result.get('output', {}).get('inference_output')
 
-        logger.info(f"RunPod inference for {job_id} completed. Result: {inference_result}")
-        logger.info(f"RunPod inference for {job_id} inference_output_text extracted. Result: {inference_output_text}")
-        update_job_status(db, job_to_process.id, "COMPLETED_INFERENCE",result_data=inference_output_text)
+        # The logger truncates the output and redacts secrets
+        logger.info(f"RunPod inference for {job_id} completed.", extra={"request_id": job_id, "result": inference_result})
+        status = "COMPLETED_INFERENCE"
+        # Terminal statuses are flushed synchronously, so this span is the DB write
+        with tracing.start_span("db.record_inference_result"):
+            status_writer.record(job_to_process.id, status, result_data=inference_output_text)
 
     except Exception as e:
         logger.error(f"Error during RunPod inference for {job_id}: {e}", exc_info=True)
-        update_job_status(db, job_id, "FAILED_INFERENCE", error_message=str(e))
+        tracing.record_error(e)
+        status = "FAILED_INFERENCE"
+        status_writer.record(job_id, status, error_message=str(e))
+    finally:
+        db.close()
+        if status is not None:
+            metrics.JOBS_FINISHED.labels("inference", status).inc()
+            metrics.JOB_RUN_SECONDS.labels("inference", status).observe(time.time() - start_time)
+
+
+# --- Housekeeping tasks (routed to the housekeeping queue) ---
+@celery_app.task(name='expire_stale_inference_jobs')
+def expire_stale_inference_jobs():
+    """
+    Fails inference requests that never reached a terminal status, e.g. because their task was lost.
+    """
+    db = SessionLocal()
+    try:
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=INFERENCE_STALE_SECONDS)
+        error_message = f"Inference request expired after {INFERENCE_STALE_SECONDS:.0f}s."
+        expired = db.execute(
+            update(Job)
+            .where(
+                Job.task_type == "inference",
+                Job.status.in_(("ACCEPTED", "PROCESSING_INFERENCE")),
+                Job.updated_at < cutoff,
+            )
+            .values(status="FAILED_INFERENCE", error_message=error_message)
+            .returning(Job.id)
+        ).scalars().all()
+        db.commit()
+        for job_id in expired:
+            status_writer.record_history(job_id, "FAILED_INFERENCE", error_message)
+        status_writer.flush()
+        if expired:
+            logger.info(f"Expired {len(expired)} stale inference request(s).")
+        return len(expired)
+    finally:
+        db.close()
+
+
+@celery_app.task(name='purge_expired_idempotency_keys')
+def purge_expired_idempotency_keys():
+    """
+    Deletes Idempotency-Key records past their expires_at. The API only ignores them, so without
+    this the table grows with every keyed submission.
+    """
+    db = SessionLocal()
+    try:
+        deleted = db.query(IdempotencyKey).filter(
+            IdempotencyKey.expires_at < datetime.now(timezone.utc)
+        ).delete(synchronize_session=False)
+        db.commit()
+        if deleted:
+            logger.info(f"Purged {deleted} expired idempotency key(s).")
+        return deleted
     finally:
         db.close()
 
@@ -19,8 +19,8 @@ const FinetuneForm = ({ onSubmit, isLoading }) => {
     return (
         <form onSubmit={handleSubmit}>
             <div className="form-group">
-                <label htmlFor="file">Dataset (JSONL with 'input' and 'output' columns)</label>
-                <input id="file" type="file" accept=".jsonl" onChange={(e) => setFile(e.target.files[0])} required />
+                <label htmlFor="file">Dataset (CSV, JSONL or Parquet with 'instruction', 'input' and 'output' columns, or chat 'messages')</label>
+                <input id="file" type="file" accept=".csv,.jsonl,.parquet" onChange={(e) => setFile(e.target.files[0])} required />
             </div>
             <div className="form-group">
                 <label htmlFor="baseModel">Base Model</label>
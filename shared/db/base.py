@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, LargeBinary, JSON
+from sqlalchemy import Column, Integer, String, DateTime, Text, LargeBinary, JSON, Float, Boolean, Index
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime, timezone
 
@@ -12,13 +12,88 @@ class Job(Base):
     base_model = Column(String)
     new_model_name = Column(String, unique=True, nullable=True)
     dataset_type = Column(String, nullable=True)
+    prepared_dataset_filename = Column(String, nullable=True) # Output of the worker's preprocessing stage; what training reads
+    dataset_stats = Column(JSON, nullable=True) # Rows in/out and duplicates removed by preprocessing
     status = Column(String, default="QUEUED")
     task_type = Column(String, default="finetuning")
     input_data = Column(JSON, nullable=True) # New column to store input for inference jobs
     result_data = Column(Text, nullable=True) # New column for storing inference results (JSONB in Postgres)    
     error_message = Column(Text, nullable=True)
-    created_at = Column(DateTime, default=datetime.now(timezone.utc))
-    updated_at = Column(DateTime, default=datetime.now(timezone.utc), onupdate=datetime.now(timezone.utc))
+    runpod_job_id = Column(String, nullable=True, index=True) # RunPod serverless job id while the job runs remotely
+    attempts = Column(Integer, default=0, nullable=False) # Number of times a worker has claimed this job
+    lease_owner = Column(String, nullable=True) # Worker currently driving the job
+    lease_expires_at = Column(DateTime, nullable=True, index=True) # Extended by worker heartbeats while RUNNING
+    owner = Column(String, index=True, nullable=True) # Tenant the job is billed to, used for fair-share scheduling
+    priority = Column(Integer, default=0) # Higher runs first
+    started_at = Column(DateTime, nullable=True) # Last time a worker claimed the job
+    pod_id = Column(String, nullable=True, index=True) # Training pod the job was placed on
+    estimated_vram_gb = Column(Float, nullable=True) # GPU memory reserved on the pod while RUNNING
+    merged_model_repo = Column(String, nullable=True) # Pre-merged safetensors export of this job's finetuned adapter
+    training_progress = Column(JSON, nullable=True) # Latest trainer metrics: step, total_steps, loss, tokens/s, ETA
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
 
     def __repr__(self):
         return f"<Job(id='{self.id}', status='{self.status}', type='{self.task_type}')>"
+
+
+class Pod(Base):
+    __tablename__ = "pods"
+    id = Column(String, primary_key=True, index=True)
+    url = Column(String, nullable=False) # Base URL of the executor server on the pod
+    gpu_vram_gb = Column(Float, nullable=False)
+    max_jobs = Column(Integer, default=1) # Concurrent jobs the executor server accepts
+    enabled = Column(Boolean, default=True)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+    def __repr__(self):
+        return f"<Pod(id='{self.id}', vram={self.gpu_vram_gb}GB, max_jobs={self.max_jobs})>"
+
+
+class JobStatusHistory(Base):
+    # Append-only log of job status transitions, written in batches by shared.db.status_writer
+    __tablename__ = "job_status_history"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    job_id = Column(String, index=True, nullable=False)
+    status = Column(String, nullable=False)
+    error_message = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), index=True)
+
+    def __repr__(self):
+        return f"<JobStatusHistory(job_id='{self.job_id}', status='{self.status}', at={self.created_at})>"
+
+
+class IdempotencyKey(Base):
+    # Client-supplied Idempotency-Key of a job submission and the response it got, replayed to retries of the same request
+    __tablename__ = "idempotency_keys"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    scope = Column(String, nullable=False) # Endpoint the key was used on; the same key may be reused on another endpoint
+    key = Column(String, nullable=False)
+    request_fingerprint = Column(String, nullable=False) # sha256 of the request parameters, to reject a key reused for a different request
+    job_id = Column(String, nullable=False)
+    response_status_code = Column(Integer, nullable=False)
+    response_body = Column(JSON, nullable=False)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+    # Concurrent retries race on this index: exactly one insert wins, the others replay its response
+    __table_args__ = (Index("ix_idempotency_keys_scope_key", "scope", "key", unique=True),)
+
+    def __repr__(self):
+        return f"<IdempotencyKey(scope='{self.scope}', key='{self.key}', job_id='{self.job_id}')>"
+
+
+class JobMetric(Base):
+    # Downsampled training curve of a job, one row per stored trainer log event
+    __tablename__ = "job_metrics"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    job_id = Column(String, index=True, nullable=False)
+    step = Column(Integer, nullable=False)
+    epoch = Column(Float, nullable=True)
+    loss = Column(Float, nullable=True)
+    learning_rate = Column(Float, nullable=True)
+    tokens_per_second = Column(Float, nullable=True)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+    def __repr__(self):
+        return f"<JobMetric(job_id='{self.job_id}', step={self.step}, loss={self.loss})>"
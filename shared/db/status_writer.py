@@ -0,0 +1,212 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from sqlalchemy import and_, bindparam, insert, update
+
+from shared.db.base import Job, JobMetric, JobStatusHistory
+from shared.utils import logger
+
+logger = logger.setup_logger('status_writer')
+
+# Non-terminal transitions are buffered and written together at most once per interval
+STATUS_FLUSH_INTERVAL_SECONDS = float(os.getenv("STATUS_FLUSH_INTERVAL_SECONDS", "2"))
+# Flush early once this many transitions are waiting, to bound memory and the size of one flush
+STATUS_MAX_PENDING = int(os.getenv("STATUS_MAX_PENDING", "500"))
+# Written synchronously so a finished job is durable before the worker moves on
+TERMINAL_STATUSES = ("COMPLETED", "FAILED", "COMPLETED_INFERENCE", "FAILED_INFERENCE")
+# A failed synchronous flush of a terminal status is retried this many times before it is left to the
+# background flusher; it is never reported to the caller, who would otherwise mistake it for a failed job
+TERMINAL_FLUSH_ATTEMPTS = int(os.getenv("STATUS_TERMINAL_FLUSH_ATTEMPTS", "3"))
+TERMINAL_FLUSH_RETRY_SECONDS = float(os.getenv("STATUS_TERMINAL_FLUSH_RETRY_SECONDS", "1"))
+# Key in a buffered update holding the lease owner it is fenced on; not a Job column
+LEASE_FENCE = "__if_lease_owner"
+
+
+class JobStatusWriter:
+    """
+    Shared writer for job status transitions and training progress.
+    Buffered updates keep only the latest state per job and are written with one executemany UPDATE per flush,
+    together with multi-row INSERTs of every transition into job_status_history and of training metrics
+    into job_metrics. Terminal states flush immediately. A buffered update never overwrites a job that
+    already reached a terminal state, and a fenced one only applies while the job is leased to its writer.
+    """
+    def __init__(self, session_factory, flush_interval=STATUS_FLUSH_INTERVAL_SECONDS, max_pending=STATUS_MAX_PENDING):
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval
+        self.max_pending = max(1, max_pending)
+        self.pending_updates = OrderedDict() # job id -> column values of the latest transition
+        self.pending_history = []
+        self.pending_metrics = []
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock() # One flush at a time keeps transitions in order
+        self.stop_event = threading.Event()
+        self.flusher = None
+
+    def record(self, job_id, status, error_message=None, if_lease_owner=None, **values):
+        """
+        Records a transition of `job_id` to `status`. Extra keyword arguments are written to the
+        matching Job columns along with it.
+        Terminal statuses are flushed before returning; others are written by the next flush.
+        :param if_lease_owner: Only apply the transition while the job is still leased to this worker, so a
+                               worker whose lease was swept cannot overwrite the status of a newer attempt.
+        """
+        values.update(status=status, error_message=error_message)
+        if if_lease_owner is not None:
+            values[LEASE_FENCE] = if_lease_owner
+        with self.lock:
+            # Later transitions replace earlier ones; both still end up in the history
+            previous = self.pending_updates.pop(job_id, {})
+            self.pending_updates[job_id] = {**previous, **values}
+            self.append_history(job_id, status, error_message)
+            pending = len(self.pending_updates) + len(self.pending_history)
+
+        if status in TERMINAL_STATUSES:
+            self.flush_terminal()
+        elif pending >= self.max_pending:
+            self.flush()
+        else:
+            self.ensure_flusher()
+
+    def flush_terminal(self):
+        """
+        Flushes a terminal transition, retrying with backoff. A failed flush keeps its rows buffered,
+        so if every attempt fails the background flusher goes on retrying them.
+        """
+        for attempt in range(TERMINAL_FLUSH_ATTEMPTS):
+            try:
+                self.flush()
+                return
+            except Exception as e:
+                logger.warning(f"Flushing a terminal job status failed (attempt {attempt + 1}): {e}")
+                if attempt + 1 < TERMINAL_FLUSH_ATTEMPTS:
+                    time.sleep(TERMINAL_FLUSH_RETRY_SECONDS * 2 ** attempt)
+        logger.error("Terminal job status still unwritten, leaving it to the background flusher.")
+        self.ensure_flusher()
+
+    def record_history(self, job_id, status, error_message=None):
+        """
+        Records a transition that the caller already wrote to the jobs table itself, e.g. a conditional claim.
+        """
+        with self.lock:
+            self.append_history(job_id, status, error_message)
+        self.ensure_flusher()
+
+    def record_progress(self, job_id, metric_rows=(), **values):
+        """
+        Buffers Job column values that are not a status change (e.g. training_progress) and rows for job_metrics.
+        """
+        with self.lock:
+            previous = self.pending_updates.pop(job_id, {})
+            self.pending_updates[job_id] = {**previous, **values}
+            self.pending_metrics.extend({"job_id": job_id, **row} for row in metric_rows)
+        self.ensure_flusher()
+
+    def append_history(self, job_id, status, error_message):
+        # Must be called with self.lock held
+        self.pending_history.append({
+            "job_id": job_id,
+            "status": status,
+            "error_message": error_message,
+            "created_at": datetime.now(timezone.utc),
+        })
+
+    def flush(self):
+        """
+        Writes all buffered transitions in one transaction.
+        :return: Number of job rows updated.
+        """
+        with self.flush_lock:
+            with self.lock:
+                updates, history, metrics = self.pending_updates, self.pending_history, self.pending_metrics
+                self.pending_updates, self.pending_history, self.pending_metrics = OrderedDict(), [], []
+            if not updates and not history and not metrics:
+                return 0
+
+            # executemany needs the same parameters on every row, so group rows by the columns they set
+            groups = OrderedDict()
+            for job_id, values in updates.items():
+                terminal = values.get("status") in TERMINAL_STATUSES
+                columns = tuple(sorted(column for column in values if column != LEASE_FENCE))
+                row = {"b_job_id": job_id, **{f"b_{column}": values[column] for column in columns}}
+                if LEASE_FENCE in values:
+                    row["b_fence"] = values[LEASE_FENCE]
+                groups.setdefault((terminal, LEASE_FENCE in values, columns), []).append(row)
+
+            db = None
+            try:
+                db = self.session_factory()
+                updated = 0
+                # Core statement on the table: the ORM would treat a parameter list as a per-row bulk update
+                jobs = Job.__table__
+                fenced_out = set()
+                for (terminal, fenced, columns), rows in groups.items():
+                    stmt = update(jobs).where(jobs.c.id == bindparam("b_job_id"))
+                    if not terminal:
+                        # Plain comparisons: an IN list would be an expanding parameter, which executemany rejects
+                        stmt = stmt.where(and_(*(jobs.c.status != status for status in TERMINAL_STATUSES)))
+                    stmt = stmt.values({column: bindparam(f"b_{column}", type_=jobs.c[column].type) for column in columns})
+                    if not fenced:
+                        updated += db.execute(stmt, rows).rowcount
+                        continue
+                    # One row at a time, to tell which jobs were no longer leased to their writer
+                    stmt = stmt.where(jobs.c.lease_owner == bindparam("b_fence"))
+                    for row in rows:
+                        rowcount = db.execute(stmt, row).rowcount
+                        updated += rowcount
+                        if rowcount == 0:
+                            fenced_out.add((row["b_job_id"], row["b_status"]))
+                if fenced_out:
+                    logger.warning(f"Skipped status updates of jobs no longer leased to their writer: {sorted(fenced_out)}")
+                    history = [entry for entry in history if (entry["job_id"], entry["status"]) not in fenced_out]
+                if history:
+                    db.execute(insert(JobStatusHistory), history)
+                if metrics:
+                    db.execute(insert(JobMetric), metrics)
+                db.commit()
+            except Exception:
+                if db is not None:
+                    db.rollback()
+                # Put the transitions back so the next flush retries them; newer ones win
+                with self.lock:
+                    for job_id, values in updates.items():
+                        if job_id in self.pending_updates:
+                            self.pending_updates[job_id] = {**values, **self.pending_updates[job_id]}
+                        else:
+                            self.pending_updates[job_id] = values
+                    self.pending_history = history + self.pending_history
+                    self.pending_metrics = metrics + self.pending_metrics
+                raise
+            finally:
+                if db is not None:
+                    db.close()
+
+        for job_id, values in updates.items():
+            if "status" in values and (job_id, values["status"]) not in fenced_out:
+                logger.info(f"Updated job {job_id} to status {values['status']}", extra={"job_id": job_id, "status": values["status"]})
+        return updated
+
+    def ensure_flusher(self):
+        if self.flusher is None:
+            with self.lock:
+                if self.flusher is None:
+                    self.flusher = threading.Thread(target=self.run_flusher, name="status-writer", daemon=True)
+                    self.flusher.start()
+
+    def run_flusher(self):
+        while not self.stop_event.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing job status updates: {e}", exc_info=True)
+
+    def close(self):
+        """
+        Stops the background flusher and writes whatever is still buffered.
+        """
+        self.stop_event.set()
+        start_time = time.time()
+        self.flush()
+        logger.info(f"Status writer closed, final flush took {time.time() - start_time:.3f}s")
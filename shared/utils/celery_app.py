@@ -6,32 +6,62 @@ from dotenv import load_dotenv
 load_dotenv() # Load environment variables
 
 REDIS_BROKER_URL = os.getenv("REDIS_BROKER_URL", "redis://redis:6379/0")
+# Tasks write their results to Postgres, so the Celery result backend is off unless explicitly configured
+CELERY_RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND") or None
+CELERY_RESULT_EXPIRES_SECONDS = int(os.getenv("CELERY_RESULT_EXPIRES_SECONDS", "3600"))
+# msgpack messages are smaller and faster to (de)serialize than JSON; JSON is still accepted while a rollout drains
+CELERY_SERIALIZER = os.getenv("CELERY_SERIALIZER", "msgpack")
 
-print('REDIS_BROKER_URL in celery :',REDIS_BROKER_URL)
+# --- Queues ---
+# Inference and housekeeping are consumed by separate workers so a backlog of slow RunPod calls
+# cannot delay maintenance tasks, and vice versa
+INFERENCE_QUEUE = os.getenv("CELERY_INFERENCE_QUEUE", "inference")
+HOUSEKEEPING_QUEUE = os.getenv("CELERY_HOUSEKEEPING_QUEUE", "housekeeping")
+
+# --- Long-running I/O tasks ---
+# Inference tasks block on /runsync for minutes. With late acks a task is only removed from the queue
+# once it finished, so a crashed worker's task is redelivered; the Redis visibility timeout must be
+# longer than the slowest task or Redis redelivers it while it is still running.
+CELERY_PREFETCH_MULTIPLIER = int(os.getenv("CELERY_PREFETCH_MULTIPLIER", "1"))
+CELERY_VISIBILITY_TIMEOUT_SECONDS = int(os.getenv("CELERY_VISIBILITY_TIMEOUT_SECONDS", "3600"))
+HOUSEKEEPING_INTERVAL_SECONDS = float(os.getenv("CELERY_HOUSEKEEPING_INTERVAL_SECONDS", "600"))
 
 # Initialize the Celery app instance
-celery_app = Celery('finetuneit_celery_app', broker=REDIS_BROKER_URL, backend=REDIS_BROKER_URL)
+celery_app = Celery('finetuneit_celery_app', broker=REDIS_BROKER_URL, backend=CELERY_RESULT_BACKEND)
 
-# Configure Celery for JSON serialization
 celery_app.conf.update(
-    task_serializer='json',
-    accept_content=['json'],
-    result_serializer='json',
+    task_serializer=CELERY_SERIALIZER,
+    accept_content=[CELERY_SERIALIZER, 'json'],
+    result_serializer=CELERY_SERIALIZER,
+    # Fire-and-forget: nobody reads AsyncResult, so do not store results (or let them pile up in Redis)
+    task_ignore_result=True,
+    result_expires=CELERY_RESULT_EXPIRES_SECONDS,
     timezone='UTC',
     enable_utc=True,
     imports=('celery_worker.worker',),
-    # Optional: If you have many tasks, you might want to specify a task route
-    # task_routes = {
-    #     'celery_worker.worker.run_runpod_inference_task': {'queue': 'inference_queue'},
-    #     # Add other task routes here
-    # }
+    task_acks_late=True,
+    task_reject_on_worker_lost=True,
+    # Each worker process reserves one message at a time, so long tasks do not hold others hostage
+    worker_prefetch_multiplier=CELERY_PREFETCH_MULTIPLIER,
+    broker_transport_options={'visibility_timeout': CELERY_VISIBILITY_TIMEOUT_SECONDS},
+    task_default_queue=INFERENCE_QUEUE,
+    task_routes={
+        'run_runpod_inference_task': {'queue': INFERENCE_QUEUE},
+        'expire_stale_inference_jobs': {'queue': HOUSEKEEPING_QUEUE},
+        'purge_expired_idempotency_keys': {'queue': HOUSEKEEPING_QUEUE},
+    },
+    # Only runs when a beat scheduler is started (the housekeeping worker runs with --beat)
+    beat_schedule={
+        'expire-stale-inference-jobs': {
+            'task': 'expire_stale_inference_jobs',
+            'schedule': HOUSEKEEPING_INTERVAL_SECONDS,
+        },
+        'purge-expired-idempotency-keys': {
+            'task': 'purge_expired_idempotency_keys',
+            'schedule': HOUSEKEEPING_INTERVAL_SECONDS,
+        },
+    },
 )
 
 # You can also add autodiscover_tasks if you have tasks in multiple files
 # celery_app.autodiscover_tasks(['celery_worker']) # Tells Celery to find tasks in this package
-
-'''
-celery_app.conf.task_routes = {
-    "run_runpod_inference_task": {"queue": "default"},
-}
-'''
\ No newline at end of file
@@ -0,0 +1,32 @@
+import threading
+
+
+class LazyResource:
+    """
+    Builds an expensive object (DB engine, session factory, boto3 client, ...) on first use instead of
+    at import time. Attribute access and calls are forwarded, so call sites use it like the object itself:
+
+        engine = LazyResource(lambda: create_engine(DATABASE_URL))
+        SessionLocal = LazyResource(lambda: sessionmaker(bind=engine.get()))
+        db = SessionLocal()
+    """
+    def __init__(self, factory):
+        self._factory = factory
+        self._instance = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self._instance is None:
+            with self._lock:
+                if self._instance is None:
+                    self._instance = self._factory()
+        return self._instance
+
+    def is_initialized(self):
+        return self._instance is not None
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+    def __call__(self, *args, **kwargs):
+        return self.get()(*args, **kwargs)
@@ -1,23 +1,240 @@
+import atexit
+import json
 import logging
+import logging.handlers
+import os
+import queue
+import re
 import sys
+import threading
+import traceback
+from datetime import datetime, timezone
+
+try:
+    from opentelemetry import trace as otel_trace # Optional: adds trace/span ids to records logged inside a span
+except ImportError:
+    otel_trace = None
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "json": one object per line for log shippers; "text": human readable, for local runs
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+# Longer strings (the message, any extra field) are cut, so a payload or script output cannot bloat a record
+LOG_MAX_FIELD_CHARS = int(os.getenv("LOG_MAX_FIELD_CHARS", "2000"))
+# Records waiting for the writer thread. When it is full new records are dropped instead of blocking the caller
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+REDACTED = "[REDACTED]"
+# Values of extra fields and nested dict keys whose name matches are never written. "token" only matches as
+# a name of its own (hf_token, HUGGING_FACE_TOKEN), so counts such as max_new_tokens or prompt_tokens are kept
+SENSITIVE_KEY_PATTERN = re.compile(
+    r"(^|[_-])(access_|auth_|api_|hf_)?token$|secret|password|passwd|api_?key|authorization|credential", re.IGNORECASE
+)
+# Secrets inside free text; group 1, when present, is kept
+SENSITIVE_TEXT_PATTERNS = [
+    re.compile(r"\bhf_[A-Za-z0-9]{8,}"), # Hugging Face tokens
+    re.compile(r"(?i)(bearer\s+)[A-Za-z0-9._~+/=-]+"),
+    # The key prefix is bounded: an unbounded [a-z_]* backtracks quadratically over long runs of letters
+    re.compile(r"""(?i)(['"]?\b[a-z_]{0,32}(?:token|secret|password|api_?key)['"]?\s*[:=]\s*['"]?)[^'"\s,}]+"""),
+]
+# Attributes every LogRecord has; anything else on a record came from `extra=`
+STANDARD_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+# Extra fields that only steer the logging pipeline and are not written out
+CONTROL_FIELDS = {"sample_every"}
+
+
+def truncate(text, limit=LOG_MAX_FIELD_CHARS, keep="head"):
+    if len(text) <= limit:
+        return text
+    cut = len(text) - limit
+    if keep == "tail":
+        return f"[truncated {cut} chars]..." + text[-limit:]
+    return text[:limit] + f"...[truncated {cut} chars]"
+
+
+def redact_text(text):
+    for pattern in SENSITIVE_TEXT_PATTERNS:
+        text = pattern.sub(lambda match: (match.group(1) if match.lastindex else "") + REDACTED, text)
+    return text
+
+
+def sanitize_fields(fields, depth=0):
+    """
+    Sanitizes each value of a dict, redacting whole values whose key names a secret.
+    """
+    return {
+        str(key): REDACTED if SENSITIVE_KEY_PATTERN.search(str(key)) and item is not None else sanitize(item, depth)
+        for key, item in fields.items()
+    }
+
+
+def sanitize(value, depth=0):
+    """
+    Returns a JSON-friendly copy of an extra field with secrets redacted and long strings truncated.
+    """
+    if isinstance(value, str):
+        # Truncate first so redaction never scans a multi-MB string
+        return redact_text(truncate(value))
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if depth >= 4:
+        return truncate(str(value))
+    if isinstance(value, dict):
+        return sanitize_fields(value, depth + 1)
+    if isinstance(value, (list, tuple, set)):
+        items = list(value)
+        return [sanitize(item, depth + 1) for item in items[:50]] + ([f"...[{len(items) - 50} more]"] if len(items) > 50 else [])
+    return redact_text(truncate(str(value)))
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Passes only every Nth record from call sites that log with extra={"sample_every": N}, for high-frequency
+    events such as poll results. Counted per call site; other records always pass.
+    """
+    def __init__(self):
+        super().__init__()
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        every = getattr(record, "sample_every", None)
+        if not every or every <= 1:
+            return True
+        key = (record.pathname, record.lineno)
+        with self.lock:
+            count = self.counts.get(key, 0)
+            self.counts[key] = count + 1
+        return count % every == 0
+
+
+class StructuredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to the writer thread. The calling thread only renders, truncates and redacts the record,
+    so it holds bounded, secret-free data; formatting and the blocking write happen in the QueueListener.
+    """
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self.dropped_lock = threading.Lock()
+
+    def prepare(self, record):
+        fields = sanitize_fields({
+            key: value for key, value in vars(record).items()
+            if key not in STANDARD_RECORD_ATTRIBUTES and key not in CONTROL_FIELDS
+        })
+        if record.exc_info:
+            # The end of a traceback is the useful part
+            fields["exception"] = redact_text(truncate("".join(traceback.format_exception(*record.exc_info)), keep="tail"))
+        if otel_trace is not None:
+            span_context = otel_trace.get_current_span().get_span_context()
+            if span_context.is_valid:
+                fields["trace_id"] = format(span_context.trace_id, "032x")
+                fields["span_id"] = format(span_context.span_id, "016x")
+        with self.dropped_lock:
+            if self.dropped:
+                fields["dropped_records"], self.dropped = self.dropped, 0
+
+        prepared = logging.makeLogRecord({
+            "name": record.name,
+            "levelname": record.levelname,
+            "levelno": record.levelno,
+            "created": record.created,
+            "msg": redact_text(truncate(record.getMessage())),
+            "structured_fields": fields,
+        })
+        return prepared
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self.dropped_lock:
+                self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.msg,
+        }
+        entry.update(getattr(record, "structured_fields", {}))
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__(fmt='%(asctime)s - %(name)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+
+    def format(self, record):
+        text = super().format(record)
+        fields = dict(getattr(record, "structured_fields", {}))
+        exception = fields.pop("exception", None)
+        if fields:
+            text += " | " + " ".join(f"{key}={value}" for key, value in fields.items())
+        if exception:
+            text += "\n" + exception
+        return text
+
+
+# --- Process-wide writer ---
+# All loggers share one queue and one writer thread, started by the first setup_logger call
+log_queue = queue.Queue(LOG_QUEUE_SIZE)
+queue_handler = StructuredQueueHandler(log_queue)
+queue_handler.addFilter(SamplingFilter())
+listener = None
+listener_lock = threading.Lock()
+
+
+def start_listener():
+    global listener
+    with listener_lock:
+        if listener is None:
+            stream_handler = logging.StreamHandler(sys.stdout)
+            stream_handler.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else TextFormatter())
+            listener = logging.handlers.QueueListener(log_queue, stream_handler)
+            listener.start()
+
+
+def stop_listener():
+    """
+    Writes out every queued record and stops the writer thread. Registered to run at exit.
+    """
+    global listener
+    with listener_lock:
+        if listener is not None:
+            listener.stop()
+            listener = None
+
+
+def reset_after_fork():
+    # The writer thread does not survive a fork (Celery prefork, uvicorn --workers); the child starts its own
+    global log_queue, listener, listener_lock
+    was_running = listener is not None
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    queue_handler.queue = log_queue
+    listener = None
+    listener_lock = threading.Lock()
+    if was_running:
+        start_listener()
+
+
+atexit.register(stop_listener)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=reset_after_fork)
+
 
 def setup_logger(service_name: str) -> logging.Logger:
     logger = logging.getLogger(service_name)
-    logger.setLevel(logging.INFO)
+    logger.setLevel(LOG_LEVEL)
 
     # Avoid duplicate handlers
-    if not logger.handlers:
-        # Console handler
-        handler = logging.StreamHandler(sys.stdout)
-        handler.setLevel(logging.INFO)
-
-        # Formatter
-        formatter = logging.Formatter(
-            fmt='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-            datefmt='%Y-%m-%d %H:%M:%S'
-        )
-        handler.setFormatter(formatter)
-
-        logger.addHandler(handler)
+    if queue_handler not in logger.handlers:
+        logger.addHandler(queue_handler)
+        # The queue handler writes every record; propagating would print it again through root handlers (e.g. Celery's)
+        logger.propagate = False
+    start_listener()
 
     return logger
@@ -0,0 +1,177 @@
+# shared/utils/metrics.py
+# Prometheus metrics shared by the backend, the polling worker, the Celery workers and the inference service.
+#
+# The backend serves them on GET /metrics. Worker processes have no web server of their own, so they
+# start a sidecar HTTP server on METRICS_PORT. Processes that fork (uvicorn --workers, Celery prefork)
+# must set PROMETHEUS_MULTIPROC_DIR to an empty, writable directory: every process then writes its
+# samples there and whichever process serves /metrics aggregates them.
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+    start_http_server,
+)
+from prometheus_client.core import GaugeMetricFamily
+from sqlalchemy import func
+
+from shared.db.base import Job
+from shared.utils import logger
+
+logger = logger.setup_logger('metrics')
+
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+# Sidecar port for processes without their own web server; 0 disables it
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+# Queue waits and training runs take minutes to hours, far beyond the default (sub-10s) buckets
+LONG_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600, 7200, 14400, 43200, float("inf"))
+CLAIM_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, float("inf"))
+REMOTE_CALL_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, float("inf"))
+
+# --- API ---
+HTTP_REQUEST_SECONDS = Histogram(
+    "finetune_http_request_seconds", "Backend request latency by route template.",
+    ["method", "route", "status_code"],
+)
+
+# --- Jobs ---
+JOB_CLAIM_SECONDS = Histogram(
+    "finetune_job_claim_seconds", "Time a worker spends claiming the next queued job, including empty polls.",
+    ["worker_mode", "outcome"], buckets=CLAIM_BUCKETS,
+)
+JOB_QUEUE_WAIT_SECONDS = Histogram(
+    "finetune_job_queue_wait_seconds", "Time from job creation until a worker claimed it.",
+    ["task_type"], buckets=LONG_BUCKETS,
+)
+JOB_RUN_SECONDS = Histogram(
+    "finetune_job_run_seconds", "Time a worker spent running a job until it reached a terminal status.",
+    ["task_type", "status"], buckets=LONG_BUCKETS,
+)
+IDEMPOTENT_REPLAYS = Counter(
+    "finetune_idempotent_replays_total", "Submissions answered from a stored response because their Idempotency-Key was seen before.",
+    ["endpoint"],
+)
+JOBS_FINISHED = Counter(
+    "finetune_jobs_finished_total", "Jobs that reached a terminal status.", ["task_type", "status"],
+)
+
+# --- RunPod ---
+RUNPOD_REQUEST_SECONDS = Histogram(
+    "finetune_runpod_request_seconds", "Latency of calls to RunPod (serverless API or pod executor server).",
+    ["operation"], buckets=REMOTE_CALL_BUCKETS,
+)
+RUNPOD_REQUEST_ERRORS = Counter(
+    "finetune_runpod_request_errors_total", "Failed calls to RunPod by error type.", ["operation", "error"],
+)
+
+# --- Data and caches ---
+UPLOAD_BYTES = Counter(
+    "finetune_upload_bytes_total", "Dataset bytes received or sent, by destination.", ["destination"],
+)
+DATASET_ROWS_REMOVED = Counter(
+    "finetune_dataset_rows_removed_total", "Dataset rows dropped by preprocessing before training, by reason.", ["reason"],
+)
+CACHE_REQUESTS = Counter(
+    "finetune_cache_requests_total", "Cache lookups by cache and result (hit or miss).", ["cache", "result"],
+)
+
+# Collectors that read state on scrape (e.g. queue depth) rather than counting events
+custom_collectors = []
+
+
+class JobQueueCollector:
+    """
+    Reports the number of jobs per status and task type, read from the jobs table on every scrape.
+    Register it in a single process only, otherwise the same rows are reported several times.
+    """
+    def __init__(self, session_factory):
+        self.session_factory = session_factory
+
+    def collect(self):
+        gauge = GaugeMetricFamily("finetune_jobs", "Jobs by status and task type.", labels=["status", "task_type"])
+        db = self.session_factory()
+        try:
+            rows = db.query(Job.status, Job.task_type, func.count(Job.id)).group_by(Job.status, Job.task_type).all()
+        except Exception as e:
+            # A scrape must not fail because the database is briefly unavailable
+            logger.error(f"Error reading job queue depth: {e}")
+            rows = []
+        finally:
+            db.close()
+        for status, task_type, count in rows:
+            gauge.add_metric([status or "", task_type or ""], count)
+        yield gauge
+
+
+def register_collector(collector):
+    custom_collectors.append(collector)
+    if not PROMETHEUS_MULTIPROC_DIR:
+        REGISTRY.register(collector)
+
+
+def build_registry():
+    """
+    Returns the registry to expose: the process-local default one, or in multiprocess mode a registry
+    that aggregates the samples written by all processes.
+    """
+    if not PROMETHEUS_MULTIPROC_DIR:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    for collector in custom_collectors:
+        registry.register(collector)
+    return registry
+
+
+def render_metrics():
+    """
+    :return: (body, content type) of the Prometheus text exposition for a /metrics response.
+    """
+    return generate_latest(build_registry()), CONTENT_TYPE_LATEST
+
+
+def start_metrics_server(port=METRICS_PORT):
+    """
+    Starts the sidecar /metrics HTTP server in a daemon thread. Does nothing when `port` is 0.
+    :return: True if the server was started.
+    """
+    if port <= 0:
+        return False
+    start_http_server(port, registry=build_registry())
+    logger.info(f"Serving Prometheus metrics on port {port}")
+    return True
+
+
+def mark_process_dead(pid):
+    """
+    Drops the live samples of an exited child process in multiprocess mode.
+    """
+    if PROMETHEUS_MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid)
+
+
+@contextmanager
+def track_runpod_call(operation):
+    """
+    Times a RunPod call and counts it as an error if the block raises.
+    """
+    start_time = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        RUNPOD_REQUEST_ERRORS.labels(operation, type(e).__name__).inc()
+        raise
+    finally:
+        RUNPOD_REQUEST_SECONDS.labels(operation).observe(time.perf_counter() - start_time)
+
+
+def record_cache_lookup(cache, hit):
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
@@ -0,0 +1,138 @@
+# shared/utils/tracing.py
+# OpenTelemetry tracing for the inference path: API request -> broker -> Celery task -> RunPod call.
+#
+# The W3C trace context (traceparent/tracestate) travels in the Celery message headers and in the
+# HTTP headers sent to RunPod, so every stage of one request ends up in the same trace. The enqueue
+# time travels along with it, so the time a message waited in the broker is recorded as its own span.
+#
+# Tracing is off unless TRACING_EXPORTER is set:
+#   otlp    OTLP/HTTP to OTEL_EXPORTER_OTLP_ENDPOINT (standard OpenTelemetry variables apply)
+#   console spans printed to stdout, for local debugging
+#   memory  spans kept in `memory_exporter`, for tests
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from opentelemetry import propagate, trace
+from opentelemetry.trace import SpanKind, Status, StatusCode
+
+from shared.utils import logger
+
+logger = logger.setup_logger('tracing')
+
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "none").lower()
+TRACING_EXPORTERS = ("none", "otlp", "console", "memory")
+TRACER_NAME = "finetuneplatform"
+# Celery message header with the time the task was sent, in nanoseconds since the epoch
+ENQUEUED_AT_HEADER = "enqueued_at_ns"
+TASK_HEADERS = ("traceparent", "tracestate", ENQUEUED_AT_HEADER)
+
+memory_exporter = None
+tracing_enabled = False
+setup_lock = threading.Lock()
+
+
+def setup_tracing(service_name, exporter=None):
+    """
+    Installs the tracer provider for this process. Only the first call has an effect.
+    Call it before a Celery prefork pool forks: the batch span processor restarts its export thread in each child.
+    :param service_name: Reported as service.name unless OTEL_SERVICE_NAME is set.
+    :param exporter: One of TRACING_EXPORTERS; defaults to TRACING_EXPORTER.
+    :return: The in-memory exporter when exporter is "memory", otherwise None.
+    """
+    global memory_exporter, tracing_enabled
+    exporter = (exporter or TRACING_EXPORTER).lower()
+    if exporter not in TRACING_EXPORTERS:
+        raise ValueError(f"Invalid TRACING_EXPORTER {exporter!r}. Choose one of {', '.join(TRACING_EXPORTERS)}.")
+
+    with setup_lock:
+        if tracing_enabled or exporter == "none":
+            return memory_exporter
+
+        # The SDK and exporters are only imported when tracing is actually on
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter, SimpleSpanProcessor
+
+        provider = TracerProvider(resource=Resource.create({"service.name": os.getenv("OTEL_SERVICE_NAME", service_name)}))
+        if exporter == "otlp":
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+            provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+        elif exporter == "console":
+            provider.add_span_processor(SimpleSpanProcessor(ConsoleSpanExporter()))
+        else:
+            from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+            memory_exporter = InMemorySpanExporter()
+            provider.add_span_processor(SimpleSpanProcessor(memory_exporter))
+
+        trace.set_tracer_provider(provider)
+        tracing_enabled = True
+        logger.info(f"Tracing enabled for {service_name} with the {exporter} exporter")
+        return memory_exporter
+
+
+def start_span(name, kind=SpanKind.INTERNAL, context=None, attributes=None):
+    """
+    Starts a span as the current span; use it as a context manager. A no-op while tracing is off.
+    """
+    return trace.get_tracer(TRACER_NAME).start_as_current_span(name, context=context, kind=kind, attributes=attributes)
+
+
+def record_error(exception):
+    """
+    Marks the current span as failed, for errors that are handled rather than propagated out of the span.
+    """
+    span = trace.get_current_span()
+    span.record_exception(exception)
+    span.set_status(Status(StatusCode.ERROR, str(exception)))
+
+
+def inject_headers(headers=None):
+    """
+    Returns a copy of `headers` with the current trace context added, for an outgoing HTTP request.
+    """
+    headers = dict(headers or {})
+    propagate.inject(headers)
+    return headers
+
+
+def task_headers():
+    """
+    Headers for `celery_app.send_task`: the current trace context and the enqueue time.
+    """
+    headers = inject_headers()
+    headers[ENQUEUED_AT_HEADER] = str(time.time_ns())
+    return headers
+
+
+def headers_from_task_request(request):
+    """
+    Reads the headers set by task_headers() back from a bound task's request. Depending on the message
+    protocol, Celery exposes custom headers as request attributes or under request.headers.
+    """
+    carrier = dict(getattr(request, "headers", None) or {})
+    for name in TASK_HEADERS:
+        value = getattr(request, name, None)
+        if value is not None:
+            carrier.setdefault(name, value)
+    return carrier
+
+
+@contextmanager
+def task_span(name, carrier, attributes=None):
+    """
+    Continues the trace started by the sender of a task. Records the time the message waited in the
+    broker as a `<name>.queue_wait` span, then runs the block inside a consumer span.
+    :param carrier: Headers from headers_from_task_request().
+    """
+    parent = propagate.extract(carrier)
+    tracer = trace.get_tracer(TRACER_NAME)
+    enqueued_at = carrier.get(ENQUEUED_AT_HEADER)
+    if enqueued_at:
+        # Clocks differ between hosts; never let the wait span end before it starts
+        now = time.time_ns()
+        queue_wait = tracer.start_span(f"{name}.queue_wait", context=parent, start_time=min(int(enqueued_at), now))
+        queue_wait.end(end_time=now)
+    with tracer.start_as_current_span(name, context=parent, kind=SpanKind.CONSUMER, attributes=attributes) as span:
+        yield span
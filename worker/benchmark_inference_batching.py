@@ -0,0 +1,86 @@
+# benchmark_inference_batching.py
+# Reports generation throughput (tokens/s) and request latency of the inference service for a
+# range of batch sizes. For every batch size, that many client threads send requests back to back,
+# so the batcher sees a steady stream of concurrent arrivals.
+#
+#   python benchmark_inference_batching.py --adapter <adapter repo or path> --device cpu
+import argparse
+import json
+import statistics
+import threading
+import time
+
+from inference_service import AdapterInferenceService, GenerationRequest
+
+DEFAULT_PROMPT = "Below is an instruction that describes a task. Write a response that appropriately completes the request."
+
+
+def run_clients(service, adapter, prompt, clients, requests_per_client, max_new_tokens):
+    latencies = []
+    tokens = []
+    lock = threading.Lock()
+
+    def client():
+        for _ in range(requests_per_client):
+            start_time = time.perf_counter()
+            request = service.submit(GenerationRequest(prompt, adapter, max_new_tokens=max_new_tokens))
+            request.done.wait()
+            if request.error is not None:
+                raise request.error
+            with lock:
+                latencies.append(time.perf_counter() - start_time)
+                tokens.append(request.generated_tokens)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    start_time = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start_time
+    return elapsed, latencies, tokens
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark dynamic batching in the inference service")
+    parser.add_argument("--adapter", type=str, required=True, help="Finetuned adapter repo id or local path.")
+    parser.add_argument("--prompt", type=str, default=DEFAULT_PROMPT)
+    parser.add_argument("--batch-sizes", type=str, default="1,2,4,8,16")
+    parser.add_argument("--requests-per-client", type=int, default=4)
+    parser.add_argument("--max-new-tokens", type=int, default=32)
+    parser.add_argument("--batch-window-ms", type=float, default=10)
+    parser.add_argument("--device", type=str, default=None)
+    parser.add_argument("--output", type=str, default=None, help="Optional path to write results as JSON.")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'batch':>6} {'requests':>9} {'tokens/s':>10} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9}")
+    for batch_size in [int(b) for b in args.batch_sizes.split(",")]:
+        service = AdapterInferenceService(device=args.device, max_batch_size=batch_size, batch_window_ms=args.batch_window_ms)
+        # Warm up: load the base model and adapter outside the measurement
+        service.generate(args.prompt, args.adapter, max_new_tokens=2)
+
+        elapsed, latencies, tokens = run_clients(
+            service, args.adapter, args.prompt, batch_size, args.requests_per_client, args.max_new_tokens
+        )
+        result = {
+            "batch_size": batch_size,
+            "requests": len(latencies),
+            "tokens_per_second": sum(tokens) / elapsed,
+            "requests_per_second": len(latencies) / elapsed,
+            "latency_p50_ms": statistics.median(latencies) * 1000,
+            "latency_p95_ms": percentile(latencies, 0.95) * 1000,
+        }
+        results.append(result)
+        print(f"{batch_size:>6} {result['requests']:>9} {result['tokens_per_second']:>10.1f} {result['requests_per_second']:>8.2f} "
+              f"{result['latency_p50_ms']:>9.1f} {result['latency_p95_ms']:>9.1f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
@@ -0,0 +1,54 @@
+# benchmark_prefix_cache.py
+# Compares time-to-first-token with and without the prefix KV cache on Alpaca-formatted prompts.
+# Each request generates a single token, so the measured time is dominated by prefill.
+#
+#   python benchmark_prefix_cache.py --adapter <adapter repo or path> --device cpu
+import argparse
+import json
+import statistics
+import time
+
+from inference_service import AdapterInferenceService, DEFAULT_PROMPT_PREFIXES
+
+ALPACA_PROMPT = DEFAULT_PROMPT_PREFIXES[0] + "### Instruction:\n{}\n\n### Input:\n{}\n\n### Response:\n"
+
+
+def measure_ttft(service, adapter, prompts):
+    # Warm up: load the base model, adapter and (when enabled) the prefix cache
+    service.generate(prompts[0], adapter, max_new_tokens=1)
+    timings = []
+    for prompt in prompts:
+        start_time = time.perf_counter()
+        service.generate(prompt, adapter, max_new_tokens=1)
+        timings.append(time.perf_counter() - start_time)
+    return timings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark prefix KV-cache reuse in the inference service")
+    parser.add_argument("--adapter", type=str, required=True, help="Finetuned adapter repo id or local path.")
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--device", type=str, default=None)
+    parser.add_argument("--output", type=str, default=None, help="Optional path to write results as JSON.")
+    args = parser.parse_args()
+
+    prompts = [ALPACA_PROMPT.format(f"Summarize item number {i}.", f"Item {i} is short.") for i in range(args.requests)]
+    results = {}
+    for label, prefix_cache_size in (("no_prefix_cache", 0), ("prefix_cache", 16)):
+        service = AdapterInferenceService(device=args.device, batch_window_ms=0, prefix_cache_size=prefix_cache_size)
+        timings = measure_ttft(service, args.adapter, prompts)
+        results[label] = {
+            "ttft_p50_ms": statistics.median(timings) * 1000,
+            "ttft_mean_ms": statistics.mean(timings) * 1000,
+            "prefix_cache_hits": service.prefix_cache_hits,
+            "prefix_cache_mismatches": service.prefix_cache_mismatches,
+        }
+        print(f"{label:>16}: p50 {results[label]['ttft_p50_ms']:.1f} ms, mean {results[label]['ttft_mean_ms']:.1f} ms")
+
+    speedup = results["no_prefix_cache"]["ttft_p50_ms"] / results["prefix_cache"]["ttft_p50_ms"]
+    print(f"Time-to-first-token speedup (p50): {speedup:.2f}x")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
@@ -0,0 +1,315 @@
+# dedup_dataset.py
+# CPU preprocessing stage that removes exact and near-duplicate rows from a dataset before it is
+# shipped to a training pod, so GPU time is not spent training on the same example over and over.
+#
+# Rows are streamed: the input is read in batches (JSONL lines or Parquet record batches) and kept rows are
+# written out as they are decided, so neither file is ever held in memory. What is remembered about earlier rows is a fixed-size Bloom
+# filter of their keys:
+#   - an exact key, a hash of the row's normalized text (case and whitespace differences are ignored), and
+#   - DEDUP_BANDS locality-sensitive keys from a MinHash signature over word shingles. Two rows whose shingle
+#     sets have a Jaccard similarity above about (1 / bands) ** (bands / num_perm) share at least one band
+#     with high probability, and the later one is dropped.
+# The filter is sized from the row count and capped at DEDUP_MAX_MEMORY_MB, so memory stays bounded for
+# datasets of any size. A false positive drops a unique row; the expected number is reported in the stats.
+#
+#   python dedup_dataset.py dataset.canonical.parquet dataset.canonical.dedup.parquet
+#   python dedup_dataset.py dataset.jsonl dataset.dedup.jsonl
+import argparse
+import hashlib
+import json
+import math
+import os
+import string
+import time
+import zlib
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Text fields that identify an example; rows without any of them are compared on all their string values
+DEDUP_FIELDS = [field.strip() for field in os.getenv("DEDUP_FIELDS", "instruction,input,output").split(",") if field.strip()]
+DEDUP_NUM_PERM = int(os.getenv("DEDUP_NUM_PERM", "64"))
+# num_perm / bands rows per band. 64 / 8 puts the similarity threshold at about 0.77
+DEDUP_BANDS = int(os.getenv("DEDUP_BANDS", "8"))
+DEDUP_SHINGLE_SIZE = int(os.getenv("DEDUP_SHINGLE_SIZE", "3")) # Words per shingle
+DEDUP_FALSE_POSITIVE_RATE = float(os.getenv("DEDUP_FALSE_POSITIVE_RATE", "1e-6")) # Per key lookup, at the planned size
+DEDUP_MAX_MEMORY_MB = float(os.getenv("DEDUP_MAX_MEMORY_MB", "512")) # Upper bound for the Bloom filter
+DEDUP_BATCH_ROWS = int(os.getenv("DEDUP_BATCH_ROWS", "16384")) # Rows read (and, for Parquet, written as one row group) at a time
+# Rows are hashed in batches of up to this many shingles; peak signature memory is about 8 * num_perm bytes per shingle
+DEDUP_BATCH_SHINGLES = int(os.getenv("DEDUP_BATCH_SHINGLES", "65536"))
+
+MAX_HASH = np.uint64((1 << 32) - 1)
+PUNCTUATION_TO_SPACE = str.maketrans({character: " " for character in string.punctuation})
+# Shingle n-grams combine per-word hashes with these multipliers
+SHINGLE_MULTIPLIERS = np.array([0x9E3779B1, 0x85EBCA77, 0xC2B2AE3D, 0x27D4EB2F, 0x165667B1, 0xD3A2646C, 0xFD7046C5, 0xB55A4F09], dtype=np.uint64)
+MIX_MULTIPLIER = np.uint64(0xBF58476D1CE4E5B9)
+
+
+def normalize_text(row):
+    """
+    :return: The text a row is compared on, lowercased with ASCII punctuation and repeated whitespace removed.
+    """
+    values = [row.get(field) for field in DEDUP_FIELDS if field in row]
+    if not values:
+        values = [row[key] for key in sorted(row) if isinstance(row[key], str)]
+    text = "\n".join(value if isinstance(value, str) else json.dumps(value, sort_keys=True) for value in values if value is not None)
+    # str.translate is several times faster than a \W+ regex on long rows
+    return " ".join(text.lower().translate(PUNCTUATION_TO_SPACE).split())
+
+
+def exact_key(text):
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def shingle_hashes(text, shingle_size=DEDUP_SHINGLE_SIZE):
+    """
+    :return: 32-bit hashes of the word n-grams of `text`, as a uint64 array with at least one element.
+    """
+    word_hashes = np.fromiter(map(zlib.crc32, text.encode("utf-8").split()), dtype=np.uint64)
+    if len(word_hashes) == 0:
+        return np.zeros(1, dtype=np.uint64)
+    size = min(shingle_size, len(word_hashes), len(SHINGLE_MULTIPLIERS))
+    count = len(word_hashes) - size + 1
+    hashes = np.zeros(count, dtype=np.uint64)
+    for offset in range(size):
+        hashes += word_hashes[offset:offset + count] * SHINGLE_MULTIPLIERS[offset]
+    return hashes & MAX_HASH
+
+
+class MinHasher:
+    """
+    Computes MinHash signatures for a batch of rows and folds each signature into `bands` 64-bit LSH keys.
+    The permutations are multiply-shift hashes, ((a * x + b) mod 2^64) >> 32 for odd a, which are universal
+    for 32-bit x and need no modulo, the slowest part of the usual (a * x + b) mod prime.
+    """
+    def __init__(self, num_perm=DEDUP_NUM_PERM, bands=DEDUP_BANDS, seed=1):
+        if num_perm % bands:
+            raise ValueError(f"DEDUP_NUM_PERM ({num_perm}) must be a multiple of DEDUP_BANDS ({bands}).")
+        rng = np.random.RandomState(seed) # Fixed seed: the same rows always get the same keys
+        self.a = rng.randint(0, np.iinfo(np.uint64).max, size=num_perm, dtype=np.uint64) | np.uint64(1)
+        self.b = rng.randint(0, np.iinfo(np.uint64).max, size=num_perm, dtype=np.uint64)
+        self.bands = bands
+        self.rows_per_band = num_perm // bands
+
+    def band_keys(self, hash_arrays):
+        """
+        :param hash_arrays: One array of shingle hashes per row.
+        :return: A (rows, bands) uint64 array of LSH keys.
+        """
+        offsets = np.cumsum([0] + [len(hashes) for hashes in hash_arrays[:-1]])
+        # One row per permutation, so each example's shingles are contiguous for reduceat; updated in place
+        permuted = np.multiply(self.a[:, None], np.concatenate(hash_arrays)[None, :])
+        permuted += self.b[:, None]
+        permuted >>= np.uint64(32)
+        signatures = np.minimum.reduceat(permuted, offsets, axis=1).T
+        bands = np.ascontiguousarray(signatures).reshape(len(hash_arrays), self.bands, self.rows_per_band)
+        # The band index is mixed in so equal values in different bands give different keys
+        keys = np.broadcast_to(np.arange(1, self.bands + 1, dtype=np.uint64) * MIX_MULTIPLIER, bands.shape[:2]).copy()
+        for column in range(self.rows_per_band):
+            keys = (keys ^ bands[:, :, column]) * MIX_MULTIPLIER
+            keys ^= keys >> np.uint64(31)
+        return keys
+
+
+class BloomFilter:
+    """
+    Fixed-size set membership for 64-bit keys. Lookups have no false negatives; the false positive rate
+    is about `false_positive_rate` until more than `capacity` keys have been added.
+    """
+    def __init__(self, capacity, false_positive_rate=DEDUP_FALSE_POSITIVE_RATE, max_bytes=DEDUP_MAX_MEMORY_MB * 1024 * 1024):
+        capacity = max(capacity, 1)
+        bits = -capacity * math.log(false_positive_rate) / math.log(2) ** 2
+        self.num_bits = int(max(64, min(bits, max_bytes * 8)))
+        self.num_hashes = int(min(30, max(1, round(self.num_bits / capacity * math.log(2)))))
+        self.bits = np.zeros((self.num_bits + 7) // 8, dtype=np.uint8)
+        self.steps = np.arange(self.num_hashes, dtype=np.uint64)
+
+    def positions(self, keys):
+        # Double hashing: k probe positions from two 64-bit hashes of each key
+        keys = np.asarray(keys, dtype=np.uint64).ravel()
+        second = (keys ^ (keys >> np.uint64(29))) * MIX_MULTIPLIER | np.uint64(1)
+        return (keys[:, None] + self.steps * second[:, None]) % np.uint64(self.num_bits)
+
+    def contains(self, keys):
+        """
+        :return: A boolean array, True for each key that was (probably) added before.
+        """
+        positions = self.positions(keys)
+        present = (self.bits[positions >> np.uint64(3)] >> (positions & np.uint64(7)).astype(np.uint8)) & 1
+        return present.all(axis=1).reshape(np.shape(keys))
+
+    def add(self, keys):
+        positions = self.positions(keys).ravel()
+        np.bitwise_or.at(self.bits, positions >> np.uint64(3), np.left_shift(1, positions & np.uint64(7)).astype(np.uint8))
+
+    def expected_false_positive_rate(self, count):
+        return (1 - math.exp(-self.num_hashes * count / self.num_bits)) ** self.num_hashes
+
+
+def count_lines(path):
+    count = 0
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            count += block.count(b"\n")
+    return count + 1
+
+
+def output_filename(dataset_filename):
+    root, extension = os.path.splitext(dataset_filename)
+    return f"{root}.dedup{extension}"
+
+
+class Deduplicator:
+    """
+    Decides, batch by batch, which rows to keep: a row is dropped when it is an exact or near duplicate
+    of a row kept before it, in an earlier batch or earlier in the same batch.
+    """
+    def __init__(self, expected_rows, near_duplicates=True):
+        self.hasher = MinHasher()
+        self.near_duplicates = near_duplicates
+        self.keys_per_row = 1 + (self.hasher.bands if near_duplicates else 0)
+        self.bloom = BloomFilter(expected_rows * self.keys_per_row)
+        self.stats = {"rows_in": 0, "rows_out": 0, "exact_duplicates": 0, "near_duplicates": 0, "invalid_rows": 0}
+        self.start_time = time.time()
+
+    def keep(self, texts):
+        """
+        :param texts: Normalized texts of the next rows, in file order (see normalize_text).
+        :return: Indices of the rows to keep.
+        """
+        kept, batch, batch_shingles = [], [], 0
+        for index, text in enumerate(texts):
+            hashes = shingle_hashes(text) if self.near_duplicates else None
+            batch.append((index, exact_key(text), hashes))
+            batch_shingles += len(hashes) if self.near_duplicates else 1
+            if batch_shingles >= DEDUP_BATCH_SHINGLES:
+                kept.extend(self.filter_batch(batch))
+                batch, batch_shingles = [], 0
+        if batch:
+            kept.extend(self.filter_batch(batch))
+        self.stats["rows_in"] += len(texts)
+        self.stats["rows_out"] += len(kept)
+        return kept
+
+    def filter_batch(self, batch):
+        # Rows in a batch are checked against the filter as it was before the batch, then against each other
+        exact_keys = np.array([key for _, key, _ in batch], dtype=np.uint64)
+        if self.near_duplicates:
+            near_keys = self.hasher.band_keys([hashes for _, _, hashes in batch])
+            seen_near = self.bloom.contains(near_keys).any(axis=1)
+        else:
+            near_keys = np.zeros((len(batch), 0), dtype=np.uint64)
+            seen_near = np.zeros(len(batch), dtype=bool)
+        seen_exact = self.bloom.contains(exact_keys)
+        batch_keys = set()
+        kept = []
+        for position, (index, key, _) in enumerate(batch):
+            row_keys = [key] + near_keys[position].tolist() # Band keys already have the band index mixed in
+            if seen_exact[position] or key in batch_keys:
+                self.stats["exact_duplicates"] += 1
+            elif seen_near[position] or any(row_key in batch_keys for row_key in row_keys[1:]):
+                self.stats["near_duplicates"] += 1
+            else:
+                batch_keys.update(row_keys)
+                kept.append(position)
+        if kept:
+            self.bloom.add(exact_keys[kept])
+            if self.near_duplicates:
+                self.bloom.add(near_keys[kept])
+        return [batch[position][0] for position in kept]
+
+    def summary(self):
+        stats = dict(self.stats)
+        keys_added = stats["rows_out"] * self.keys_per_row
+        stats.update(
+            removed_fraction=round(1 - stats["rows_out"] / stats["rows_in"], 4) if stats["rows_in"] else 0.0,
+            # Unique rows dropped because the filter answered "seen" for one of their keys
+            expected_false_drops=round(keys_added * self.bloom.expected_false_positive_rate(keys_added), 3),
+            filter_bytes=len(self.bloom.bits),
+            seconds=round(time.time() - self.start_time, 3),
+        )
+        return stats
+
+
+def dedup_jsonl(input_path, output_path, near_duplicates=True):
+    """
+    Writes the rows of `input_path` to `output_path` without exact and near duplicates, keeping the first
+    occurrence. Blank lines are skipped; lines that are not JSON objects are dropped and counted.
+    :param near_duplicates: False removes exact duplicates only.
+    :return: Removal statistics, suitable for Job.dataset_stats.
+    """
+    deduplicator = Deduplicator(count_lines(input_path), near_duplicates=near_duplicates)
+    invalid_rows = 0
+
+    def flush(lines, texts, out):
+        for index in deduplicator.keep(texts):
+            line = lines[index]
+            out.write(line if line.endswith(b"\n") else line + b"\n")
+
+    # Written under a temporary name, so an interrupted run never looks finished
+    tmp_path = f"{output_path}.tmp-{os.getpid()}"
+    try:
+        with open(input_path, "rb") as source, open(tmp_path, "wb") as out:
+            lines, texts = [], []
+            for line in source:
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    row = None
+                if not isinstance(row, dict):
+                    invalid_rows += 1
+                    continue
+                lines.append(line)
+                texts.append(normalize_text(row))
+                if len(lines) >= DEDUP_BATCH_ROWS:
+                    flush(lines, texts, out)
+                    lines, texts = [], []
+            if lines:
+                flush(lines, texts, out)
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    stats = deduplicator.summary()
+    stats["rows_in"] += invalid_rows
+    stats["invalid_rows"] = invalid_rows
+    return stats
+
+
+def dedup_parquet(input_path, output_path, near_duplicates=True):
+    """
+    Parquet version of dedup_jsonl, for the canonical files written by ingest_dataset.py. Reads one
+    DEDUP_BATCH_ROWS batch at a time and writes the kept rows with the input's schema and compression.
+    """
+    parquet_file = pq.ParquetFile(input_path)
+    deduplicator = Deduplicator(parquet_file.metadata.num_rows, near_duplicates=near_duplicates)
+    compression = parquet_file.metadata.row_group(0).column(0).compression.lower() if parquet_file.metadata.num_row_groups else "zstd"
+    tmp_path = f"{output_path}.tmp-{os.getpid()}"
+    try:
+        with pq.ParquetWriter(tmp_path, parquet_file.schema_arrow, compression=compression) as writer:
+            for batch in parquet_file.iter_batches(batch_size=DEDUP_BATCH_ROWS):
+                # Only the compared columns are converted to Python objects
+                columns = [name for name in batch.schema.names if name in DEDUP_FIELDS] or batch.schema.names
+                texts = [normalize_text(row) for row in batch.select(columns).to_pylist()]
+                kept = deduplicator.keep(texts)
+                if kept:
+                    writer.write_batch(batch.take(pa.array(kept, type=pa.int64())))
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return deduplicator.summary()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Remove exact and near-duplicate rows from a JSONL or Parquet dataset.")
+    parser.add_argument("input")
+    parser.add_argument("output")
+    parser.add_argument("--exact-only", action="store_true", help="Skip MinHash near-duplicate detection.")
+    args = parser.parse_args()
+    dedup = dedup_parquet if args.input.endswith(".parquet") else dedup_jsonl
+    print(json.dumps(dedup(args.input, args.output, near_duplicates=not args.exact_only), indent=2))
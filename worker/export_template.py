@@ -0,0 +1,127 @@
+# export_template.py
+# Runs on the training pod after finetuning: folds the LoRA adapter into the base model weights once
+# and publishes the merged model as safetensors shards, so inference can memory-map a single
+# checkpoint instead of stacking the adapter on the base at every load.
+import json
+import os
+import shutil
+import sys
+import time
+import torch
+from dotenv import load_dotenv
+from huggingface_hub import HfApi, login
+from transformers import AutoModelForCausalLM, AutoTokenizer
+from peft import PeftConfig, PeftModel
+
+load_dotenv()
+
+DEFAULT_MERGED_MODELS_DIR = "/workspace/merged_models"
+DEFAULT_MAX_SHARD_SIZE = "2GB"
+COMPLETE_MARKER = ".complete"
+# Pre-quantized bases and the full-precision repos they were quantized from. Adapters trained on a
+# bitsandbytes 4-bit base are merged into the original weights: folding LoRA deltas into 4-bit weights
+# would re-quantize them, and the export would stay a lossy bnb-4bit checkpoint. Same map as model_export.py
+FULL_PRECISION_BASES = {
+    "unsloth/Qwen2-7b-bnb-4bit": "unsloth/Qwen2-7B",
+    "unsloth/gemma-7b-bnb-4bit": "unsloth/gemma-7b",
+}
+BNB_4BIT_SUFFIX = "-bnb-4bit"
+
+def full_precision_base(base_model_name):
+    if base_model_name in FULL_PRECISION_BASES:
+        return FULL_PRECISION_BASES[base_model_name]
+    if base_model_name.endswith(BNB_4BIT_SUFFIX):
+        return base_model_name[:-len(BNB_4BIT_SUFFIX)]
+    return base_model_name
+
+def load_params():
+    if "--params_file" not in sys.argv:
+        print("Error: --params_file argument not found. Job parameters not provided.")
+        sys.exit(1)
+    params_file_index = sys.argv.index("--params_file") + 1
+    if params_file_index >= len(sys.argv):
+        print("Error: --params_file argument provided without a path.")
+        sys.exit(1)
+    try:
+        with open(sys.argv[params_file_index], "r") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Error loading job parameters from {sys.argv[params_file_index]}: {e}")
+        sys.exit(1)
+
+def merge_to_directory(adapter_repo, output_dir, max_shard_size, hf_token=None):
+    """
+    Writes the merged model to `output_dir` unless a complete export is already there.
+    The export is written under a temporary name and renamed into place so it is never half-written.
+    """
+    if os.path.exists(os.path.join(output_dir, COMPLETE_MARKER)):
+        print(f"Merged export already present at {output_dir}")
+        return
+
+    start_time = time.time()
+    adapter_base = PeftConfig.from_pretrained(adapter_repo, token=hf_token).base_model_name_or_path
+    base_model_name = full_precision_base(adapter_base)
+    print(f"Merging adapter {adapter_repo} (trained on {adapter_base}) into {base_model_name} in bf16...")
+    model = AutoModelForCausalLM.from_pretrained(
+        base_model_name,
+        torch_dtype=torch.bfloat16,
+        device_map="auto" if torch.cuda.is_available() else None,
+        token=hf_token,
+    )
+    if getattr(model.config, "quantization_config", None):
+        raise ValueError(f"{base_model_name} is a quantized checkpoint; add its full-precision base to FULL_PRECISION_BASES")
+    model = PeftModel.from_pretrained(model, adapter_repo, token=hf_token).merge_and_unload()
+    tokenizer = AutoTokenizer.from_pretrained(base_model_name, token=hf_token)
+
+    tmp_dir = f"{output_dir}.tmp-{os.getpid()}"
+    try:
+        model.save_pretrained(tmp_dir, safe_serialization=True, max_shard_size=max_shard_size)
+        tokenizer.save_pretrained(tmp_dir)
+        open(os.path.join(tmp_dir, COMPLETE_MARKER), "w").close()
+        shutil.rmtree(output_dir, ignore_errors=True)
+        os.rename(tmp_dir, output_dir)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    print(f"Merged model written to {output_dir} in {time.time() - start_time:.1f}s")
+
+if __name__ == "__main__":
+    params = load_params()
+    adapter_repo = params.get("adapter_repo")
+    if not adapter_repo:
+        print("Error: 'adapter_repo' not found in job parameters.")
+        sys.exit(1)
+
+    HF_TOKEN = params.get("HF_TOKEN", os.getenv("HF_TOKEN"))
+    if HF_TOKEN:
+        login(token=HF_TOKEN)
+
+    merged_models_dir = params.get("merged_models_dir", DEFAULT_MERGED_MODELS_DIR)
+    output_dir = os.path.join(merged_models_dir, adapter_repo.replace("/", "--"))
+    os.makedirs(merged_models_dir, exist_ok=True)
+
+    try:
+        merge_to_directory(adapter_repo, output_dir, params.get("max_shard_size", DEFAULT_MAX_SHARD_SIZE), hf_token=HF_TOKEN)
+    except Exception as e:
+        # stderr is returned as the pod job's error and ends up on the Job
+        print(f"Error merging adapter {adapter_repo}: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    hf_repo_id = params.get("hf_repo_id")
+    if hf_repo_id:
+        if not HF_TOKEN:
+            print("HF_TOKEN not provided. Cannot push the merged model to Hugging Face Hub.")
+            sys.exit(1)
+        try:
+            api = HfApi(token=HF_TOKEN)
+            api.create_repo(repo_id=hf_repo_id, private=params.get("hf_private_repo", False), exist_ok=True)
+            api.upload_folder(
+                folder_path=output_dir,
+                repo_id=hf_repo_id,
+                commit_message=params.get("hf_commit_message", f"Merged export of {adapter_repo}"),
+                ignore_patterns=[COMPLETE_MARKER],
+            )
+            print(f"Merged model pushed to https://huggingface.co/{hf_repo_id}")
+        except Exception as e:
+            print(f"Error pushing merged model to {hf_repo_id}: {e}")
+            sys.exit(1)
@@ -9,6 +9,11 @@ from huggingface_hub import HfApi
 # Load HF Token from environment
 HF_TOKEN = os.getenv("HUGGING_FACE_TOKEN")
 HF_USERNAME = os.getenv("HUGGING_FACE_USERNAME")
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "/app/uploads") # Datasets uploaded through the API
+# Same settings as finetune_with_custom_pod.py: "auto" streams CSVs larger than the threshold
+DATASET_STREAMING = os.getenv("DATASET_STREAMING", "auto").lower()
+DATASET_STREAMING_THRESHOLD_MB = float(os.getenv("DATASET_STREAMING_THRESHOLD_MB", "1024"))
+DATASET_SHUFFLE_BUFFER = int(os.getenv("DATASET_SHUFFLE_BUFFER", "10000"))
 
 # This format must match the model's template.
 # Phi-3's template is <|user|>\n{question}<|end|><|assistant|>\n{answer}<|end|>
@@ -33,14 +38,25 @@ def run_finetuning_job(job):
     print(f"Starting finetuning for job {job.id}...")
 
     # 1. Prepare dataset
-    dataset_path = f"/app/uploads/{job.dataset_filename}"
+    dataset_path = os.path.join(UPLOAD_DIR, job.prepared_dataset_filename or job.dataset_filename)
     if not os.path.exists(dataset_path):
         raise FileNotFoundError(f"Dataset file not found at {dataset_path}")
     
-    # We rename columns to fit our generic prompt format
-    dataset = load_dataset("csv", data_files=dataset_path, split="train")
-    dataset = dataset.rename_column("question", "instruction")
-    dataset = dataset.rename_column("answer", "output")
+    if DATASET_STREAMING in ("true", "false"):
+        streaming = DATASET_STREAMING == "true"
+    else:
+        streaming = os.path.getsize(dataset_path) > DATASET_STREAMING_THRESHOLD_MB * 1024 * 1024
+
+    # Streaming reads the file lazily instead of converting all of it into an Arrow cache first
+    # The prepared dataset is canonical Parquet (instruction, input, output); a raw upload is a question/answer CSV
+    dataset_format = "parquet" if dataset_path.endswith(".parquet") else "csv"
+    dataset = load_dataset(dataset_format, data_files=dataset_path, split="train", streaming=streaming)
+    if streaming:
+        dataset = dataset.shuffle(seed=3407, buffer_size=DATASET_SHUFFLE_BUFFER)
+    if dataset_format == "csv":
+        # We rename columns to fit our generic prompt format
+        dataset = dataset.rename_column("question", "instruction")
+        dataset = dataset.rename_column("answer", "output")
 
     # 2. Load Unsloth model
     max_seq_length = 2048
@@ -71,7 +87,7 @@ def run_finetuning_job(job):
         train_dataset=formatted_dataset,
         dataset_text_field="text",
         max_seq_length=max_seq_length,
-        dataset_num_proc=2,
+        dataset_num_proc=None if streaming else 2, # An IterableDataset is tokenized lazily, in the training loop
         packing=False,
         args=TrainingArguments(
             per_device_train_batch_size=2,
@@ -1,32 +1,98 @@
 import time
 import os
+import math
+import random
+from collections import namedtuple
+from shared.utils import logger
+from placement import estimate_model_params_b
+
+logger = logger.setup_logger('finetune_mock')
 
 # These are not used for finetuning but show that we have access to the job details
 HF_TOKEN = os.getenv("HUGGING_FACE_TOKEN")
 HF_USERNAME = os.getenv("HUGGING_FACE_USERNAME")
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "/app/uploads") # Datasets uploaded through the API
+
+# --- Duration model ---
+# Shared by the CPU mock worker and the capacity simulator (simulate_capacity.py). A run is model setup
+# (download and 4-bit load, proportional to the parameter count) plus training over every token of the
+# dataset, with log-normal noise. Throughput scales inversely with the parameter count.
+MOCK_TOKENS_PER_ROW = float(os.getenv("MOCK_TOKENS_PER_ROW", "512"))
+MOCK_EPOCHS = float(os.getenv("MOCK_EPOCHS", "2")) # Same default as finetune_template.py
+MOCK_TOKENS_PER_SECOND_8B = float(os.getenv("MOCK_TOKENS_PER_SECOND_8B", "2500"))
+MOCK_SETUP_SECONDS_PER_B = float(os.getenv("MOCK_SETUP_SECONDS_PER_B", "10"))
+MOCK_DURATION_SIGMA = float(os.getenv("MOCK_DURATION_SIGMA", "0.25"))
+MOCK_DEFAULT_DATASET_ROWS = int(os.getenv("MOCK_DEFAULT_DATASET_ROWS", "2000"))
+# Fraction of the mock worker's runs that crash partway through (OOM, bad data, NaN loss). Off by default so
+# local runs and demos succeed; simulate_capacity.py uses its own --failure-rate
+MOCK_FAILURE_RATE = float(os.getenv("MOCK_FAILURE_RATE", "0"))
+# The CPU mock worker sleeps for the planned duration times this factor (0.01: a 10 minute run takes 6 seconds)
+MOCK_TIME_SCALE = float(os.getenv("MOCK_TIME_SCALE", "0.01"))
+# Seeds the mock worker's random draws, for reproducible local runs; unset draws fresh ones
+MOCK_SEED = os.getenv("MOCK_SEED")
+
+# duration_seconds: how long the run takes if it completes; ends_after_seconds: when it actually ends
+MockRun = namedtuple("MockRun", ["duration_seconds", "ends_after_seconds", "fails"])
+
+mock_random = random.Random(MOCK_SEED)
+
+
+def expected_duration_seconds(base_model, dataset_rows):
+    """
+    Median duration of a finetuning run of `base_model` over `dataset_rows` rows.
+    """
+    params_b = estimate_model_params_b(base_model or "")
+    tokens_per_second = MOCK_TOKENS_PER_SECOND_8B * 8.0 / params_b
+    training_seconds = dataset_rows * MOCK_TOKENS_PER_ROW * MOCK_EPOCHS / tokens_per_second
+    return params_b * MOCK_SETUP_SECONDS_PER_B + training_seconds
+
+
+def plan_mock_run(base_model, dataset_rows, rng, failure_rate=MOCK_FAILURE_RATE):
+    """
+    Draws the duration and outcome of one run. Only `rng` is used for randomness, so a seeded rng
+    gives the same plan every time.
+    """
+    # The median of a log-normal with mu 0 is 1, so the noise keeps expected_duration_seconds as the median
+    duration_seconds = expected_duration_seconds(base_model, dataset_rows) * math.exp(rng.gauss(0.0, MOCK_DURATION_SIGMA))
+    if rng.random() < failure_rate:
+        return MockRun(duration_seconds, rng.uniform(0.0, duration_seconds), True)
+    return MockRun(duration_seconds, duration_seconds, False)
+
+
+def count_dataset_rows(dataset_filename):
+    dataset_path = os.path.join(UPLOAD_DIR, dataset_filename or "")
+    if not dataset_filename or not os.path.exists(dataset_path):
+        return MOCK_DEFAULT_DATASET_ROWS
+    if dataset_path.endswith(".parquet"):
+        import pyarrow.parquet as pq # Only loaded once a job needs it, to keep worker start-up fast
+        return pq.ParquetFile(dataset_path).metadata.num_rows
+    with open(dataset_path, "rb") as f:
+        return sum(1 for line in f if line.strip())
+
 
 def run_mock_finetuning_job(job):
     """
     Simulates a finetuning job without using a GPU.
+    The run takes its planned duration scaled by MOCK_TIME_SCALE and fails at MOCK_FAILURE_RATE.
     """
-    print("--- RUNNING IN CPU MOCK MODE ---")
-    print(f"Received job {job.id} to 'finetune' model {job.base_model}")
-    print(f"Dataset: {job.dataset_filename}")
-    
-    # Simulate the download and model loading
-    print("Simulating model and data loading...")
-    time.sleep(1)
-    
-    # Simulate the training process
-    print("Simulating finetuning training loop... (will take ~30 seconds)")
-    for i in range(5):
-        print(f"Mock training step {i+1}/10...")
-        time.sleep(1)
-    
+    dataset_rows = count_dataset_rows(job.prepared_dataset_filename or job.dataset_filename)
+    run = plan_mock_run(job.base_model, dataset_rows, mock_random)
+    logger.info(f"CPU mock mode: received job {job.id} to 'finetune' model {job.base_model}",
+                extra={"job_id": job.id, "dataset": job.dataset_filename, "dataset_rows": dataset_rows,
+                       "simulated_seconds": round(run.duration_seconds, 1), "fails": run.fails})
+
+    # Simulate model loading and the training loop in ten steps
+    step_seconds = run.ends_after_seconds * MOCK_TIME_SCALE / 10
+    for i in range(10):
+        logger.info(f"Mock training step {i+1}/10...", extra={"job_id": job.id})
+        time.sleep(step_seconds)
+
+    if run.fails:
+        raise RuntimeError(f"Simulated training failure after {run.ends_after_seconds:.0f}s of {run.duration_seconds:.0f}s.")
+
     # Simulate pushing to hub
     repo_id = f"{HF_USERNAME}/{job.new_model_name}"
-    print(f"Simulation complete. Mock model would be pushed to {repo_id}")
-    time.sleep(2)
-    
-    print(f"Mock job {job.id} completed successfully.")
-    # In a real scenario, this mock worker would NOT push to the hub.
\ No newline at end of file
+    logger.info(f"Simulation complete. Mock model would be pushed to {repo_id}")
+
+    logger.info(f"Mock job {job.id} completed successfully.")
+    # In a real scenario, this mock worker would NOT push to the hub.
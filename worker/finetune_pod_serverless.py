@@ -3,9 +3,10 @@ import json
 import os
 import time
 import base64
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from shared.utils import logger
-import runpod
+from shared.utils import logger, metrics
+from s3_data_set_upload_service import serverless_dataset_filename
 
 logger = logger.setup_logger('finetune_with_serverless_pod')
 
@@ -35,12 +36,22 @@ def convert_sets_to_lists(obj):
     else:
         return obj    
 
-def run_finetuning_job_serverless(job):
-    logger.info(f"Starting finetuning process via RunPod Serverless...")
+# RunPod serverless job states, see https://docs.runpod.io/serverless/endpoints/job-states
+RUNPOD_PENDING_STATES = ("IN_QUEUE", "IN_PROGRESS")
+RUNPOD_FAILED_STATES = ("FAILED", "CANCELLED", "TIMED_OUT")
+# The runpod SDK reads the same variable, so both the SDK calls and the status polls can be pointed at a local stand-in
+RUNPOD_ENDPOINT_BASE_URL = os.getenv("RUNPOD_ENDPOINT_BASE_URL", "https://api.runpod.ai/v2")
+RUNPOD_API_BASE_URL = f"{RUNPOD_ENDPOINT_BASE_URL}/{RUNPOD_SERVERLESS_ENDPOINT_ID}"
+STATUS_FETCH_CONCURRENCY = int(os.getenv("RUNPOD_STATUS_FETCH_CONCURRENCY", "8"))
 
+status_session = requests.Session()
+status_session.headers.update({"Authorization": f"Bearer {RUNPOD_API_KEY}"})
+
+def build_job_input(job):
     # --- Step 1: Upload the dataset to your RunPod Network Volume ---
     # This path is where the file will reside *on your Network Volume*
-    S3_DATASET_KEY = f"datasets/{job.id}_{job.dataset_filename}"
+    # A JSONL export of the prepared dataset, written by s3_data_set_upload_service.upload_data_set_to_s3
+    S3_DATASET_KEY = f"datasets/{job.id}_{serverless_dataset_filename(job)}"
     
     # --- Step 2: Define parameters for the Serverless fine-tuning job ---
     # These parameters will be sent as `job['input']` to your handler.py
@@ -58,42 +69,55 @@ def run_finetuning_job_serverless(job):
         "hf_private_repo": False,
         "hf_commit_message": "Fine-tuning job initiated by RunPod Serverless client.",
     }
+    return convert_sets_to_lists(JOB_INPUT_PARAMETERS)
 
-    # --- Step 3: Call the RunPod Serverless Endpoint ---
-    logger.info(f"Submitting Serverless job with parameters: {JOB_INPUT_PARAMETERS}")
-    try:
-        # run_sync is blocking and waits for completion
-        # run_async is non-blocking and returns a job_id immediately
-        # POST https://api.runpod.ai/v2/{endpoint_id}/runsync
-        runpod.api_key = RUNPOD_API_KEY
-        endpoint = runpod.Endpoint(RUNPOD_SERVERLESS_ENDPOINT_ID)
+def map_runpod_status(status_data):
+    """
+    Maps a RunPod job status payload onto a platform job status.
+    :return: (status, error_message), where status is None while the RunPod job is still pending.
+    """
+    status = status_data.get("status")
+    if status in RUNPOD_PENDING_STATES:
+        return None, None
+    if status == "COMPLETED":
+        # The handler reports its own failures inside a COMPLETED envelope
+        output = status_data.get("output")
+        if isinstance(output, dict) and (output.get("error") or str(output.get("status", "")).lower() in ("error", "failed")):
+            return "FAILED", str(output.get("error") or output)
+        return "COMPLETED", None
+    if status in RUNPOD_FAILED_STATES or status == "ERROR": # ERROR is set locally when the call itself failed
+        return "FAILED", f"RunPod job {status}: {status_data.get('error', 'No specific error message provided by RunPod.')}"
+    return "FAILED", f"Unexpected RunPod job status: {status_data}"
 
-        job_response = endpoint.run_sync({"input": convert_sets_to_lists(JOB_INPUT_PARAMETERS)})
-        '''
-        job_response = endpoint.run_sync(
-            runpod.endpoint_id,
-            JOB_INPUT_PARAMETERS,
-            timeout=3600 # Adjust timeout for fine-tuning, e.g., 1 hour (3600 seconds)
-        )
-        
-        '''
-        
-        # If using run_async:
-        # job_response = runpod.run(runpod.endpoint_id, JOB_INPUT_PARAMETERS)
-        # print(f"Job submitted asynchronously with ID: {job_response['id']}")
-        # Poll manually using runpod.get_job(job_response['id'])
-        
-        logger.info(f"\n--- Serverless Job Finished ---")
-        logger.info(f"Job Status: {job_response.get('status')}")
-        logger.info(f"Job Output: {job_response.get('output')}")
-        if job_response.get('error'):
-            logger.error(f"Job Error: {job_response.get('error')}")
-        
-        return job_response
+def submit_finetuning_job_serverless(job):
+    """
+    Submits the finetuning job with /run and returns the RunPod job id without waiting for it.
+    """
+    JOB_INPUT_PARAMETERS = build_job_input(job)
+    logger.info("Submitting async Serverless job", extra={"job_id": job.id, "job_parameters": JOB_INPUT_PARAMETERS})
+    import runpod # Heavy SDK import, only needed when submitting
+    runpod.api_key = RUNPOD_API_KEY
+    endpoint = runpod.Endpoint(RUNPOD_SERVERLESS_ENDPOINT_ID)
+    with metrics.track_runpod_call("serverless_run"):
+        run_request = endpoint.run({"input": JOB_INPUT_PARAMETERS})
+    logger.info(f"Job {job.id} submitted to RunPod as {run_request.job_id}")
+    return run_request.job_id
 
-    except Exception as e:
-        logger.error(f"Error submitting or running Serverless job: {e}")
-        return {"status": "ERROR", "error": str(e)}      
-def run_finetuning_job(job):
-    run_finetuning_job_serverless(job)
+def fetch_runpod_status(runpod_job_id):
+    try:
+        with metrics.track_runpod_call("serverless_status"):
+            response = status_session.get(f"{RUNPOD_API_BASE_URL}/status/{runpod_job_id}", timeout=10)
+            response.raise_for_status()
+        return response.json()
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Error fetching status for RunPod job {runpod_job_id}: {e}")
+        return None
 
+def fetch_runpod_statuses(runpod_job_ids):
+    """
+    Fetches the status of many RunPod jobs concurrently over one keep-alive session.
+    :return: dict of runpod_job_id -> status payload; ids whose lookup failed are left out.
+    """
+    with ThreadPoolExecutor(max_workers=STATUS_FETCH_CONCURRENCY) as executor:
+        results = executor.map(fetch_runpod_status, runpod_job_ids)
+    return {runpod_job_id: data for runpod_job_id, data in zip(runpod_job_ids, results) if data is not None}
@@ -4,14 +4,21 @@ import os
 from dotenv import load_dotenv
 import json
 import sys
+import time
+import math
+import glob
+import shutil
+import hashlib
+import fcntl
 import torch
 from unsloth import FastLanguageModel
 from transformers import TrainingArguments
 from trl import SFTTrainer
 from datasets import load_dataset
+import pyarrow.parquet as pq
 from huggingface_hub import HfApi, login, create_repo # Import HfApi, login, create_repo
 # Assuming you have transformers and other libraries installed by Unsloth
-from transformers import AutoModelForCausalLM, AutoTokenizer, TrainingArguments, Trainer
+from transformers import AutoModelForCausalLM, AutoTokenizer, TrainingArguments, Trainer, TrainerCallback
 from peft import PeftModel, LoraConfig # For adapter models
 import wandb # Import wandb
 
@@ -20,6 +27,22 @@ load_dotenv()
 
 WANDB_PROJECT_NAME = "FinetuneIT-WANDB-Project"
 
+# --- Warm model cache on the network volume ---
+# Pre-quantized 4-bit snapshots keyed by (model, revision, quant config) so a warm pod skips
+# the multi-GB download and re-quantization on every job.
+DEFAULT_MODEL_CACHE_DIR = "/workspace/model_cache"
+DEFAULT_MODEL_CACHE_BUDGET_GB = 200
+CACHE_COMPLETE_MARKER = ".complete"
+
+# --- Dataset loading ---
+# Rows held in memory by the streaming shuffle; larger buffers shuffle better but cost RAM
+DEFAULT_SHUFFLE_BUFFER_SIZE = 10000
+
+# --- Progress reporting back to the platform ---
+# One JSON line per trainer log event on stdout; the worker reads it from the executor's job output.
+# Must match METRICS_LINE_PREFIX in training_metrics.py.
+METRICS_LINE_PREFIX = "PLATFORM_METRICS "
+
 
 # --- Helper function for prompt formatting ---
 ALPACA_PROMPT = """Below is an instruction that describes a task, paired with an input that provides further context. Write a response that appropriately completes the request.
@@ -50,6 +73,185 @@ def formatting_prompts_func(examples, tokenizer_instance):
         texts.append(text)
     return { "text" : texts, }
 
+class PlatformMetricsCallback(TrainerCallback):
+    """
+    Prints step, loss, learning rate, throughput and ETA as a METRICS_LINE_PREFIX line on every trainer log.
+    """
+    def __init__(self):
+        self.start_time = None
+        self.last_time = None
+        self.last_tokens = 0
+
+    def emit(self, state, **metrics):
+        elapsed = time.time() - self.start_time
+        eta = elapsed / state.global_step * (state.max_steps - state.global_step) if state.global_step else None
+        payload = {
+            "step": state.global_step,
+            "total_steps": state.max_steps,
+            "epoch": state.epoch,
+            "elapsed_seconds": round(elapsed, 1),
+            "eta_seconds": round(eta, 1) if eta is not None else None,
+            **metrics,
+        }
+        print(METRICS_LINE_PREFIX + json.dumps(payload), flush=True)
+
+    def on_train_begin(self, args, state, control, **kwargs):
+        self.start_time = self.last_time = time.time()
+        self.emit(state)
+
+    def on_log(self, args, state, control, logs=None, **kwargs):
+        logs = logs or {}
+        if "loss" not in logs:
+            return
+        now = time.time()
+        tokens_seen = getattr(state, "num_input_tokens_seen", 0) or 0
+        tokens_per_second = (tokens_seen - self.last_tokens) / (now - self.last_time) if tokens_seen and now > self.last_time else None
+        self.last_time, self.last_tokens = now, tokens_seen
+        self.emit(
+            state,
+            loss=logs.get("loss"),
+            learning_rate=logs.get("learning_rate"),
+            grad_norm=logs.get("grad_norm"),
+            tokens_per_second=round(tokens_per_second, 1) if tokens_per_second is not None else None,
+        )
+
+def dataset_files(dataset_path):
+    """
+    :param dataset_path: A Parquet or JSONL file, or a directory of shards as written by prepare_data.py.
+    """
+    if os.path.isdir(dataset_path):
+        return sorted(glob.glob(os.path.join(dataset_path, "*.parquet"))) or sorted(glob.glob(os.path.join(dataset_path, "*.jsonl")))
+    return [dataset_path]
+
+def count_dataset_rows(files):
+    rows = 0
+    for path in files:
+        if path.endswith(".parquet"):
+            rows += pq.ParquetFile(path).metadata.num_rows # Read from the footer, without decoding any data
+            continue
+        with open(path, "rb") as f:
+            rows += sum(1 for line in f if line.strip())
+    return rows
+
+def load_training_dataset(files, tokenizer_instance, streaming=False, shuffle_buffer_size=DEFAULT_SHUFFLE_BUFFER_SIZE, seed=3407):
+    """
+    Loads and formats the training data. By default the files are converted into an Arrow cache on disk
+    and mapped in full. With `streaming` the result is an IterableDataset that reads the shards lazily,
+    shuffles shard order and a `shuffle_buffer_size` row buffer, and formats rows (and, in the trainer,
+    tokenizes them) on the fly, so memory and disk use do not grow with the dataset.
+    """
+    builder = "parquet" if files[0].endswith(".parquet") else "json"
+    dataset = load_dataset(builder, data_files=files, split="train", streaming=streaming)
+    if streaming:
+        dataset = dataset.shuffle(seed=seed, buffer_size=shuffle_buffer_size)
+    return dataset.map(lambda examples: formatting_prompts_func(examples, tokenizer_instance), batched = True,)
+
+def model_cache_key(base_model, revision, quant_config):
+    key_source = json.dumps({"model": base_model, "revision": revision, "quant": quant_config}, sort_keys=True)
+    return f"{base_model.replace('/', '--')}-{hashlib.sha1(key_source.encode()).hexdigest()[:12]}"
+
+def directory_size_bytes(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+def evict_model_cache(cache_dir, budget_bytes, keep):
+    """
+    Removes least recently used snapshots until the cache fits in budget_bytes. `keep` is never evicted,
+    nor is a snapshot whose lock another job holds while it loads or writes that entry.
+    """
+    entries = []
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        marker = os.path.join(path, CACHE_COMPLETE_MARKER)
+        if os.path.isdir(path) and os.path.exists(marker):
+            entries.append((os.path.getmtime(marker), name, path, directory_size_bytes(path)))
+
+    total = sum(entry[3] for entry in entries)
+    for _, name, path, size in sorted(entries):
+        if total <= budget_bytes:
+            break
+        if name == keep:
+            continue
+        with open(os.path.join(cache_dir, f"{name}.lock"), "w") as lock_file:
+            # Non-blocking: waiting here while holding our own key's lock could deadlock two evicting jobs
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                print(f"Skipping eviction of cached model snapshot {name}: in use")
+                continue
+            marker = os.path.join(path, CACHE_COMPLETE_MARKER)
+            if not os.path.exists(marker):
+                continue # Already evicted by another job
+            print(f"Evicting cached model snapshot {name} ({size / 1e9:.1f} GB)")
+            os.remove(marker) # First, so an interrupted removal never looks like a complete snapshot
+            shutil.rmtree(path, ignore_errors=True)
+        total -= size
+
+def load_model_cached(base_model, max_seq_length, revision=None, cache_dir=DEFAULT_MODEL_CACHE_DIR,
+                      budget_gb=DEFAULT_MODEL_CACHE_BUDGET_GB, prefetch_only=False):
+    """
+    Loads `base_model` in 4 bit through the warm cache: a hit loads the pre-quantized snapshot from the
+    volume, a miss loads from the Hub, saves the quantized snapshot and evicts old ones by LRU.
+    A per-key file lock keeps concurrent jobs on the same pod from populating the same entry twice.
+    :param prefetch_only: Only make sure the snapshot is cached; on a hit nothing is loaded onto the GPU
+                          and (None, None) is returned.
+    """
+    quant_config = {"load_in_4bit": True, "dtype": None, "max_seq_length": max_seq_length}
+    key = model_cache_key(base_model, revision, quant_config)
+    os.makedirs(cache_dir, exist_ok=True)
+    snapshot_dir = os.path.join(cache_dir, key)
+    marker = os.path.join(snapshot_dir, CACHE_COMPLETE_MARKER)
+
+    with open(os.path.join(cache_dir, f"{key}.lock"), "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        start_time = time.time()
+        if os.path.exists(marker) and prefetch_only:
+            os.utime(marker) # Refresh LRU position
+            print(f"Model cache hit for {base_model} ({key}), nothing to prefetch")
+            return None, None
+        if os.path.exists(marker):
+            model, tokenizer = FastLanguageModel.from_pretrained(
+                model_name = snapshot_dir, max_seq_length = max_seq_length, dtype = None, load_in_4bit = True,
+            )
+            os.utime(marker) # Refresh LRU position
+            print(f"Model cache hit for {base_model} ({key}), loaded in {time.time() - start_time:.1f}s")
+            return model, tokenizer
+
+        print(f"Model cache miss for {base_model} ({key}), loading from the Hub...")
+        model, tokenizer = FastLanguageModel.from_pretrained(
+            model_name = base_model, revision = revision, max_seq_length = max_seq_length, dtype = None, load_in_4bit = True,
+        )
+        tmp_dir = f"{snapshot_dir}.tmp-{os.getpid()}"
+        try:
+            model.save_pretrained(tmp_dir)
+            tokenizer.save_pretrained(tmp_dir)
+            shutil.rmtree(snapshot_dir, ignore_errors=True)
+            os.rename(tmp_dir, snapshot_dir)
+            open(marker, "w").close()
+            print(f"Cached quantized snapshot of {base_model} at {snapshot_dir} in {time.time() - start_time:.1f}s")
+            evict_model_cache(cache_dir, budget_gb * 1e9, keep=key)
+        except Exception as e:
+            # The job can still train on the loaded model, only the cache entry is lost
+            print(f"Could not cache model snapshot for {base_model}: {e}")
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        return model, tokenizer
+
+def restore_base_model_id(model, base_model):
+    """
+    A warm-cache hit loads the base from its local snapshot, and PEFT records that path as the adapter's
+    base model. Points the adapter and model configs back at the Hub id, which is what consumers of the
+    pushed adapter (inference, merged exports) load the base from.
+    """
+    for peft_config in getattr(model, "peft_config", {}).values():
+        peft_config.base_model_name_or_path = base_model
+    model.config._name_or_path = base_model
+
 if __name__ == "__main__":
     print(f"Executing dynamic fine-tuning script")
     parser = argparse.ArgumentParser(description="Dynamic Unsloth Fine-tuning Script")
@@ -72,14 +274,29 @@ if __name__ == "__main__":
     new_model_name= params.get("new_model_name", "my_finetuned_model")
     WANDB_API_KEY = params.get("WANDB_API_KEY", os.getenv("WANDB_API_KEY"))
     HF_TOKEN= params.get("HF_TOKEN", os.getenv("HF_TOKEN"))
+    model_revision = params.get("model_revision")
+    model_cache_dir = params.get("model_cache_dir", DEFAULT_MODEL_CACHE_DIR)
+    model_cache_budget_gb = params.get("model_cache_budget_gb", DEFAULT_MODEL_CACHE_BUDGET_GB)
+    dataset_streaming = params.get("dataset_streaming", False)
+    dataset_rows = params.get("dataset_rows")
+    shuffle_buffer_size = params.get("shuffle_buffer_size", DEFAULT_SHUFFLE_BUFFER_SIZE)
     print(f"Executing dynamic fine-tuning script with parameters: {params}")
 
+    if params.get("prefetch_only"):
+        # Warm the model cache while the dataset is still being uploaded, then stop
+        load_model_cached(
+            base_model, 2048, revision=model_revision, cache_dir=model_cache_dir, budget_gb=model_cache_budget_gb,
+            prefetch_only=True,
+        )
+        print("Model prefetch finished.")
+        sys.exit(0)
+
     os.makedirs(output_dir, exist_ok=True)
 
     if WANDB_API_KEY:
         wandb.login(key=WANDB_API_KEY)   
 
-    if not os.path.exists(dataset_path):
+    if not os.path.exists(dataset_path) or not dataset_files(dataset_path):
         print(f"ERROR: Dataset NOT found at: {dataset_path}. Please ensure it's uploaded to your volume.")
         exit(1)
     else:
@@ -96,6 +313,7 @@ if __name__ == "__main__":
             config={ # Log all your hyperparameters and settings
                 "base_model": base_model,
                 "dataset_path": dataset_path,
+                "dataset_streaming": dataset_streaming,
                 "epochs": epochs,
                 "batch_size": batch_size,
                 "learning_rate": learning_rate,
@@ -106,8 +324,8 @@ if __name__ == "__main__":
             }
         )
 
-        model, tokenizer = FastLanguageModel.from_pretrained(
-            model_name = base_model, max_seq_length = 2048, dtype = None, load_in_4bit = True,
+        model, tokenizer = load_model_cached(
+            base_model, max_seq_length, revision=model_revision, cache_dir=model_cache_dir, budget_gb=model_cache_budget_gb,
         )
         model = FastLanguageModel.get_peft_model(
             model, r = 16, target_modules = ["q_proj", "k_proj", "v_proj", "o_proj", "gate_proj", "up_proj", "down_proj",],
@@ -115,18 +333,36 @@ if __name__ == "__main__":
         )
         print("Model and tokenizer loaded and LoRA adapters applied.")
 
-        dataset = load_dataset("json", data_files=dataset_path, split="train")
-        dataset = dataset.map(lambda examples: formatting_prompts_func(examples, tokenizer), batched = True,)
-        print(f"Dataset loaded and formatted. First example: {dataset[0]['text'][:500]}...")
+        files = dataset_files(dataset_path)
+        dataset = load_training_dataset(files, tokenizer, streaming=dataset_streaming, shuffle_buffer_size=shuffle_buffer_size)
+        first_example = next(iter(dataset)) if dataset_streaming else dataset[0]
+        print(f"Dataset loaded and formatted from {len(files)} file(s). First example: {first_example['text'][:500]}...")
+
+        if dataset_streaming:
+            # An IterableDataset has no length, so the schedule is sized from the row count; the trainer
+            # restarts the stream (with a new shuffle seed) at every epoch boundary
+            dataset_rows = dataset_rows or count_dataset_rows(files)
+            world_size = int(os.environ.get("WORLD_SIZE", "1"))
+            steps_per_epoch = max(1, math.ceil(dataset_rows / (batch_size * gradient_accumulation_steps * world_size)))
+            max_steps = int(math.ceil(steps_per_epoch * epochs))
+            warmup_steps = int(0.03 * max_steps)
+            # Each dataloader worker reads its own subset of the shards
+            dataloader_num_workers = min(2, getattr(dataset, "n_shards", 1))
+            print(f"Streaming {dataset_rows} rows from {len(files)} shard(s): {max_steps} steps, shuffle buffer {shuffle_buffer_size}")
+        else:
+            max_steps = -1
+            warmup_steps = int(0.03 * epochs * len(dataset) / (batch_size * gradient_accumulation_steps))
+            dataloader_num_workers = 0
 
         training_args = TrainingArguments(
             per_device_train_batch_size = batch_size, gradient_accumulation_steps = gradient_accumulation_steps,
-            warmup_steps = int(0.03 * epochs * len(dataset) / (batch_size * gradient_accumulation_steps)),
+            warmup_steps = warmup_steps, max_steps = max_steps, dataloader_num_workers = dataloader_num_workers,
             num_train_epochs = float(epochs), learning_rate = learning_rate,
             fp16 = not torch.cuda.is_bf16_supported(), bf16 = torch.cuda.is_bf16_supported(),
             logging_steps = 10, optim = "adamw_8bit", weight_decay = 0.01,
             lr_scheduler_type = "linear", seed = 3407, output_dir = output_dir,
             save_strategy="epoch", save_total_limit=1,report_to="wandb",
+            include_num_input_tokens_seen=True, # Feeds tokens/s in PlatformMetricsCallback
             run_name=wandb_run_name, # Pass run_name to Trainer (optional, as wandb.init handles it)
             ddp_find_unused_parameters=False if torch.cuda.device_count() > 1 else None,
         )
@@ -134,6 +370,7 @@ if __name__ == "__main__":
         trainer = SFTTrainer(
             model = model, tokenizer = tokenizer, train_dataset = dataset,
             dataset_text_field = "text", max_seq_length = 2048, args = training_args,
+            callbacks = [PlatformMetricsCallback()],
         )
 
         print(f"Starting training for {epochs} epochs...")
@@ -141,6 +378,8 @@ if __name__ == "__main__":
         print("Training completed.")
         final_model_path = os.path.join(output_dir, "final_model")
         save_path_adapters = os.path.join(output_dir, "finetuned_adapters")
+        # Before saving, so both the local adapter_config.json and the pushed one name the Hub model
+        restore_base_model_id(trainer.model, base_model)
         trainer.model.save_pretrained(save_path_adapters)
         tokenizer.save_pretrained(save_path_adapters)
         print(f"LoRA adapters saved to: {save_path_adapters}")
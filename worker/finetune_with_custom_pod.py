@@ -3,11 +3,11 @@ import json
 import os
 import time
 import base64
+import gzip
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from shared.utils import logger
-from sqlalchemy import create_engine, update
-from sqlalchemy.orm import sessionmaker
-from shared.db.base import Job
+from shared.utils import logger, metrics
 
 logger = logger.setup_logger('finetune_with custom_pod')
 
@@ -15,6 +15,7 @@ logger = logger.setup_logger('finetune_with custom_pod')
 load_dotenv()
 
 POD_IP = os.getenv("RUNPOD_IP")
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "/app/uploads") # Datasets uploaded through the API
 HFACE_USERNAME = os.getenv("HUGGING_FACE_USERNAME")
 SERVER_URL = f"{POD_IP}"
 EXECUTE_ENDPOINT = f"{SERVER_URL}/execute_script"
@@ -22,117 +23,318 @@ STATUS_ENDPOINT = f"{SERVER_URL}/job_status"
 
 output_dir="/workspace/output"
 
-DATABASE_URL = os.getenv("DATABASE_URL")
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# --- Status polling configuration ---
+POLL_MIN_INTERVAL = float(os.getenv("POLL_MIN_INTERVAL", "5"))
+POLL_MAX_INTERVAL = float(os.getenv("POLL_MAX_INTERVAL", "60"))
+POLL_BACKOFF_FACTOR = float(os.getenv("POLL_BACKOFF_FACTOR", "1.5"))
+POLL_DEADLINE_SECONDS = float(os.getenv("POLL_DEADLINE_SECONDS", str(6 * 60 * 60)))
+POLL_MAX_CONSECUTIVE_ERRORS = int(os.getenv("POLL_MAX_CONSECUTIVE_ERRORS", "5"))
+EXPECTED_FINETUNE_SECONDS = float(os.getenv("EXPECTED_FINETUNE_SECONDS", str(30 * 60)))
+# How long past its expected end a run is still polled at POLL_MIN_INTERVAL before backing off again
+POLL_FAST_WINDOW_SECONDS = float(os.getenv("POLL_FAST_WINDOW_SECONDS", "300"))
+TERMINAL_STATUSES = ("COMPLETED", "FAILED", "ERROR")
+# Only the end of each new output chunk is logged; the full output is still returned to the caller
+POLL_LOG_OUTPUT_CHARS = int(os.getenv("POLL_LOG_OUTPUT_CHARS", "2000"))
 
-def update_job_status(db, job_id, status, error_message=None):
-    stmt = (
-        update(Job)
-        .where(Job.id == job_id)
-        .values(status=status, error_message=error_message)
-    )
-    db.execute(stmt)
-    db.commit()
-    print(f"Updated job {job_id} to status {status}")
+# --- Dataset upload configuration ---
+# The dataset goes to the pod in line-aligned chunks, each written there as its own shard file, so the
+# worker never holds more than DATASET_UPLOAD_PARALLELISM chunks in memory and training can read the shards lazily
+DATASET_UPLOAD_CHUNK_MB = float(os.getenv("DATASET_UPLOAD_CHUNK_MB", "64"))
+DATASET_UPLOAD_PARALLELISM = max(1, int(os.getenv("DATASET_UPLOAD_PARALLELISM", "4")))
+POD_DATASETS_DIR = os.getenv("POD_DATASETS_DIR", "/workspace/datasets")
+POD_OUTPUT_DIR = os.getenv("POD_OUTPUT_DIR", "/workspace/output") # Checkpoints and adapters, one subdirectory per job
+# "auto" streams datasets larger than DATASET_STREAMING_THRESHOLD_MB instead of loading them into an Arrow cache
+DATASET_STREAMING = os.getenv("DATASET_STREAMING", "auto").lower()
+DATASET_STREAMING_THRESHOLD_MB = float(os.getenv("DATASET_STREAMING_THRESHOLD_MB", "1024"))
+DATASET_SHUFFLE_BUFFER = int(os.getenv("DATASET_SHUFFLE_BUFFER", "10000")) # Rows held by the streaming shuffle
+
+# --- Merged export configuration ---
+EXPECTED_EXPORT_SECONDS = float(os.getenv("EXPECTED_EXPORT_SECONDS", str(10 * 60)))
+MERGED_REPO_SUFFIX = os.getenv("MERGED_REPO_SUFFIX", "-merged")
+MERGED_MAX_SHARD_SIZE = os.getenv("MERGED_MAX_SHARD_SIZE", "2GB")
+
+def finetuned_repo_id(job):
+    return f"{HFACE_USERNAME}/Finetuned-{job.new_model_name}"
+
+def pod_dataset_dir(job):
+    # Per job, so concurrent jobs on one pod do not overwrite each other's data
+    return f"{POD_DATASETS_DIR}/{job.id}"
+
+def pod_output_dir(job):
+    # Per job for the same reason: jobs packed onto one pod must not push each other's adapters
+    return f"{POD_OUTPUT_DIR}/{job.id}"
+
+def merged_repo_id(adapter_repo):
+    return f"{adapter_repo}{MERGED_REPO_SUFFIX}"
 
 # --- Functions to interact with the executor server ---
-def send_script_to_pod(job, script_content, script_params):
+def send_script_to_pod(job, script_content, script_params, server_url=SERVER_URL):
     payload = {
         "script_content": script_content,
         "script_params": script_params
     }
-    logger.info(f"Sending script to {EXECUTE_ENDPOINT}...")
+    execute_endpoint = f"{server_url}/execute_script"
+    logger.info(f"Sending script to {execute_endpoint}...")
     try:
-        response = requests.post(EXECUTE_ENDPOINT, json=payload, timeout=30)
-        response.raise_for_status()        
+        with metrics.track_runpod_call("pod_execute_script"):
+            response = requests.post(execute_endpoint, json=payload, timeout=30)
+            response.raise_for_status()
         return response.json()
     except requests.exceptions.RequestException as e:
-        logger.info(f"Error sending script: {e}")
-        if hasattr(e, 'response') and e.response is not None:
-            logger.info(f"Server response: {e.response.text}")
+        response_text = e.response.text if getattr(e, 'response', None) is not None else None
+        logger.error(f"Error sending script: {e}", extra={"server_response": response_text})
         return None
 
-def poll_job_status(job_id):
+def poll_job_status(job_id, expected_duration=None, deadline_seconds=POLL_DEADLINE_SECONDS, server_url=SERVER_URL,
+                    on_output=None):
+    """
+    Polls the executor server until the script reaches a terminal status or the deadline passes.
+    Script output is fetched incrementally with `?since=<byte offset>` so each poll only
+    transfers (and logs) the lines written since the previous one.
+    :param job_id: The executor server's job id returned by /execute_script.
+    :param expected_duration: Optional estimate of the run length in seconds. Polling tightens
+                              to the minimum interval once the run gets close to it, for up to
+                              POLL_FAST_WINDOW_SECONDS past it.
+    :param deadline_seconds: Total time budget for polling before giving up.
+    :param server_url: Base URL of the executor server the job was submitted to.
+    :param on_output: Optional callable invoked with each new chunk of output, e.g. to record training metrics.
+    :return: The final status dict (with the accumulated `output`), or None on timeout/error.
+    """
+    start_time = time.time()
+    offset = 0
+    output_chunks = []
+    interval = POLL_MIN_INTERVAL
+    consecutive_errors = 0
+
+    while True:
+        elapsed = time.time() - start_time
+        if elapsed > deadline_seconds:
+            logger.error(f"Polling for job {job_id} timed out after {deadline_seconds} seconds.", extra={"pod_job_id": job_id})
+            return None
+
         try:
-            time.sleep(15) # Poll every 15 seconds
-            response = requests.get(f"{STATUS_ENDPOINT}/{job_id}", timeout=10)
-            response.raise_for_status()
+            with metrics.track_runpod_call("pod_job_status"):
+                response = requests.get(f"{server_url}/job_status/{job_id}", params={"since": offset}, timeout=10)
+                response.raise_for_status()
             status_data = response.json()
-            
+            consecutive_errors = 0
+        except requests.exceptions.RequestException as e:
+            consecutive_errors += 1
+            logger.warning(f"Error polling job status for {job_id} (attempt {consecutive_errors}): {e}", extra={"pod_job_id": job_id})
+            if consecutive_errors >= POLL_MAX_CONSECUTIVE_ERRORS:
+                return None
+            status_data = None
+
+        if status_data is not None:
             status = status_data.get("status")
-            output = status_data.get("output", "").strip()
-            error = status_data.get("error", "").strip()
-
-            logger.info(f"\nJob {job_id} Status: {status}")
-            
-            if output:
-                logger.info(f"--- Script Output (partial) ---\n{output[-1000:]}\n--- End Output ---") # Show last 1000 chars
-
-            if status in ["COMPLETED", "FAILED", "ERROR","IN_PROGRESS"]:
-                logger.info(f"\n--- Final Job Details for {job_id} ---")
-                logger.info(f"Final Status: {status}")
-                if output:
-                    logger.info(f"Full Output:\n{output}")
-                if error:
-                    logger.info(f"Error Details:\n{error}")
+            new_output = status_data.get("output") or ""
+            next_offset = status_data.get("next_offset")
+            if next_offset is None:
+                # Executor server does not understand `since` and sent the full output back
+                new_bytes = new_output.encode("utf-8")[offset:]
+                new_output = new_bytes.decode("utf-8", errors="replace")
+                next_offset = offset + len(new_bytes)
+            offset = next_offset
+
+            if new_output:
+                output_chunks.append(new_output)
+                logger.info(
+                    f"Job {job_id} output: {len(new_output)} new chars",
+                    extra={"pod_job_id": job_id, "output_tail": new_output[-POLL_LOG_OUTPUT_CHARS:]},
+                )
+                if on_output is not None:
+                    try:
+                        on_output(new_output)
+                    except Exception as e:
+                        # Observers must never break the run they are watching
+                        logger.error(f"Error handling output of job {job_id}: {e}", exc_info=True)
+
+            if status in TERMINAL_STATUSES:
+                error = (status_data.get("error") or "").strip()
+                logger.info(
+                    f"Job {job_id} finished with status {status} after {elapsed:.0f}s",
+                    extra={"pod_job_id": job_id, "error_tail": error[-1000:] or None},
+                )
+                status_data["output"] = "".join(output_chunks)
                 return status_data
-            
-            time.sleep(15) # Poll every 15 seconds
 
-        except requests.exceptions.RequestException as e:
-            print(f"Error polling job status for {job_id}: {e}")
-            return None
-        except Exception as e:
-            print(f"An unexpected error occurred during polling: {e}")
-            return None
+        # Back off while the run is far from done, tighten up around its expected end, and back off
+        # again once it overruns that by POLL_FAST_WINDOW_SECONDS
+        if expected_duration is not None and expected_duration * 0.9 <= elapsed < expected_duration + POLL_FAST_WINDOW_SECONDS:
+            interval = POLL_MIN_INTERVAL
+        else:
+            interval = min(interval * POLL_BACKOFF_FACTOR, POLL_MAX_INTERVAL)
+        time.sleep(min(interval, max(deadline_seconds - elapsed, 0)))
+
+def run_script_on_pod(job, script_content, script_params, expected_duration=None, server_url=SERVER_URL, on_output=None):
+    """
+    Submits a script to the executor server and waits for it to finish.
+    Raises RuntimeError if the script could not be submitted or did not complete.
+    """
+    submit_response = send_script_to_pod(job, script_content, script_params, server_url=server_url)
+    if not submit_response or not submit_response.get("job_id"):
+        raise RuntimeError("Failed to submit script to pod or retrieve job ID.")
 
-def run_finetuning_job(job):
-    print(f"Starting finetuning for job {job.id}...")
+    pod_job_id = submit_response["job_id"]
+    logger.info(f"Successfully submitted job {pod_job_id}. Status: {submit_response.get('status')}")
+
+    final_status_data = poll_job_status(
+        pod_job_id, expected_duration=expected_duration, server_url=server_url, on_output=on_output
+    )
+    if final_status_data is None:
+        raise RuntimeError(f"Could not retrieve final status for pod job {pod_job_id}.")
+    if final_status_data.get("status") != "COMPLETED":
+        error = (final_status_data.get("error") or "").strip()
+        raise RuntimeError(f"Pod job {pod_job_id} ended with status {final_status_data.get('status')}: {error[-1000:]}")
+    return final_status_data
+
+def read_dataset_chunks(path, chunk_bytes):
+    """
+    Yields the file in chunks of about `chunk_bytes` that end on a line boundary, so every chunk is a valid JSONL shard.
+    """
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_bytes)
+            if not chunk:
+                return
+            if not chunk.endswith(b"\n"):
+                chunk += f.readline()
+            yield chunk
+
+def read_parquet_shards(path, chunk_bytes):
+    """
+    Yields the Parquet file as standalone Parquet files of about `chunk_bytes` (uncompressed), one or more
+    row groups each. pyarrow is imported here so the worker only loads it when a job ships a Parquet dataset.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    parquet_file = pq.ParquetFile(path)
+    batches, batch_bytes = [], 0
+
+    def write_shard():
+        sink = pa.BufferOutputStream()
+        pq.write_table(pa.Table.from_batches(batches, schema=parquet_file.schema_arrow), sink, compression="zstd")
+        return sink.getvalue().to_pybytes()
+
+    for batch in parquet_file.iter_batches():
+        batches.append(batch)
+        batch_bytes += batch.nbytes
+        if batch_bytes >= chunk_bytes:
+            yield write_shard()
+            batches, batch_bytes = [], 0
+    if batches:
+        yield write_shard()
+
+def count_dataset_rows(path):
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(path).metadata.num_rows
+    with open(path, "rb") as f:
+        return sum(1 for line in f if line.strip())
+
+def use_streaming(dataset_path):
+    if DATASET_STREAMING in ("true", "false"):
+        return DATASET_STREAMING == "true"
+    return os.path.getsize(dataset_path) > DATASET_STREAMING_THRESHOLD_MB * 1024 * 1024
+
+def upload_dataset_to_pod(job, dataset_path, data_script_content, server_url=SERVER_URL):
+    """
+    Writes the dataset onto the pod's volume in chunks, each decoded by prepare_data.py into its own shard
+    file: a Parquet dataset is split into smaller Parquet files, which are already compressed; a JSONL one
+    into gzip-compressed, line-aligned chunks. Up to DATASET_UPLOAD_PARALLELISM chunks are in flight at once.
+    :return: The pod directory holding the shards (part-00000.parquet, part-00001.parquet, ...).
+    """
+    shard_dir = pod_dataset_dir(job)
+    chunk_bytes = max(1, int(DATASET_UPLOAD_CHUNK_MB * 1024 * 1024))
+    parquet = dataset_path.endswith(".parquet")
+    chunks = read_parquet_shards(dataset_path, chunk_bytes) if parquet else read_dataset_chunks(dataset_path, chunk_bytes)
+    pending = deque()
+    shards = 0
+    with ThreadPoolExecutor(max_workers=DATASET_UPLOAD_PARALLELISM) as executor:
+        for index, chunk in enumerate(chunks):
+            if parquet:
+                params = {
+                    "base64_dataset_content": base64.b64encode(chunk).decode(),
+                    "output_path": f"{shard_dir}/part-{index:05d}.parquet",
+                }
+            else:
+                params = {
+                    "base64_dataset_content": base64.b64encode(gzip.compress(chunk, compresslevel=1)).decode(),
+                    "compression": "gzip",
+                    "output_path": f"{shard_dir}/part-{index:05d}.jsonl",
+                }
+            # expected_duration=0 polls at the minimum interval: a chunk is written in seconds
+            pending.append(executor.submit(
+                run_script_on_pod, job, data_script_content, params, expected_duration=0, server_url=server_url
+            ))
+            shards += 1
+            if len(pending) >= DATASET_UPLOAD_PARALLELISM:
+                pending.popleft().result()
+        for future in pending:
+            future.result()
+    metrics.UPLOAD_BYTES.labels("pod").inc(os.path.getsize(dataset_path))
+    logger.info(f"Uploaded dataset of job {job.id} to {shard_dir} in {shards} shard(s)", extra={"job_id": job.id})
+    return shard_dir
+
+def remove_dataset_from_pod(job, data_script_content, server_url=SERVER_URL):
+    """
+    Deletes the job's shard directory from the pod's volume. Failures are logged, not raised, so they
+    never change the outcome of the job.
+    """
+    try:
+        run_script_on_pod(job, data_script_content, {"remove_dir": pod_dataset_dir(job)}, expected_duration=0, server_url=server_url)
+    except Exception as e:
+        logger.error(f"Could not remove dataset of job {job.id} from {server_url}: {e}", extra={"job_id": job.id})
+
+def run_finetuning_job(job, server_url=None, on_output=None):
+    """
+    Runs data preparation and finetuning for the job on a training pod.
+    :param server_url: Executor server of the pod the job was placed on. Defaults to RUNPOD_IP.
+    :param on_output: Optional callable receiving the training script's output as it arrives.
+    """
+    logger.info(f"Starting finetuning for job {job.id}...", extra={"job_id": job.id})
 
         # --- Fine-tuning Script to send ---
     # This reads the content of the finetune_template.py
     DATA_SCRIPT_PATH = "prepare_data.py"
     FINE_TUNE_SCRIPT_PATH = "finetune_template.py"
-    DATASET_PATH = f"/app/uploads/{job.dataset_filename}"
+    DATASET_PATH = os.path.join(UPLOAD_DIR, job.prepared_dataset_filename or job.dataset_filename)
 
     if not os.path.exists(DATASET_PATH):
-        print(f"Error: Fine-tune script '{DATASET_PATH}' not found.")
-        exit(1)
+        raise FileNotFoundError(f"Dataset file not found at {DATASET_PATH}")
 
     with open(DATA_SCRIPT_PATH, "r") as f:
         data_script_content = f.read()    
 
-    with open(DATASET_PATH, "rb") as f:
-            dataset_content = base64.b64encode(f.read()).decode() 
-
     #dataset_script_content = f"echo '{dataset_content}' | base64 -d > /workspace/dataset.jsonl"     
 
-    DATA_JOB_PARAMETERS = {
-            "base64_dataset_content": dataset_content
-        }
+    # Streaming training needs the row count up front to size the schedule; dedup already counted it
+    dataset_streaming = use_streaming(DATASET_PATH)
+    dataset_rows = (job.dataset_stats or {}).get("rows_out") or (count_dataset_rows(DATASET_PATH) if dataset_streaming else None)
 
     if not os.path.exists(FINE_TUNE_SCRIPT_PATH):
-        print(f"Error: Fine-tune script '{FINE_TUNE_SCRIPT_PATH}' not found.")
-        exit(1)
+        raise FileNotFoundError(f"Fine-tune script '{FINE_TUNE_SCRIPT_PATH}' not found.")
 
     with open(FINE_TUNE_SCRIPT_PATH, "r") as f:
         finetune_script_content = f.read()
 
-    print(f'wandb api key :  {os.getenv("WANDB_API_KEY")}')
      
 
     # --- Parameters for the fine-tuning job ---
     # These will be passed to your finetune_template.py via the params_file
     JOB_PARAMETERS = {
         "base_model": f"{job.base_model}",
-        "dataset_path": "/workspace/dataset.jsonl", # This must exist on the Pod's volume
-        "output_dir": "/workspace/output",
+        "dataset_path": pod_dataset_dir(job), # Shard directory written by upload_dataset_to_pod
+        "dataset_streaming": dataset_streaming,
+        "dataset_rows": dataset_rows,
+        "shuffle_buffer_size": DATASET_SHUFFLE_BUFFER,
+        "output_dir": pod_output_dir(job),
         "epochs": 2,
         "batch_size": 4,
         "learning_rate": 2e-4,
         "gradient_accumulation_steps": 4,
-        "hf_repo_id": f"{HFACE_USERNAME}/Finetuned-{job.new_model_name}", # !!! IMPORTANT: CHANGE THIS !!!
+        "hf_repo_id": finetuned_repo_id(job), # !!! IMPORTANT: CHANGE THIS !!!
         "hf_private_repo": False, # Set to True for a private repo
         "hf_commit_message": "Fine-tuning complete on RunPod with custom data",
         "new_model_name":f"Finetuned-{job.new_model_name}",
@@ -141,52 +343,67 @@ def run_finetuning_job(job):
     }
 
     # Ensure Pod IP and Port are correctly configured
-    if POD_IP is None:
-        print("Please configure your RunPod Pod IP and Mapped HTTP Port in client_script.py.")
-        exit(1)
+    server_url = server_url or (SERVER_URL if POD_IP else None)
+    if server_url is None:
+        raise RuntimeError("No pod available: configure RUNPOD_IP or register pods in POD_REGISTRY_FILE.")
 
-    print(f"Connecting to Pod at {SERVER_URL}")
+    logger.info(f"Connecting to Pod at {server_url}", extra={"job_id": job.id})
 
-    # Step 1: Send the fine-tuning script and parameters
-    submit_response = send_script_to_pod(job, data_script_content, DATA_JOB_PARAMETERS)
+    # Step 0: Warm the pod's model cache in parallel with the dataset upload
+    PREFETCH_PARAMETERS = {
+        "base_model": JOB_PARAMETERS["base_model"],
+        "prefetch_only": True,
+        "HF_TOKEN": JOB_PARAMETERS["HF_TOKEN"],
+    }
+    prefetch_response = send_script_to_pod(job, finetune_script_content, PREFETCH_PARAMETERS, server_url=server_url)
 
-    if submit_response and submit_response.get("job_id"):
-        job_id = submit_response["job_id"]
-        print(f"Successfully submitted job {job_id}. Status: {submit_response.get('status')}")
+    try:
+        # Step 1: Write the dataset onto the pod's volume
+        upload_dataset_to_pod(job, DATASET_PATH, data_script_content, server_url=server_url)
 
-        # Step 2: Poll for job status
-        final_status_data = poll_job_status(job_id)
+        if prefetch_response and prefetch_response.get("job_id"):
+            prefetch_status = poll_job_status(prefetch_response["job_id"], server_url=server_url)
+            if not prefetch_status or prefetch_status.get("status") != "COMPLETED":
+                # Not fatal: the finetuning run loads the model itself on a cache miss
+                logger.info(f"Model prefetch for job {job.id} did not complete, training will load the model cold.")
 
-        if final_status_data:
-            logger.info(f"\nJob {job_id} finished with final status: {final_status_data.get('status')}")
-            # You can add logic here to trigger further actions based on status
-        else:
-            logger.info(f"Could not retrieve final status for job {job_id}.")
-    else:
-        logger.info("Failed to submit job or retrieve job ID.")
-        
-     # Step 1: Send the fine-tuning script and parameters
-    logger.info(f"job parameters : {JOB_PARAMETERS}")
-    submit_response = send_script_to_pod(job, finetune_script_content, JOB_PARAMETERS)
-
-    if submit_response and submit_response.get("job_id"):
-        job_id = submit_response["job_id"]
-        logger.info(f"Successfully submitted job {job_id}. Status: {submit_response.get('status')}")
-
-        # Step 2: Poll for job status
-        final_status_data = poll_job_status(job_id)
-        if final_status_data:
-            logger.info(f"job {job_id}. final_status_data Status: {final_status_data.get('status')}")
-            while final_status_data is None or (final_status_data.get('status') != 'COMPLETED' and final_status_data.get('status') != 'FAILED'):
-                final_status_data = poll_job_status(job_id)
-                if final_status_data:
-                    logger.info(f"job {job_id}. final_status_data Status: {final_status_data.get('status')}")
-
-        if final_status_data:
-            logger.info(f"\nJob {job_id} finished with final status: {final_status_data.get('status')}")
-            # You can add logic here to trigger further actions based on status
-        else:
-            logger.info(f"Could not retrieve final status for job {job_id}.")
-    else:
-        logger.info("Failed to submit job or retrieve job ID.")    
-        
\ No newline at end of file
+        # Step 2: Send the fine-tuning script and parameters, then wait for training to finish
+        # Secrets in the parameters are redacted by the logger
+        logger.info("Submitting finetuning script", extra={"job_id": job.id, "job_parameters": JOB_PARAMETERS})
+        return run_script_on_pod(
+            job, finetune_script_content, JOB_PARAMETERS, expected_duration=EXPECTED_FINETUNE_SECONDS, server_url=server_url,
+            on_output=on_output,
+        )
+    finally:
+        # Step 3: The shards are only needed for this run, whether it succeeded or failed
+        remove_dataset_from_pod(job, data_script_content, server_url=server_url)
+
+def run_export_job(job, server_url=None):
+    """
+    Runs an export job on a training pod: merges the finetuned adapter into its base model and pushes
+    the merged safetensors shards to their own repo.
+    :param job: Export job whose input_data holds `adapter_repo` and `merged_repo`.
+    :param server_url: Executor server of the pod the job was placed on. Defaults to RUNPOD_IP.
+    :return: The merged model repo id.
+    """
+    EXPORT_SCRIPT_PATH = "export_template.py"
+    if not os.path.exists(EXPORT_SCRIPT_PATH):
+        raise FileNotFoundError(f"Export script '{EXPORT_SCRIPT_PATH}' not found.")
+    with open(EXPORT_SCRIPT_PATH, "r") as f:
+        export_script_content = f.read()
+
+    server_url = server_url or (SERVER_URL if POD_IP else None)
+    if server_url is None:
+        raise RuntimeError("No pod available: configure RUNPOD_IP or register pods in POD_REGISTRY_FILE.")
+
+    adapter_repo = job.input_data["adapter_repo"]
+    merged_repo = job.input_data.get("merged_repo") or merged_repo_id(adapter_repo)
+    EXPORT_PARAMETERS = {
+        "adapter_repo": adapter_repo,
+        "hf_repo_id": merged_repo,
+        "max_shard_size": MERGED_MAX_SHARD_SIZE,
+        "HF_TOKEN": os.getenv("HUGGING_FACE_TOKEN"),
+    }
+    logger.info(f"Exporting merged weights of {adapter_repo} to {merged_repo} on {server_url}")
+    run_script_on_pod(job, export_script_content, EXPORT_PARAMETERS, expected_duration=EXPECTED_EXPORT_SECONDS, server_url=server_url)
+    return merged_repo
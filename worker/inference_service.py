@@ -0,0 +1,514 @@
+# inference_service.py
+# Long-lived inference service for finetuned models.
+# Finetuned repos are LoRA adapters over a handful of base models, so the service keeps one copy
+# of each base model resident and hot-swaps adapters from an LRU cache instead of reloading the
+# base for every request (which is what inference.py does per run).
+#
+# Repos that have a pre-merged export (written by the worker's export job) skip the adapter entirely
+# and load the merged safetensors checkpoint, which transformers memory-maps, unless their base model is
+# already resident: then the adapter is swapped onto it, which is much cheaper than loading a full model.
+# With --backend cpu-int8 every finetuned model is served as its own merged checkpoint with
+# int8 dynamic quantization, up to --max-merged-models resident, so rarely used models can run on cheap CPU nodes.
+#
+# Runs on CPU with a tiny model for local testing, e.g.:
+#   python inference_service.py --port 8001
+#   python inference_service.py --port 8001 --backend cpu-int8
+#   curl -X POST localhost:8001/generate -d '{"prompt": "Hi", "huggingface_repo": "<adapter repo>"}'
+#   curl localhost:8001/metrics
+import argparse
+import copy
+import gc
+import json
+import os
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer, DynamicCache, StoppingCriteria, StoppingCriteriaList
+from peft import PeftModel, PeftConfig
+from shared.utils import logger, metrics
+import model_export
+
+logger = logger.setup_logger('inference_service')
+
+INFERENCE_ADAPTER_CACHE_SIZE = int(os.getenv("INFERENCE_ADAPTER_CACHE_SIZE", "8"))
+INFERENCE_MAX_BASE_MODELS = int(os.getenv("INFERENCE_MAX_BASE_MODELS", "1"))
+# Merged checkpoints are full models of their own, kept in a separate pool so they never evict a shared base
+INFERENCE_MAX_MERGED_MODELS = int(os.getenv("INFERENCE_MAX_MERGED_MODELS", "1"))
+DEFAULT_MAX_NEW_TOKENS = 100
+# Requests arriving within the window are generated together, up to the batch size
+INFERENCE_MAX_BATCH_SIZE = int(os.getenv("INFERENCE_MAX_BATCH_SIZE", "8"))
+INFERENCE_BATCH_WINDOW_MS = float(os.getenv("INFERENCE_BATCH_WINDOW_MS", "10"))
+# "adapter": shared base models with hot-swapped LoRA adapters
+# "cpu-int8": one merged, int8-quantized model per finetuned repo, cached on disk under MERGED_MODELS_DIR
+INFERENCE_BACKENDS = ("adapter", "cpu-int8")
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "adapter")
+# Exports are looked up under MERGED_MODELS_DIR first, then as "<adapter repo><suffix>" on the Hub
+INFERENCE_USE_MERGED_REPOS = os.getenv("INFERENCE_USE_MERGED_REPOS", "true").lower() == "true"
+MERGED_REPO_SUFFIX = os.getenv("MERGED_REPO_SUFFIX", "-merged")
+MERGED_LOOKUP_TTL_SECONDS = float(os.getenv("MERGED_LOOKUP_TTL_SECONDS", "300"))
+
+# --- Prefix KV cache ---
+# Prompts built from the training templates all start with the same preamble, so its key/value cache is
+# computed once per (base model, adapter) and reused. These must match the templates in
+# finetune_template.py (ALPACA_PROMPT) and finetune.py (alpaca_prompt).
+DEFAULT_PROMPT_PREFIXES = [
+    "Below is an instruction that describes a task, paired with an input that provides further context. "
+    "Write a response that appropriately completes the request.\n\n",
+    "Below is an instruction that describes a task. Write a response that appropriately completes the request.\n\n",
+]
+PROMPT_PREFIXES = json.loads(os.getenv("INFERENCE_PROMPT_PREFIXES", "null")) or DEFAULT_PROMPT_PREFIXES
+INFERENCE_PREFIX_CACHE_SIZE = int(os.getenv("INFERENCE_PREFIX_CACHE_SIZE", "16"))
+
+
+def adapter_name_for(repo_id):
+    # PEFT adapter names become module keys, so they cannot contain "/" or "."
+    return re.sub(r"[^A-Za-z0-9_]", "_", repo_id)
+
+
+class GenerationRequest:
+    """
+    One prompt waiting for a batch slot. The batcher fills in `result` or `error` and sets `done`.
+    """
+    def __init__(self, prompt, huggingface_repo, max_new_tokens=DEFAULT_MAX_NEW_TOKENS, stop=None, prefix=None):
+        self.prompt = prompt
+        self.prefix = prefix # Registered prompt prefix this prompt starts with, if any
+        self.huggingface_repo = huggingface_repo
+        self.max_new_tokens = max_new_tokens
+        self.stop = [s for s in (stop or []) if s]
+        self.result = None
+        self.error = None
+        self.generated_tokens = 0
+        self.done = threading.Event()
+
+
+class PerRequestStoppingCriteria(StoppingCriteria):
+    """
+    Marks each row of a batch finished once it has produced its own max_new_tokens or hit one of its stop
+    strings. Generation ends when every row is finished, so short requests do not pay for long ones.
+    """
+    def __init__(self, requests, prompt_length, tokenizer):
+        self.requests = requests
+        self.prompt_length = prompt_length
+        self.tokenizer = tokenizer
+        # Enough trailing tokens to contain the longest stop string
+        self.stop_window = max([len(tokenizer.encode(s, add_special_tokens=False)) for r in requests for s in r.stop] or [0]) + 2
+
+    def __call__(self, input_ids, scores, **kwargs):
+        generated = input_ids.shape[1] - self.prompt_length
+        finished = []
+        for row, request in enumerate(self.requests):
+            if generated >= request.max_new_tokens:
+                finished.append(True)
+            elif request.stop:
+                tail = self.tokenizer.decode(input_ids[row, -min(self.stop_window, generated):], skip_special_tokens=True)
+                finished.append(any(s in tail for s in request.stop))
+            else:
+                finished.append(False)
+        return torch.tensor(finished, dtype=torch.bool, device=input_ids.device)
+
+
+class BaseModelEntry:
+    """
+    A resident base model with the LoRA adapters currently loaded on top of it, most recently used last.
+    Merged entries already have a single adapter folded into their weights.
+    """
+    def __init__(self, name, model, tokenizer, merged=False):
+        self.name = name
+        self.model = model
+        self.tokenizer = tokenizer
+        self.merged = merged
+        self.adapters = OrderedDict() # adapter repo id -> PEFT adapter name
+        self.lock = threading.Lock() # The active adapter is model-global state
+
+
+class AdapterInferenceService:
+    def __init__(self, adapter_capacity=INFERENCE_ADAPTER_CACHE_SIZE, base_capacity=INFERENCE_MAX_BASE_MODELS,
+                 merged_capacity=INFERENCE_MAX_MERGED_MODELS, device=None,
+                 max_batch_size=INFERENCE_MAX_BATCH_SIZE, batch_window_ms=INFERENCE_BATCH_WINDOW_MS,
+                 prefix_cache_size=INFERENCE_PREFIX_CACHE_SIZE, prompt_prefixes=PROMPT_PREFIXES,
+                 backend=INFERENCE_BACKEND, merged_models_dir=model_export.MERGED_MODELS_DIR,
+                 use_merged_repos=INFERENCE_USE_MERGED_REPOS):
+        if backend not in INFERENCE_BACKENDS:
+            raise ValueError(f"Unknown inference backend {backend!r}, expected one of {INFERENCE_BACKENDS}")
+        if backend == "cpu-int8":
+            device = "cpu" # Quantized Linear layers only have CPU kernels
+        self.backend = backend
+        self.merged_models_dir = merged_models_dir
+        self.use_merged_repos = use_merged_repos
+        self.merged_checkpoints = {} # adapter repo id -> (merged checkpoint or None, lookup time)
+        self.adapter_capacity = max(1, adapter_capacity)
+        self.base_capacity = max(1, base_capacity)
+        self.merged_capacity = max(1, merged_capacity)
+        self.max_batch_size = max(1, max_batch_size)
+        self.batch_window_seconds = batch_window_ms / 1000.0
+        self.pending = queue.Queue()
+        self.batcher = None
+        self.prefix_cache_size = prefix_cache_size
+        self.prompt_prefixes = sorted(prompt_prefixes, key=len, reverse=True) # Longest match wins
+        self.prefix_caches = OrderedDict() # (base, adapter repo, prefix) -> (prefix token ids, DynamicCache)
+        self.prefix_cache_hits = 0
+        self.prefix_cache_misses = 0
+        self.prefix_cache_mismatches = 0 # Batches whose prompts do not tokenize to the cached prefix ids
+        self.device = torch.device(device or ("cuda" if torch.cuda.is_available() else "cpu"))
+        self.bases = OrderedDict() # base model name -> BaseModelEntry
+        self.merged_models = OrderedDict() # finetuned repo id -> merged BaseModelEntry
+        self.bases_lock = threading.Lock() # Guards both pools
+        self.adapter_base_names = {} # adapter repo id -> base model name, saves a config fetch per request
+
+    def base_model_for(self, adapter_repo):
+        if adapter_repo not in self.adapter_base_names:
+            self.adapter_base_names[adapter_repo] = PeftConfig.from_pretrained(adapter_repo).base_model_name_or_path
+        return self.adapter_base_names[adapter_repo]
+
+    def load_base(self, base_name):
+        model = AutoModelForCausalLM.from_pretrained(base_name).to(self.device)
+        model.eval()
+        return model, AutoTokenizer.from_pretrained(base_name)
+
+    def merged_checkpoint_for(self, adapter_repo):
+        """
+        Returns the pre-merged export of `adapter_repo` (a local directory or a Hub repo id), or None.
+        Misses are re-checked after MERGED_LOOKUP_TTL_SECONDS so an export finished later is picked up.
+        """
+        cached = self.merged_checkpoints.get(adapter_repo)
+        if cached is not None and (cached[0] is not None or time.time() - cached[1] < MERGED_LOOKUP_TTL_SECONDS):
+            metrics.record_cache_lookup("merged_lookup", hit=True)
+            return cached[0]
+        metrics.record_cache_lookup("merged_lookup", hit=False)
+
+        checkpoint = model_export.merged_model_dir(adapter_repo, self.merged_models_dir)
+        if not model_export.is_merged_model_ready(checkpoint):
+            checkpoint = None
+            if self.use_merged_repos and model_export.merged_repo_exists(adapter_repo + MERGED_REPO_SUFFIX):
+                checkpoint = adapter_repo + MERGED_REPO_SUFFIX
+        self.merged_checkpoints[adapter_repo] = (checkpoint, time.time())
+        return checkpoint
+
+    def load_merged(self, adapter_repo):
+        """
+        Loads the merged checkpoint for `adapter_repo`. The cpu-int8 backend merges and caches it on disk
+        when there is no export yet, and quantizes its Linear layers to int8.
+        """
+        checkpoint = self.merged_checkpoint_for(adapter_repo)
+        if self.backend == "cpu-int8":
+            if checkpoint is None:
+                checkpoint = model_export.merge_adapter(adapter_repo, model_export.merged_model_dir(adapter_repo, self.merged_models_dir))
+            return model_export.load_int8_cpu_model(checkpoint), AutoTokenizer.from_pretrained(checkpoint)
+
+        dtype = "auto" if self.device.type == "cuda" else torch.float32
+        model = AutoModelForCausalLM.from_pretrained(checkpoint, torch_dtype=dtype).to(self.device)
+        model.eval()
+        return model, AutoTokenizer.from_pretrained(checkpoint)
+
+    def get_base(self, base_name, merged=False):
+        """
+        Returns the resident entry for `base_name`, loading it and evicting the least recently used one of
+        the same pool if needed.
+        :param merged: `base_name` is a finetuned repo to load as a merged model rather than a base model.
+        """
+        pool, capacity = (self.merged_models, self.merged_capacity) if merged else (self.bases, self.base_capacity)
+        with self.bases_lock:
+            entry = pool.get(base_name)
+            metrics.record_cache_lookup("merged_model" if merged else "base_model", hit=entry is not None)
+            if entry is not None:
+                pool.move_to_end(base_name)
+                return entry
+
+            while len(pool) >= capacity:
+                evicted_name, evicted = pool.popitem(last=False)
+                logger.info(f"Evicting {'merged model' if merged else 'base model'} {evicted_name}")
+                del evicted
+                gc.collect()
+                if torch.cuda.is_available():
+                    torch.cuda.empty_cache()
+
+            start_time = time.time()
+            model, tokenizer = self.load_merged(base_name) if merged else self.load_base(base_name)
+            # Batched decoder-only generation needs left padding so every prompt ends at the same position
+            tokenizer.padding_side = "left"
+            if tokenizer.pad_token is None:
+                tokenizer.pad_token = tokenizer.eos_token
+            entry = BaseModelEntry(base_name, model, tokenizer, merged=merged)
+            pool[base_name] = entry
+            logger.info(f"Loaded {'merged model' if merged else 'base model'} {base_name} on {self.device} "
+                        f"in {time.time() - start_time:.1f}s")
+            return entry
+
+    def activate_adapter(self, entry, adapter_repo):
+        """
+        Makes `adapter_repo` the active adapter on the base, loading it and evicting the least recently
+        used adapter if needed. Must be called with entry.lock held.
+        """
+        metrics.record_cache_lookup("adapter", hit=adapter_repo in entry.adapters)
+        if adapter_repo in entry.adapters:
+            entry.adapters.move_to_end(adapter_repo)
+            entry.model.set_adapter(entry.adapters[adapter_repo])
+            return
+
+        start_time = time.time()
+        adapter_name = adapter_name_for(adapter_repo)
+        if isinstance(entry.model, PeftModel):
+            entry.model.load_adapter(adapter_repo, adapter_name=adapter_name)
+        else:
+            entry.model = PeftModel.from_pretrained(entry.model, adapter_repo, adapter_name=adapter_name)
+            entry.model.eval()
+        entry.model.set_adapter(adapter_name)
+        entry.adapters[adapter_repo] = adapter_name
+        logger.info(f"Loaded adapter {adapter_repo} on {entry.name} in {time.time() - start_time:.2f}s")
+
+        # Load before evicting so the PEFT model always has an active adapter
+        while len(entry.adapters) > self.adapter_capacity:
+            evicted_repo, evicted_name = entry.adapters.popitem(last=False)
+            entry.model.delete_adapter(evicted_name)
+            # Cached prefixes were computed with the evicted adapter's weights
+            for key in [key for key in self.prefix_caches if key[:2] == (entry.name, evicted_repo)]:
+                del self.prefix_caches[key]
+            logger.info(f"Evicted adapter {evicted_repo} from {entry.name}")
+
+    def match_prefix(self, prompt):
+        if self.prefix_cache_size <= 0:
+            return None
+        for prefix in self.prompt_prefixes:
+            if len(prompt) > len(prefix) and prompt.startswith(prefix):
+                return prefix
+        return None
+
+    def get_prefix_cache(self, entry, huggingface_repo, prefix):
+        """
+        Returns (prefix token ids, KV cache) for `prefix` under the active adapter, computing it on a miss.
+        Must be called with entry.lock held and the adapter already active.
+        """
+        key = (entry.name, huggingface_repo, prefix)
+        cached = self.prefix_caches.get(key)
+        if cached is not None:
+            self.prefix_caches.move_to_end(key)
+            self.prefix_cache_hits += 1
+            metrics.record_cache_lookup("prefix", hit=True)
+            return cached
+
+        self.prefix_cache_misses += 1
+        metrics.record_cache_lookup("prefix", hit=False)
+        prefix_ids = entry.tokenizer(prefix, return_tensors="pt").input_ids.to(self.device)
+        with torch.inference_mode():
+            cache = entry.model(input_ids=prefix_ids, past_key_values=DynamicCache(), use_cache=True).past_key_values
+        self.prefix_caches[key] = (prefix_ids, cache)
+        while len(self.prefix_caches) > self.prefix_cache_size:
+            self.prefix_caches.popitem(last=False)
+        return prefix_ids, cache
+
+    def build_inputs(self, entry, requests):
+        """
+        Tokenizes a batch. With a shared cached prefix, the prompt tails are left padded after the prefix
+        ([prefix | pad | tail]); the attention mask hides the padding and the prefix positions are served
+        from the KV cache, so only the tails are prefilled.
+        Each prompt is tokenized whole and the cache is only used when its leading ids are exactly the
+        prefix's: BPE and SentencePiece tokenizers can merge across the prefix boundary, and tokenizing the
+        tail on its own would then feed the model ids the uncached path never sees.
+        :return: (generate kwargs, prompt length in tokens)
+        """
+        prefix = requests[0].prefix
+        if prefix is None:
+            return self.tokenize_uncached(entry, requests)
+
+        prefix_ids, prefix_cache = self.get_prefix_cache(entry, requests[0].huggingface_repo, prefix)
+        prefix_list = prefix_ids[0].tolist()
+        prefix_length = len(prefix_list)
+        prompt_ids = entry.tokenizer([r.prompt for r in requests]).input_ids
+        if any(len(ids) <= prefix_length or ids[:prefix_length] != prefix_list for ids in prompt_ids):
+            self.prefix_cache_mismatches += 1
+            return self.tokenize_uncached(entry, requests)
+
+        tails = [ids[prefix_length:] for ids in prompt_ids]
+        width = max(len(tail) for tail in tails)
+        pad_token_id = entry.tokenizer.pad_token_id
+        tail_ids = torch.tensor([[pad_token_id] * (width - len(tail)) + tail for tail in tails], device=self.device)
+        tail_mask = torch.tensor([[0] * (width - len(tail)) + [1] * len(tail) for tail in tails], device=self.device)
+        batch_size = len(requests)
+        input_ids = torch.cat([prefix_ids.repeat(batch_size, 1), tail_ids], dim=1)
+        attention_mask = torch.cat([torch.ones_like(prefix_ids).repeat(batch_size, 1), tail_mask], dim=1)
+        # generate() extends the cache in place, so each batch works on its own copy
+        past_key_values = copy.deepcopy(prefix_cache)
+        past_key_values.batch_repeat_interleave(batch_size)
+        return {"input_ids": input_ids, "attention_mask": attention_mask, "past_key_values": past_key_values}, input_ids.shape[1]
+
+    def tokenize_uncached(self, entry, requests):
+        inputs = entry.tokenizer([r.prompt for r in requests], return_tensors="pt", padding=True).to(self.device)
+        return dict(inputs), inputs["input_ids"].shape[1]
+
+    def generate_batch(self, requests):
+        """
+        Runs one forward generation for requests that share the same adapter (and prompt prefix)
+        and demultiplexes the results.
+        """
+        huggingface_repo = requests[0].huggingface_repo
+        if self.backend == "cpu-int8":
+            entry = self.get_base(huggingface_repo, merged=True)
+        else:
+            base_name = self.base_model_for(huggingface_repo)
+            # A resident base serves the repo for the cost of an adapter load; a merged checkpoint is a full model load
+            if base_name not in self.bases and (huggingface_repo in self.merged_models or self.merged_checkpoint_for(huggingface_repo) is not None):
+                entry = self.get_base(huggingface_repo, merged=True)
+            else:
+                entry = self.get_base(base_name)
+        with entry.lock:
+            if not entry.merged:
+                self.activate_adapter(entry, huggingface_repo)
+            inputs, prompt_length = self.build_inputs(entry, requests)
+            stopping_criteria = StoppingCriteriaList([PerRequestStoppingCriteria(requests, prompt_length, entry.tokenizer)])
+            with torch.inference_mode():
+                outputs = entry.model.generate(
+                    **inputs,
+                    max_new_tokens=max(r.max_new_tokens for r in requests),
+                    num_return_sequences=1,
+                    stopping_criteria=stopping_criteria,
+                    pad_token_id=entry.tokenizer.pad_token_id,
+                )
+
+        for row, request in enumerate(requests):
+            new_tokens = outputs[row, prompt_length:][:request.max_new_tokens]
+            new_tokens = new_tokens[new_tokens != entry.tokenizer.pad_token_id]
+            text = entry.tokenizer.decode(new_tokens, skip_special_tokens=True)
+            for stop in request.stop:
+                if stop in text:
+                    text = text[:text.index(stop)]
+            request.generated_tokens = int(new_tokens.shape[0])
+            request.result = text
+
+    def collect_batch(self):
+        """
+        Blocks for the first pending request, then gathers whatever else arrives within the batch window.
+        """
+        batch = [self.pending.get()]
+        deadline = time.time() + self.batch_window_seconds
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.pending.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def run_batcher(self):
+        while True:
+            batch = self.collect_batch()
+            groups = OrderedDict()
+            for request in batch:
+                groups.setdefault((request.huggingface_repo, request.prefix), []).append(request)
+            for requests in groups.values():
+                try:
+                    self.generate_batch(requests)
+                except Exception as e:
+                    logger.error(f"Batched generation failed for {requests[0].huggingface_repo}: {e}", exc_info=True)
+                    for request in requests:
+                        request.error = e
+                finally:
+                    for request in requests:
+                        request.done.set()
+
+    def submit(self, request):
+        request.prefix = self.match_prefix(request.prompt)
+        if self.batcher is None:
+            with self.bases_lock:
+                if self.batcher is None:
+                    self.batcher = threading.Thread(target=self.run_batcher, name="inference-batcher", daemon=True)
+                    self.batcher.start()
+        self.pending.put(request)
+        return request
+
+    def generate(self, prompt, huggingface_repo, max_new_tokens=DEFAULT_MAX_NEW_TOKENS, stop=None):
+        """
+        Generates a completion for `prompt` with the finetuned adapter in `huggingface_repo`,
+        batched with any other requests that arrive at the same time.
+        :return: The generated text, without the prompt.
+        """
+        request = self.submit(GenerationRequest(prompt, huggingface_repo, max_new_tokens=max_new_tokens, stop=stop))
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+
+class InferenceRequestHandler(BaseHTTPRequestHandler):
+    service = None
+
+    def _send_json(self, status_code, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path != "/metrics":
+            self._send_json(404, {"error": "Not found"})
+            return
+        body, content_type = metrics.render_metrics()
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if self.path != "/generate":
+            self._send_json(404, {"error": "Not found"})
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        if not payload.get("prompt") or not payload.get("huggingface_repo"):
+            self._send_json(400, {"error": "prompt and huggingface_repo are required"})
+            return
+
+        try:
+            output = self.service.generate(
+                payload["prompt"],
+                payload["huggingface_repo"],
+                max_new_tokens=int(payload.get("max_new_tokens", DEFAULT_MAX_NEW_TOKENS)),
+                stop=payload.get("stop"),
+            )
+            self._send_json(200, {"inference_output": output, "job_id": payload.get("job_id"), "status": "success"})
+        except Exception as e:
+            logger.error(f"Inference failed for {payload.get('huggingface_repo')}: {e}", exc_info=True)
+            self._send_json(500, {"inference_output": None, "job_id": payload.get("job_id"), "status": "error", "error": str(e)})
+
+    def log_message(self, format, *args):
+        pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Adapter-aware inference service")
+    parser.add_argument("--host", type=str, default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--adapter-cache-size", type=int, default=INFERENCE_ADAPTER_CACHE_SIZE)
+    parser.add_argument("--max-base-models", type=int, default=INFERENCE_MAX_BASE_MODELS)
+    parser.add_argument("--max-merged-models", type=int, default=INFERENCE_MAX_MERGED_MODELS)
+    parser.add_argument("--device", type=str, default=None, help="cuda or cpu; defaults to cuda when available.")
+    parser.add_argument("--max-batch-size", type=int, default=INFERENCE_MAX_BATCH_SIZE)
+    parser.add_argument("--batch-window-ms", type=float, default=INFERENCE_BATCH_WINDOW_MS)
+    parser.add_argument("--backend", type=str, default=INFERENCE_BACKEND, choices=INFERENCE_BACKENDS)
+    parser.add_argument("--merged-models-dir", type=str, default=model_export.MERGED_MODELS_DIR,
+                        help="Where merged exports are looked up, and cached by the cpu-int8 backend.")
+    args = parser.parse_args()
+
+    InferenceRequestHandler.service = AdapterInferenceService(
+        adapter_capacity=args.adapter_cache_size,
+        base_capacity=args.max_base_models,
+        merged_capacity=args.max_merged_models,
+        device=args.device,
+        max_batch_size=args.max_batch_size,
+        batch_window_ms=args.batch_window_ms,
+        backend=args.backend,
+        merged_models_dir=args.merged_models_dir,
+    )
+    server = ThreadingHTTPServer((args.host, args.port), InferenceRequestHandler)
+    logger.info(f"Inference service listening on {args.host}:{args.port}")
+    server.serve_forever()
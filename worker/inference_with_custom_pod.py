@@ -5,9 +5,6 @@ import time
 import base64
 from dotenv import load_dotenv
 from shared.utils import logger
-from sqlalchemy import create_engine, update
-from sqlalchemy.orm import sessionmaker
-from shared.db.base import Job
 
 logger = logger.setup_logger('finetune_with custom_pod')
 
@@ -22,20 +19,6 @@ STATUS_ENDPOINT = f"{SERVER_URL}/job_status"
 
 output_dir="/workspace/output"
 
-DATABASE_URL = os.getenv("DATABASE_URL")
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-def update_job_status(db, job_id, status, error_message=None):
-    stmt = (
-        update(Job)
-        .where(Job.id == job_id)
-        .values(status=status, error_message=error_message)
-    )
-    db.execute(stmt)
-    db.commit()
-    print(f"Updated job {job_id} to status {status}")
-
 # --- Functions to interact with the executor server ---
 def send_script_to_pod(job, script_content, script_params):
     payload = {
@@ -72,7 +55,7 @@ def poll_job_status(job_id):
                 logger.info(f"\n--- Final Job Details for {job_id} ---")
                 logger.info(f"Final Status: {status}")
                 if output:
-                    logger.info(f"Full Output:\n{output}")
+                    logger.info(f"Output (last 1000 chars):\n{output[-1000:]}")
                 if error:
                     logger.info(f"Error Details:\n{error}")
                 return status_data
@@ -80,14 +63,14 @@ def poll_job_status(job_id):
             time.sleep(15) # Poll every 15 seconds
 
         except requests.exceptions.RequestException as e:
-            print(f"Error polling job status for {job_id}: {e}")
+            logger.info(f"Error polling job status for {job_id}: {e}")
             return None
         except Exception as e:
-            print(f"An unexpected error occurred during polling: {e}")
+            logger.info(f"An unexpected error occurred during polling: {e}")
             return None
 
 def run_finetuning_job(job):
-    print(f"Starting finetuning for job {job.id}...")
+    logger.info(f"Starting finetuning for job {job.id}...")
 
         # --- Fine-tuning Script to send ---
     # This reads the content of the finetune_template.py
@@ -110,17 +93,17 @@ def run_finetuning_job(job):
 
     # Ensure Pod IP and Port are correctly configured
     if POD_IP is None:
-        print("Please configure your RunPod Pod IP and Mapped HTTP Port in client_script.py.")
+        logger.info("Please configure your RunPod Pod IP and Mapped HTTP Port in client_script.py.")
         exit(1)
 
-    print(f"Connecting to Pod at {SERVER_URL}")
+    logger.info(f"Connecting to Pod at {SERVER_URL}")
 
     # Step 1: Send the fine-tuning script and parameters
     submit_response = send_script_to_pod(job, data_script_content, DATA_JOB_PARAMETERS)
 
     if submit_response and submit_response.get("job_id"):
         job_id = submit_response["job_id"]
-        print(f"Successfully submitted job {job_id}. Status: {submit_response.get('status')}")
+        logger.info(f"Successfully submitted job {job_id}. Status: {submit_response.get('status')}")
 
         # Step 2: Poll for job status
         final_status_data = poll_job_status(job_id)
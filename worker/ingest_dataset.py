@@ -0,0 +1,208 @@
+# ingest_dataset.py
+# Converts an uploaded dataset into the platform's canonical schema and writes it once as compressed
+# Parquet. Every later stage (deduplication, the upload to the pod, training) reads that file, only the
+# columns it needs and one row group at a time, instead of re-parsing the original text format.
+#
+# Accepted files: .csv, .jsonl and .parquet. The canonical schema is the Alpaca fields finetune_template.py
+# formats: instruction, input, output. Rows are mapped by Job.dataset_type:
+#   Q&A             instruction|question|prompt|query, input|context, output|answer|response|completion
+#   Reasoning       the Q&A fields plus reasoning|rationale|chain_of_thought|thinking|explanation,
+#                   which is put in the output ahead of the answer
+#   Conversational  a messages|conversations list of {role, content} (OpenAI) or {from, value} (ShareGPT)
+#                   turns: the last assistant turn is the output, the user turn before it the instruction
+#                   and any earlier turns the input
+# Rows with a messages column are read as conversations whatever the dataset_type, and rows without one
+# get the Q&A mapping, including in Conversational datasets. Rows that cannot be mapped (no instruction
+# or no output) are dropped and counted.
+#
+#   python ingest_dataset.py upload.csv upload.parquet --dataset-type "Q&A"
+import argparse
+import csv
+import json
+import os
+import time
+
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+SUPPORTED_EXTENSIONS = (".csv", ".jsonl", ".parquet")
+CANONICAL_SCHEMA = pa.schema([("instruction", pa.string()), ("input", pa.string()), ("output", pa.string())])
+# Rows per batch; each batch becomes one Parquet row group, so it also sets the unit later stages read
+INGEST_BATCH_ROWS = int(os.getenv("INGEST_BATCH_ROWS", "20000"))
+INGEST_PARQUET_COMPRESSION = os.getenv("INGEST_PARQUET_COMPRESSION", "zstd")
+
+INSTRUCTION_FIELDS = ("instruction", "question", "prompt", "query")
+INPUT_FIELDS = ("input", "context")
+OUTPUT_FIELDS = ("output", "answer", "response", "completion")
+REASONING_FIELDS = ("reasoning", "rationale", "chain_of_thought", "thinking", "explanation")
+MESSAGE_FIELDS = ("messages", "conversations", "conversation")
+ROLE_ALIASES = {"human": "user", "user": "user", "gpt": "assistant", "assistant": "assistant", "bot": "assistant",
+                "model": "assistant", "system": "system"}
+
+
+def first_value(row, fields):
+    for field in fields:
+        value = row.get(field)
+        if value is not None and value != "":
+            return value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+    return None
+
+
+def map_conversation(messages):
+    """
+    :return: The canonical row for a list of chat turns, or None if it has no user turn followed by an assistant turn.
+    """
+    if isinstance(messages, str):
+        try:
+            messages = json.loads(messages) # CSV cells hold the list as JSON text
+        except ValueError:
+            return None
+    if not isinstance(messages, list):
+        return None
+    turns = []
+    for turn in messages:
+        if not isinstance(turn, dict):
+            continue
+        content = turn.get("content") or turn.get("value") or ""
+        turns.append((
+            ROLE_ALIASES.get(str(turn.get("role") or turn.get("from") or "").lower()),
+            content if isinstance(content, str) else json.dumps(content, ensure_ascii=False), # e.g. a list of content parts
+        ))
+    assistant = max((index for index, (role, _) in enumerate(turns) if role == "assistant"), default=None)
+    user = max((index for index, (role, _) in enumerate(turns[:assistant or 0]) if role == "user"), default=None)
+    if assistant is None or user is None:
+        return None
+    context = "\n".join(f"{role.capitalize()}: {content}" for role, content in turns[:user] if role)
+    return {"instruction": turns[user][1], "input": context, "output": turns[assistant][1]}
+
+
+def to_canonical(row, dataset_type):
+    """
+    :return: The row in the canonical schema, or None if it cannot be mapped.
+    """
+    messages = next((row[field] for field in MESSAGE_FIELDS if row.get(field) is not None), None)
+    if messages is not None:
+        return map_conversation(messages)
+
+    instruction = first_value(row, INSTRUCTION_FIELDS)
+    output = first_value(row, OUTPUT_FIELDS)
+    if dataset_type == "Reasoning":
+        reasoning = first_value(row, REASONING_FIELDS)
+        if reasoning:
+            output = f"{reasoning}\n\n{output}" if output else reasoning
+    input_text = first_value(row, INPUT_FIELDS) or ""
+    if not instruction and input_text:
+        instruction, input_text = input_text, "" # Input/output pairs carry the prompt in the input
+    if not instruction or output is None:
+        return None
+    return {"instruction": instruction, "input": input_text, "output": output}
+
+
+def read_jsonl_batches(path, batch_rows):
+    """
+    Yields lists of parsed rows; a line that is not a JSON object is yielded as None.
+    """
+    batch = []
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            batch.append(row if isinstance(row, dict) else None)
+            if len(batch) >= batch_rows:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def read_csv_batches(path, batch_rows):
+    with open(path, newline="", encoding="utf-8") as f:
+        header = next(csv.reader(f), None)
+    if not header:
+        return
+    # Every column is read as a string: type inference per block can disagree between blocks of a large file
+    reader = pa_csv.open_csv(path, convert_options=pa_csv.ConvertOptions(column_types={name: pa.string() for name in header}))
+    batch = []
+    for record_batch in reader:
+        batch.extend(record_batch.to_pylist())
+        if len(batch) >= batch_rows:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def read_parquet_batches(path, batch_rows):
+    for record_batch in pq.ParquetFile(path).iter_batches(batch_size=batch_rows):
+        yield record_batch.to_pylist()
+
+
+def output_filename(job_id):
+    # Named after the job, not the upload: jobs whose uploads share a filename share UPLOAD_DIR too
+    return f"{job_id}.canonical.parquet"
+
+
+def convert_to_parquet(input_path, output_path, dataset_type=None, batch_rows=INGEST_BATCH_ROWS):
+    """
+    Streams `input_path` into canonical, compressed Parquet at `output_path`, one batch of rows at a time.
+    :return: Conversion statistics, suitable for Job.dataset_stats.
+    """
+    start_time = time.time()
+    extension = os.path.splitext(input_path)[1].lower()
+    readers = {".csv": read_csv_batches, ".jsonl": read_jsonl_batches, ".parquet": read_parquet_batches}
+    if extension not in readers:
+        raise ValueError(f"Unsupported dataset format '{extension}'; expected one of {', '.join(SUPPORTED_EXTENSIONS)}.")
+
+    stats = {"source_format": extension.lstrip("."), "rows_in": 0, "invalid_rows": 0, "rows_out": 0}
+    # Written under a temporary name, so an interrupted conversion never looks finished
+    tmp_path = f"{output_path}.tmp-{os.getpid()}"
+    try:
+        with pq.ParquetWriter(tmp_path, CANONICAL_SCHEMA, compression=INGEST_PARQUET_COMPRESSION) as writer:
+            for batch in readers[extension](input_path, batch_rows):
+                rows = [to_canonical(row, dataset_type) if row is not None else None for row in batch]
+                kept = [row for row in rows if row is not None]
+                stats["rows_in"] += len(rows)
+                stats["invalid_rows"] += len(rows) - len(kept)
+                stats["rows_out"] += len(kept)
+                if kept:
+                    writer.write_table(pa.Table.from_pylist(kept, schema=CANONICAL_SCHEMA))
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    stats.update(
+        source_bytes=os.path.getsize(input_path),
+        parquet_bytes=os.path.getsize(output_path),
+        seconds=round(time.time() - start_time, 3),
+    )
+    return stats
+
+
+def write_jsonl(parquet_path, output_path, batch_rows=INGEST_BATCH_ROWS):
+    """
+    Writes a canonical Parquet file back out as JSONL, for consumers that only read JSONL (the external
+    serverless handler). Streams one batch at a time and writes under a temporary name.
+    """
+    tmp_path = f"{output_path}.tmp-{os.getpid()}"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for rows in read_parquet_batches(parquet_path, batch_rows):
+                f.writelines(json.dumps(row, ensure_ascii=False) + "\n" for row in rows)
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert a CSV, JSONL or Parquet dataset to canonical Parquet.")
+    parser.add_argument("input")
+    parser.add_argument("output")
+    parser.add_argument("--dataset-type", choices=["Q&A", "Conversational", "Reasoning"], default="Q&A")
+    args = parser.parse_args()
+    print(json.dumps(convert_to_parquet(args.input, args.output, args.dataset_type), indent=2))
@@ -0,0 +1,110 @@
+import os
+import shutil
+import time
+
+import torch
+from transformers import AutoConfig, AutoModelForCausalLM, AutoTokenizer
+from huggingface_hub import file_exists
+from peft import PeftConfig, PeftModel
+from shared.utils import logger
+
+logger = logger.setup_logger('model_export')
+
+# Merged checkpoints live in one directory per finetuned repo so every consumer finds them by name
+MERGED_MODELS_DIR = os.getenv("MERGED_MODELS_DIR", "/workspace/merged_models")
+MERGED_MAX_SHARD_SIZE = os.getenv("MERGED_MAX_SHARD_SIZE", "2GB")
+MERGED_COMPLETE_MARKER = ".complete"
+# Pre-quantized bases and the full-precision repos they were quantized from. bitsandbytes 4-bit weights
+# do not load on CPU and cannot be merged without re-quantizing, so adapters are merged into the
+# original weights. Same map as export_template.py
+FULL_PRECISION_BASES = {
+    "unsloth/Qwen2-7b-bnb-4bit": "unsloth/Qwen2-7B",
+    "unsloth/gemma-7b-bnb-4bit": "unsloth/gemma-7b",
+}
+BNB_4BIT_SUFFIX = "-bnb-4bit"
+
+
+def merged_model_dir(adapter_repo, root=MERGED_MODELS_DIR):
+    # Same layout as export_template.py writes on the training pod volume
+    return os.path.join(root, adapter_repo.replace("/", "--"))
+
+
+def is_merged_model_ready(path):
+    return os.path.exists(os.path.join(path, MERGED_COMPLETE_MARKER))
+
+
+def merged_repo_exists(repo_id):
+    try:
+        return file_exists(repo_id, "config.json")
+    except Exception:
+        # Not a Hub repo id (e.g. a local adapter path) or the Hub is unreachable
+        return False
+
+
+def full_precision_base(base_model_name):
+    if base_model_name in FULL_PRECISION_BASES:
+        return FULL_PRECISION_BASES[base_model_name]
+    if base_model_name.endswith(BNB_4BIT_SUFFIX):
+        return base_model_name[:-len(BNB_4BIT_SUFFIX)]
+    return base_model_name
+
+
+def check_unquantized(config, name):
+    """
+    Raises ValueError if `config` belongs to a quantized checkpoint, which cannot be merged or int8-quantized.
+    """
+    quantization_config = getattr(config, "quantization_config", None)
+    if quantization_config:
+        method = quantization_config.get("quant_method") if isinstance(quantization_config, dict) else getattr(quantization_config, "quant_method", None)
+        raise ValueError(f"{name} is a quantized checkpoint ({method or 'unknown method'}); a full-precision checkpoint is required")
+
+
+def merge_adapter(adapter_repo, output_dir=None, dtype=torch.bfloat16, max_shard_size=MERGED_MAX_SHARD_SIZE):
+    """
+    Folds the LoRA adapter in `adapter_repo` into its base model weights and writes the result as
+    safetensors shards, which transformers memory-maps on load.
+    The directory is written under a temporary name and renamed into place, so readers never see a
+    partial checkpoint.
+    :return: Path of the merged checkpoint.
+    """
+    output_dir = output_dir or merged_model_dir(adapter_repo)
+    if is_merged_model_ready(output_dir):
+        return output_dir
+
+    start_time = time.time()
+    base_model_name = full_precision_base(PeftConfig.from_pretrained(adapter_repo).base_model_name_or_path)
+    check_unquantized(AutoConfig.from_pretrained(base_model_name), base_model_name)
+    logger.info(f"Merging adapter {adapter_repo} into {base_model_name}...")
+    model = AutoModelForCausalLM.from_pretrained(base_model_name, torch_dtype=dtype)
+    model = PeftModel.from_pretrained(model, adapter_repo).merge_and_unload()
+    tokenizer = AutoTokenizer.from_pretrained(base_model_name)
+
+    os.makedirs(os.path.dirname(os.path.abspath(output_dir)), exist_ok=True)
+    tmp_dir = f"{output_dir}.tmp-{os.getpid()}"
+    try:
+        model.save_pretrained(tmp_dir, safe_serialization=True, max_shard_size=max_shard_size)
+        tokenizer.save_pretrained(tmp_dir)
+        open(os.path.join(tmp_dir, MERGED_COMPLETE_MARKER), "w").close()
+        shutil.rmtree(output_dir, ignore_errors=True)
+        os.rename(tmp_dir, output_dir)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    finally:
+        del model
+
+    logger.info(f"Merged checkpoint for {adapter_repo} written to {output_dir} in {time.time() - start_time:.1f}s")
+    return output_dir
+
+
+def load_int8_cpu_model(path):
+    """
+    Loads a merged checkpoint on CPU and applies dynamic int8 quantization to its Linear layers.
+    Weights are stored as int8 and activations are quantized on the fly, which roughly quarters the
+    memory of the projection layers and speeds up CPU matmuls.
+    """
+    # quantize_dynamic only replaces torch.nn.Linear, so bitsandbytes Linear4bit layers would be left as they are
+    check_unquantized(AutoConfig.from_pretrained(path), path)
+    model = AutoModelForCausalLM.from_pretrained(path, torch_dtype=torch.float32)
+    model.eval()
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
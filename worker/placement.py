@@ -0,0 +1,123 @@
+import json
+import os
+import re
+from sqlalchemy import func
+from shared.db.base import Job, Pod
+from shared.utils import logger
+
+logger = logger.setup_logger('placement')
+
+# --- Placement configuration ---
+# Training always loads the base model in 4 bit (see finetune_template.py), so memory is
+# dominated by the quantized weights plus activations, LoRA optimizer state and CUDA context.
+POD_REGISTRY_FILE = os.getenv("POD_REGISTRY_FILE")
+BYTES_PER_PARAM_4BIT = 0.5
+BYTES_PER_PARAM_16BIT = 2.0
+WEIGHT_OVERHEAD_FACTOR = 1.2
+TRAINING_OVERHEAD_GB = float(os.getenv("TRAINING_OVERHEAD_GB", "4"))
+# Merging needs no optimizer state or activations, only the CUDA context and a layer's worth of scratch
+EXPORT_OVERHEAD_GB = float(os.getenv("EXPORT_OVERHEAD_GB", "2"))
+# CUDA context of the model prefetch process that runs next to each training job
+PREFETCH_OVERHEAD_GB = float(os.getenv("PREFETCH_OVERHEAD_GB", "1"))
+DEFAULT_MODEL_PARAMS_B = float(os.getenv("DEFAULT_MODEL_PARAMS_B", "8"))
+
+# Models whose names do not carry a parameter count
+KNOWN_MODEL_PARAMS_B = {
+    "unsloth/Phi-3-mini-4k-instruct-gguf": 3.8,
+}
+
+PARAM_COUNT_PATTERN = re.compile(r"(?<![\d.])(\d+(?:\.\d+)?)[bB](?![a-zA-Z])")
+
+def estimate_model_params_b(base_model):
+    """
+    Parameter count in billions, read from names like "unsloth/Qwen2-7b-bnb-4bit" or "unsloth/Qwen3-14B".
+    """
+    if base_model in KNOWN_MODEL_PARAMS_B:
+        return KNOWN_MODEL_PARAMS_B[base_model]
+    matches = PARAM_COUNT_PATTERN.findall(base_model.split("/")[-1])
+    if not matches:
+        return DEFAULT_MODEL_PARAMS_B
+    return max(float(match) for match in matches)
+
+def estimate_weights_gb(base_model, load_in_4bit=True):
+    params_b = estimate_model_params_b(base_model or "")
+    bytes_per_param = BYTES_PER_PARAM_4BIT if load_in_4bit else BYTES_PER_PARAM_16BIT
+    return params_b * bytes_per_param * WEIGHT_OVERHEAD_FACTOR
+
+def estimate_vram_gb(base_model, load_in_4bit=True):
+    return round(estimate_weights_gb(base_model, load_in_4bit) + TRAINING_OVERHEAD_GB, 1)
+
+def estimate_training_vram_gb(base_model):
+    """
+    VRAM to reserve for a finetuning job. On a cache miss its model prefetch process
+    (finetune_with_custom_pod.run_finetuning_job) holds its own copy of the 4-bit weights until it
+    exits, and training starts without it if the prefetch cannot be polled, so both copies are counted.
+    """
+    return round(estimate_vram_gb(base_model) + estimate_weights_gb(base_model) + PREFETCH_OVERHEAD_GB, 1)
+
+def estimate_export_vram_gb(base_model):
+    """
+    VRAM to reserve for a merged export. export_template.py merges into the full-precision base in bf16,
+    also for adapters trained on a pre-quantized (*-bnb-4bit) base, so it is sized for 16-bit weights.
+    """
+    return round(estimate_weights_gb(base_model, load_in_4bit=False) + EXPORT_OVERHEAD_GB, 1)
+
+def sync_pods_from_file(db, path=POD_REGISTRY_FILE):
+    """
+    Upserts pods from a JSON registry file into the pods table:
+    [{"id": "a100-1", "url": "http://...", "gpu_vram_gb": 80, "max_jobs": 4}, ...]
+    Pods missing from the file are disabled rather than deleted so job history keeps its pod_id.
+    """
+    if not path:
+        return
+    with open(path, "r") as f:
+        entries = json.load(f)
+
+    seen = set()
+    for entry in entries:
+        pod = db.get(Pod, entry["id"]) or Pod(id=entry["id"])
+        pod.url = entry["url"]
+        pod.gpu_vram_gb = float(entry["gpu_vram_gb"])
+        pod.max_jobs = int(entry.get("max_jobs", 1))
+        pod.enabled = bool(entry.get("enabled", True))
+        db.add(pod)
+        seen.add(pod.id)
+    for pod in db.query(Pod).filter(Pod.id.notin_(seen)):
+        pod.enabled = False
+    db.commit()
+    logger.info(f"Pod registry synced from {path}: {sorted(seen)}")
+
+def registry_enabled(db):
+    return db.query(Pod.id).filter(Pod.enabled.is_(True)).first() is not None
+
+def pod_loads(db):
+    """
+    VRAM reserved and number of jobs currently RUNNING on each pod.
+    """
+    rows = (
+        db.query(Job.pod_id, func.coalesce(func.sum(Job.estimated_vram_gb), 0.0), func.count(Job.id))
+        .filter(Job.status == "RUNNING", Job.pod_id.isnot(None))
+        .group_by(Job.pod_id)
+        .all()
+    )
+    return {pod_id: (float(used), count) for pod_id, used, count in rows}
+
+def place_job(db, required_vram_gb):
+    """
+    Picks the enabled pod that can fit `required_vram_gb` with the least memory left over (best fit),
+    so small LoRA jobs are packed together and large GPUs stay free for large models.
+    The pod rows are locked (on Postgres) until the caller commits its claim.
+    :return: The chosen Pod, or None when nothing fits and the job should stay queued.
+    """
+    pods = db.query(Pod).filter(Pod.enabled.is_(True)).order_by(Pod.id).with_for_update().all()
+    loads = pod_loads(db)
+
+    best_pod, best_leftover = None, None
+    for pod in pods:
+        used, running = loads.get(pod.id, (0.0, 0))
+        leftover = pod.gpu_vram_gb - used - required_vram_gb
+        if leftover < 0 or running >= (pod.max_jobs or 1):
+            continue
+        if best_leftover is None or leftover < best_leftover:
+            best_pod, best_leftover = pod, leftover
+    return best_pod
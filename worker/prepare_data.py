@@ -1,7 +1,9 @@
 # prepare_data.py
 import json
 import base64
+import gzip
 import os
+import shutil
 import sys
 
 # Assume job_params are passed as a JSON file via --params_file argument
@@ -23,22 +25,35 @@ if __name__ == "__main__":
         print("Error: --params_file argument not found. Job parameters not provided.")
         sys.exit(1)
 
+    # Sent once training is over, to delete the job's shard directory
+    remove_dir = job_params.get("remove_dir")
+    if remove_dir:
+        shutil.rmtree(remove_dir, ignore_errors=True)
+        print(f"Removed {remove_dir}")
+        sys.exit(0)
+
     # Expect the base64_dataset_content in the job_params
     base64_data = job_params.get("base64_dataset_content")
     if not base64_data:
         print("Error: 'base64_dataset_content' not found in job parameters.")
         sys.exit(1)
 
-    output_path = "/workspace/dataset.jsonl" # Target path on the pod
+    # Target path on the pod; the worker sends one chunk per call, each to its own shard file
+    output_path = job_params.get("output_path", "/workspace/dataset.jsonl")
 
     try:
         # Decode the base64 content
         decoded_data = base64.b64decode(base64_data)
+        if job_params.get("compression") == "gzip":
+            decoded_data = gzip.decompress(decoded_data)
 
-        # Write to the specified path
-        with open(output_path, "wb") as f: # Use 'wb' for binary write
+        # Write to a temporary name and rename, so training never reads a partly written shard
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        tmp_path = f"{output_path}.tmp-{os.getpid()}"
+        with open(tmp_path, "wb") as f: # Use 'wb' for binary write
             f.write(decoded_data)
-        print(f"Dataset successfully written to {output_path}")
+        os.replace(tmp_path, output_path)
+        print(f"Dataset successfully written to {output_path} ({len(decoded_data)} bytes)")
 
     except Exception as e:
         print(f"Error during data preparation: {e}")
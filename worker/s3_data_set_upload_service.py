@@ -1,8 +1,9 @@
-import boto3
 import os
 import base64
+import uuid
 from dotenv import load_dotenv
-from shared.utils import logger
+from shared.utils import logger, metrics
+from shared.utils.lazy import LazyResource
 
 logger = logger.setup_logger('UploadDataSetToS3')
 
@@ -15,17 +16,23 @@ RUNPOD_S3_ACCESS_KEY_ID = os.getenv("RUNPOD_S3_ACCESS_KEY_ID")  # From step 2.2
 RUNPOD_S3_SECRET_ACCESS_KEY = os.getenv("RUNPOD_S3_SECRET_ACCESS_KEY") # From step 2.2
 NETWORK_VOLUME_ID = os.getenv("NETWORK_VOLUME_ID")                       # Your Network Volume ID
 region_name= os.getenv("region_name")
-
-# Initialize S3 client
-s3_client = boto3.client(
-    's3',
-    endpoint_url=RUNPOD_S3_ENDPOINT_URL,
-    aws_access_key_id=RUNPOD_S3_ACCESS_KEY_ID,
-    aws_secret_access_key=RUNPOD_S3_SECRET_ACCESS_KEY,
-    # region_name: Can be left blank or set to a placeholder like 'us-east-1'
-    # RunPod S3 compatible API does not use AWS regions in the traditional sense.
-    region_name=region_name
-)
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "/app/uploads") # Datasets uploaded through the API
+
+def create_s3_client():
+    # boto3 takes a large share of the worker's import time, so it is only loaded once an upload happens
+    import boto3
+    return boto3.client(
+        's3',
+        endpoint_url=RUNPOD_S3_ENDPOINT_URL,
+        aws_access_key_id=RUNPOD_S3_ACCESS_KEY_ID,
+        aws_secret_access_key=RUNPOD_S3_SECRET_ACCESS_KEY,
+        # region_name: Can be left blank or set to a placeholder like 'us-east-1'
+        # RunPod S3 compatible API does not use AWS regions in the traditional sense.
+        region_name=region_name
+    )
+
+# Initialize S3 client on first use
+s3_client = LazyResource(create_s3_client)
 
 def upload_file_to_runpod_s3(local_file_path, s3_object_key):
     """
@@ -36,9 +43,10 @@ def upload_file_to_runpod_s3(local_file_path, s3_object_key):
     """
     try:
         s3_client.upload_file(local_file_path, NETWORK_VOLUME_ID, s3_object_key)
+        metrics.UPLOAD_BYTES.labels("s3").inc(os.path.getsize(local_file_path))
         logger.info(f"Successfully uploaded {local_file_path} to s3://{NETWORK_VOLUME_ID}/{s3_object_key}")
     except Exception as e:
-        logger.info(f"Error uploading file: {e}")
+        logger.error(f"Error uploading file: {e}")
 
 def list_files_in_runpod_s3(prefix=''):
     """
@@ -56,15 +64,36 @@ def list_files_in_runpod_s3(prefix=''):
     except Exception as e:
         logger.info(f"Error listing files: {e}")
 
+def serverless_dataset_filename(job):
+    """
+    The serverless handler reads JSONL, so a prepared Parquet dataset is shipped as a JSONL export of it.
+    """
+    dataset_filename = job.prepared_dataset_filename or job.dataset_filename
+    root, extension = os.path.splitext(dataset_filename)
+    return f"{root}.jsonl" if extension == ".parquet" else dataset_filename
+
 def upload_data_set_to_s3(job):
     # Read data set from user uploaded data
-    DATASET_PATH = f"/app/uploads/{job.dataset_filename}"
-    S3_DATASET_PATH =  f"workspace/datasets/{job.id}_{job.dataset_filename}"
+    source_filename = job.prepared_dataset_filename or job.dataset_filename
+    dataset_filename = serverless_dataset_filename(job)
+    DATASET_PATH = os.path.join(UPLOAD_DIR, source_filename)
+    S3_DATASET_PATH =  f"workspace/datasets/{job.id}_{dataset_filename}"
     if not os.path.exists(DATASET_PATH):
-        print(f"Error: Fine-tune script '{DATASET_PATH}' not found.")
+        logger.error(f"Error: Dataset '{DATASET_PATH}' not found.")
         exit(1)
 
-    upload_file_to_runpod_s3(DATASET_PATH, S3_DATASET_PATH)
+    if dataset_filename == source_filename:
+        upload_file_to_runpod_s3(DATASET_PATH, S3_DATASET_PATH)
+    else:
+        # The JSONL export is only needed for the upload, so it is not kept next to the prepared Parquet
+        import ingest_dataset # Loads pyarrow, so only once a job needs the export
+        export_path = os.path.join(UPLOAD_DIR, f".{job.id}.{uuid.uuid4().hex}.jsonl")
+        try:
+            ingest_dataset.write_jsonl(DATASET_PATH, export_path)
+            upload_file_to_runpod_s3(export_path, S3_DATASET_PATH)
+        finally:
+            if os.path.exists(export_path):
+                os.remove(export_path)
 
     # 3. List files to verify
     list_files_in_runpod_s3(prefix=f"workspace/")
@@ -79,7 +108,7 @@ def delete_all_objects_in_network_volume(volume_id, prefix=''):
     :param prefix: Optional. A prefix to limit deletion to objects within a specific "folder".
                    e.g., 'user_data/' to delete only files in the 'user_data' directory.
     """
-    print(f"Attempting to delete objects from RunPod Network Volume: '{volume_id}' with prefix: '{prefix}'")
+    logger.info(f"Attempting to delete objects from RunPod Network Volume: '{volume_id}' with prefix: '{prefix}'")
 
     objects_to_delete = []
     paginator = s3_client.get_paginator('list_objects_v2')
@@ -94,17 +123,17 @@ def delete_all_objects_in_network_volume(volume_id, prefix=''):
                     objects_to_delete.append({'Key': obj['Key']})
         
         if not objects_to_delete:
-            print("No objects found to delete.")
+            logger.info("No objects found to delete.")
             return
 
-        print(f"Found {len(objects_to_delete)} objects to delete.")
+        logger.info(f"Found {len(objects_to_delete)} objects to delete.")
 
         # Delete objects in batches of up to 1000
         # The delete_objects method can take up to 1000 keys at once
         for i in range(0, len(objects_to_delete), 1000):
             batch = objects_to_delete[i:i + 1000]
             
-            print(f"Deleting batch {int(i/1000) + 1} of {len(batch)} objects...")
+            logger.info(f"Deleting batch {int(i/1000) + 1} of {len(batch)} objects...")
             response = s3_client.delete_objects(
                 Bucket=volume_id,
                 Delete={
@@ -114,16 +143,16 @@ def delete_all_objects_in_network_volume(volume_id, prefix=''):
             )
             
             if 'Errors' in response:
-                print(f"Errors encountered during deletion in batch {int(i/1000) + 1}:")
+                logger.info(f"Errors encountered during deletion in batch {int(i/1000) + 1}:")
                 for error in response['Errors']:
-                    print(f"  Key: {error['Key']}, Code: {error['Code']}, Message: {error['Message']}")
+                    logger.info(f"  Key: {error['Key']}, Code: {error['Code']}, Message: {error['Message']}")
             elif 'Deleted' in response:
-                print(f"  Successfully deleted {len(response['Deleted'])} objects in this batch.")
+                logger.info(f"  Successfully deleted {len(response['Deleted'])} objects in this batch.")
 
-        print("Deletion process completed.")
+        logger.info("Deletion process completed.")
 
     except Exception as e:
-        print(f"An error occurred during deletion: {e}")    
+        logger.error(f"An error occurred during deletion: {e}")    
 
 
 if __name__ == "__main__":
@@ -0,0 +1,94 @@
+import os
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import func, or_
+from shared.db.base import Job
+
+# --- Scheduling configuration ---
+# Jobs are picked by priority lane first, then by the owner with the smallest weighted share
+# of recent usage, then oldest first. Waiting jobs are aged up one lane every SCHEDULER_AGING_SECONDS
+# so low-priority work is never starved.
+SCHEDULER_AGING_SECONDS = float(os.getenv("SCHEDULER_AGING_SECONDS", "1800"))
+SCHEDULER_USAGE_WINDOW_SECONDS = float(os.getenv("SCHEDULER_USAGE_WINDOW_SECONDS", "3600"))
+SCHEDULER_HEAD_PER_OWNER = int(os.getenv("SCHEDULER_HEAD_PER_OWNER", "5"))
+DEFAULT_OWNER = "anonymous"
+
+def parse_owner_weights(raw):
+    """
+    Parses "alice:2,bob:0.5" into {"alice": 2.0, "bob": 0.5}. Owners not listed get weight 1.
+    """
+    weights = {}
+    for entry in (raw or "").split(","):
+        if ":" not in entry:
+            continue
+        owner, weight = entry.rsplit(":", 1)
+        weights[owner.strip()] = max(float(weight), 0.01)
+    return weights
+
+OWNER_WEIGHTS = parse_owner_weights(os.getenv("SCHEDULER_OWNER_WEIGHTS", ""))
+
+def as_naive_utc(value):
+    # Postgres and SQLite hand back naive datetimes for these columns; compare everything as naive UTC
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def effective_lane(job, now):
+    """
+    The job's priority plus one lane for every SCHEDULER_AGING_SECONDS it has waited.
+    """
+    waited = (now - as_naive_utc(job.created_at)).total_seconds() if job.created_at else 0
+    return (job.priority or 0) + int(max(waited, 0) // SCHEDULER_AGING_SECONDS)
+
+def owner_usage(db, since):
+    """
+    Number of jobs each owner has running or started since `since`.
+    """
+    rows = (
+        db.query(Job.owner, func.count(Job.id))
+        .filter((Job.status == "RUNNING") | (Job.started_at >= since))
+        .group_by(Job.owner)
+        .all()
+    )
+    return {owner or DEFAULT_OWNER: count for owner, count in rows}
+
+def queued_heads(db, exclude_task_types=()):
+    """
+    The first SCHEDULER_HEAD_PER_OWNER queued jobs of every owner, so one owner's backlog
+    cannot crowd the others out of the candidate set.
+    :param exclude_task_types: Task types the caller cannot run; finetuning jobs have no task_type.
+    """
+    position = (
+        func.row_number()
+        .over(partition_by=Job.owner, order_by=(Job.priority.desc(), Job.created_at))
+        .label("position")
+    )
+    queued = db.query(Job.id, position).filter(Job.status == "QUEUED")
+    if exclude_task_types:
+        queued = queued.filter(or_(Job.task_type.is_(None), Job.task_type.notin_(exclude_task_types)))
+    ranked = queued.subquery()
+    return (
+        db.query(Job)
+        .join(ranked, ranked.c.id == Job.id)
+        .filter(ranked.c.position <= SCHEDULER_HEAD_PER_OWNER)
+        .all()
+    )
+
+def rank_queued_jobs(db, limit, now=None, exclude_task_types=()):
+    """
+    Returns up to `limit` queued job ids in the order they should be claimed.
+    :param now: Current time for aging and the usage window; defaults to the wall clock.
+    :param exclude_task_types: Task types to leave in the queue for other workers.
+    """
+    now = as_naive_utc(now or datetime.now(timezone.utc))
+    candidates = queued_heads(db, exclude_task_types)
+    if not candidates:
+        return []
+
+    usage = owner_usage(db, now - timedelta(seconds=SCHEDULER_USAGE_WINDOW_SECONDS))
+
+    def sort_key(job):
+        owner = job.owner or DEFAULT_OWNER
+        share = usage.get(owner, 0) / OWNER_WEIGHTS.get(owner, 1.0)
+        return (-effective_lane(job, now), share, as_naive_utc(job.created_at) if job.created_at else now)
+
+    return [job.id for job in sorted(candidates, key=sort_key)[:limit]]
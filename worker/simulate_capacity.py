@@ -0,0 +1,393 @@
+# simulate_capacity.py
+# Deterministic discrete-event simulation of the job queue for capacity planning. Simulates days of
+# finetuning traffic in seconds so worker counts and scheduler settings can be compared offline.
+#
+# The real claim and lease code in worker.py runs against a scratch database: jobs are claimed with
+# worker.claim_next_job (and so ranked by scheduler.py), leases are extended with worker.extend_leases and
+# expired ones swept with worker.sweep_expired_leases, and results are written with worker.finish_job.
+# Only time is simulated: worker.utc_now is replaced by a virtual clock, and run durations and failures
+# come from the CPU mock's duration model (finetune_mock.plan_mock_run). Workers are preempted at random;
+# their jobs are recovered the way production recovers them, by lease expiry. Queue wait is measured up to
+# a job's first claim; job_status_history is written with wall-clock timestamps and is not meaningful here.
+#
+# The workload, every job's run and every worker's preemptions are drawn from separate streams seeded by
+# --seed, so two runs that differ only in worker count or scheduler settings see exactly the same traffic.
+# Scheduler settings are read from the environment, as in production:
+#
+#   python simulate_capacity.py --days 7 --jobs-per-hour 6 --workers 2,4,8 --output capacity.json
+#   SCHEDULER_AGING_SECONDS=600 SCHEDULER_OWNER_WEIGHTS=team-a:2 python simulate_capacity.py --days 7 --workers 4
+#
+# The database is wiped before every run; point --database-url only at a scratch database.
+import argparse
+import heapq
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
+
+SIM_EPOCH = datetime(2026, 1, 5, tzinfo=timezone.utc) # A Monday, so simulated weekdays line up
+DEFAULT_MODEL_MIX = "unsloth/llama-3-8b-Instruct:0.5,unsloth/Qwen2-7b-bnb-4bit:0.3,unsloth/gemma-7b-bnb-4bit:0.2"
+HIGH_PRIORITY = 5
+
+
+class VirtualClock:
+    """
+    Simulated time in seconds since SIM_EPOCH; now() stands in for worker.utc_now.
+    """
+    def __init__(self):
+        self.seconds = 0.0
+
+    def now(self):
+        return SIM_EPOCH + timedelta(seconds=self.seconds)
+
+
+class SimulatedWorker:
+    def __init__(self, index, slots):
+        self.index = index
+        self.slots = slots
+        self.incarnation = 0 # Bumped by every restart, so the worker gets a new WORKER_ID like a new process would
+        self.alive = True
+        self.running = {} # job id -> simulated start time
+        self.poll_at = None # Time of the pending poll event, if any
+
+    @property
+    def worker_id(self):
+        return f"sim-worker-{self.index}-{self.incarnation}"
+
+
+def parse_model_mix(raw):
+    """
+    Parses "model:weight,model:weight" into ([models], [weights]).
+    """
+    models, weights = [], []
+    for entry in raw.split(","):
+        model, weight = entry.rsplit(":", 1)
+        models.append(model.strip())
+        weights.append(float(weight))
+    return models, weights
+
+
+def arrival_rate(seconds, jobs_per_hour, diurnal):
+    # Daily cycle peaking at 14:00 UTC; diurnal 0 is a constant rate
+    hour = (seconds / 3600.0) % 24
+    return jobs_per_hour / 3600.0 * (1 + diurnal * math.sin(2 * math.pi * (hour - 8) / 24))
+
+
+def generate_workload(args):
+    """
+    Draws the simulated traffic: a non-homogeneous Poisson arrival process (sampled by thinning),
+    each job with an owner, priority, model, dataset size and planned run.
+    """
+    import finetune_mock
+
+    rng = random.Random(f"{args.seed}-workload")
+    run_rng = random.Random(f"{args.seed}-runs")
+    models, model_weights = parse_model_mix(args.models)
+    owners = [f"team-{chr(ord('a') + index)}" for index in range(args.owners)]
+    owner_weights = [1.0 / (index + 1) for index in range(args.owners)] # Zipf: one large tenant, a long tail
+    max_rate = args.jobs_per_hour / 3600.0 * (1 + args.diurnal)
+    horizon = args.days * 86400.0
+
+    jobs, seconds = [], 0.0
+    while max_rate > 0:
+        seconds += rng.expovariate(max_rate)
+        if seconds >= horizon:
+            break
+        if rng.random() * max_rate > arrival_rate(seconds, args.jobs_per_hour, args.diurnal):
+            continue
+        base_model = rng.choices(models, model_weights)[0]
+        dataset_rows = max(10, int(args.dataset_rows * math.exp(rng.gauss(0.0, args.dataset_rows_sigma))))
+        jobs.append({
+            "id": f"sim-{len(jobs):07d}",
+            "arrives_at": seconds,
+            "owner": rng.choices(owners, owner_weights)[0],
+            "priority": HIGH_PRIORITY if rng.random() < args.high_priority_fraction else 0,
+            "base_model": base_model,
+            "dataset_rows": dataset_rows,
+            # Every attempt of a job replays the same run, so retries cost the same in every configuration
+            "run": finetune_mock.plan_mock_run(base_model, dataset_rows, run_rng, failure_rate=args.failure_rate),
+        })
+    return jobs
+
+
+def percentiles(values):
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+
+    def pick(fraction):
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    return {
+        "count": len(ordered),
+        "mean_minutes": round(sum(ordered) / len(ordered) / 60, 2),
+        "p50_minutes": round(pick(0.50) / 60, 2),
+        "p95_minutes": round(pick(0.95) / 60, 2),
+        "p99_minutes": round(pick(0.99) / 60, 2),
+        "max_minutes": round(ordered[-1] / 60, 2),
+    }
+
+
+def reset_database(worker):
+    from shared.db.base import Base
+
+    engine = worker.engine.get()
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+
+def simulate(worker, args, workload, worker_count):
+    """
+    Runs one configuration over the workload.
+    :return: dict of results.
+    """
+    from sqlalchemy import func
+    from shared.db.base import Job
+
+    clock = VirtualClock()
+    worker.utc_now = clock.now
+    reset_database(worker)
+
+    workers = [SimulatedWorker(index, args.concurrency) for index in range(worker_count)]
+    preemption_rngs = [random.Random(f"{args.seed}-preemptions-{index}") for index in range(worker_count)]
+    preemption_rate = args.preemptions_per_day / 86400.0
+    horizon = args.days * 86400.0
+    stop_at = horizon + args.drain_hours * 3600.0
+
+    events, sequence = [], 0
+    def schedule(seconds, kind, *payload):
+        nonlocal sequence
+        sequence += 1
+        heapq.heappush(events, (seconds, sequence, kind, payload))
+
+    def schedule_poll(sim_worker, seconds):
+        if sim_worker.alive and (sim_worker.poll_at is None or seconds < sim_worker.poll_at):
+            sim_worker.poll_at = seconds
+            schedule(seconds, "poll", sim_worker, sim_worker.incarnation)
+
+    jobs_by_id = {job["id"]: job for job in workload}
+    for job in workload:
+        schedule(job["arrives_at"], "arrival", job)
+    for sim_worker in workers:
+        schedule_poll(sim_worker, 0.0)
+        if preemption_rate > 0:
+            schedule(preemption_rngs[sim_worker.index].expovariate(preemption_rate), "preempt", sim_worker)
+    schedule(worker.LEASE_SWEEP_INTERVAL_SECONDS, "sweep")
+
+    queued = 0 # Jobs in QUEUED; an idle poll skips the database when it would find nothing
+    abandoned = set() # Jobs left RUNNING by a preempted worker, until a lease sweep recovers them
+    first_claimed_at, finished_at = {}, {}
+    busy_seconds = lost_seconds = 0.0
+    preemptions = 0
+    depth_samples = []
+    wall_start = time.perf_counter()
+
+    while events:
+        seconds, _, kind, payload = heapq.heappop(events)
+        if seconds > stop_at:
+            break
+        clock.seconds = seconds
+
+        if kind == "arrival":
+            job = payload[0]
+            db = worker.SessionLocal()
+            try:
+                db.add(Job(
+                    id=job["id"], status="QUEUED", task_type="finetuning", base_model=job["base_model"],
+                    owner=job["owner"], priority=job["priority"], new_model_name=job["id"],
+                    dataset_filename=f"{job['id']}.jsonl", created_at=clock.now(),
+                ))
+                db.commit()
+            finally:
+                db.close()
+            queued += 1
+
+        elif kind == "poll":
+            sim_worker, incarnation = payload
+            if not sim_worker.alive or incarnation != sim_worker.incarnation or sim_worker.poll_at != seconds:
+                continue
+            sim_worker.poll_at = None
+            # Same loop as worker.poll_for_jobs: claim until the worker is full or the queue is empty
+            while len(sim_worker.running) < sim_worker.slots:
+                job_id = None
+                if queued:
+                    db = worker.SessionLocal()
+                    try:
+                        job_id = worker.claim_next_job(db, worker_id=sim_worker.worker_id)
+                    finally:
+                        db.close()
+                if job_id is None:
+                    schedule_poll(sim_worker, seconds + worker.POLL_INTERVAL_SECONDS)
+                    break
+                queued -= 1
+                first_claimed_at.setdefault(job_id, seconds)
+                sim_worker.running[job_id] = seconds
+                schedule(seconds + jobs_by_id[job_id]["run"].ends_after_seconds, "finish", sim_worker, sim_worker.incarnation, job_id)
+
+        elif kind == "finish":
+            sim_worker, incarnation, job_id = payload
+            if incarnation != sim_worker.incarnation or job_id not in sim_worker.running:
+                continue # The worker was preempted; the lease sweep recovers the job
+            run = jobs_by_id[job_id]["run"]
+            run_seconds = seconds - sim_worker.running.pop(job_id)
+            busy_seconds += run_seconds
+            if run.fails:
+                worker.finish_job(
+                    job_id, "finetuning", "FAILED", run_seconds, error_message="Simulated training failure.",
+                    worker_id=sim_worker.worker_id,
+                )
+            else:
+                worker.finish_job(job_id, "finetuning", "COMPLETED", run_seconds, worker_id=sim_worker.worker_id)
+            finished_at[job_id] = seconds
+            # The polling loop rechecks for a free slot once a second
+            schedule_poll(sim_worker, seconds + 1.0)
+
+        elif kind == "sweep":
+            # A live worker heartbeats every HEARTBEAT_INTERVAL_SECONDS, shorter than the lease, so a sweep
+            # never expires its jobs; only jobs of preempted workers can expire. Heartbeats are therefore sent
+            # right before a sweep that has such jobs to recover rather than on every interval: the sweep
+            # sees the same expired leases, at a fraction of the database round trips.
+            if abandoned:
+                for sim_worker in workers:
+                    if sim_worker.alive:
+                        worker.extend_leases(list(sim_worker.running), worker_id=sim_worker.worker_id)
+                worker.sweep_expired_leases()
+                # The sweep is the only other way a job leaves RUNNING, so resynchronize the counts here
+                db = worker.SessionLocal()
+                try:
+                    queued = db.query(func.count(Job.id)).filter(Job.status == "QUEUED").scalar()
+                    abandoned = {row.id for row in db.query(Job.id).filter(Job.id.in_(abandoned), Job.status == "RUNNING")}
+                finally:
+                    db.close()
+            depth_samples.append(queued)
+            if seconds >= horizon and not queued and not abandoned and not any(sim_worker.running for sim_worker in workers):
+                break
+            schedule(seconds + worker.LEASE_SWEEP_INTERVAL_SECONDS, "sweep")
+
+        elif kind == "preempt":
+            sim_worker = payload[0]
+            if sim_worker.alive:
+                preemptions += 1
+                lost_seconds += sum(seconds - started for started in sim_worker.running.values())
+                abandoned.update(sim_worker.running)
+                sim_worker.running.clear()
+                sim_worker.alive = False
+                sim_worker.poll_at = None
+                schedule(seconds + args.restart_minutes * 60.0, "restart", sim_worker)
+            schedule(seconds + preemption_rngs[sim_worker.index].expovariate(preemption_rate), "preempt", sim_worker)
+
+        elif kind == "restart":
+            sim_worker = payload[0]
+            sim_worker.incarnation += 1
+            sim_worker.alive = True
+            schedule_poll(sim_worker, seconds)
+
+    worker.status_writer.flush()
+    simulated_seconds = clock.seconds
+    db = worker.SessionLocal()
+    try:
+        rows = db.query(Job.id, Job.status, Job.attempts, Job.priority, Job.owner).all()
+    finally:
+        db.close()
+
+    statuses = Counter(row.status for row in rows)
+    queue_wait = {job_id: claimed - jobs_by_id[job_id]["arrives_at"] for job_id, claimed in first_claimed_at.items()}
+    turnaround = {job_id: finished - jobs_by_id[job_id]["arrives_at"] for job_id, finished in finished_at.items()}
+    wait_by_lane, wait_by_owner = defaultdict(list), defaultdict(list)
+    for row in rows:
+        if row.id in queue_wait:
+            wait_by_lane[f"priority_{row.priority}"].append(queue_wait[row.id])
+            wait_by_owner[row.owner].append(queue_wait[row.id])
+    capacity_seconds = worker_count * args.concurrency * simulated_seconds
+
+    return {
+        "workers": worker_count,
+        "slots": worker_count * args.concurrency,
+        "simulated_hours": round(simulated_seconds / 3600, 2),
+        "wall_seconds": round(time.perf_counter() - wall_start, 2),
+        "jobs": {
+            "submitted": len(workload),
+            "statuses": dict(statuses),
+            "retried": sum(1 for row in rows if (row.attempts or 0) > 1),
+        },
+        "queue_wait": percentiles(list(queue_wait.values())),
+        "queue_wait_by_priority": {lane: percentiles(values) for lane, values in sorted(wait_by_lane.items())},
+        "queue_wait_by_owner": {owner: percentiles(values) for owner, values in sorted(wait_by_owner.items())},
+        "turnaround": percentiles(list(turnaround.values())),
+        "queue_depth": {
+            "mean": round(sum(depth_samples) / len(depth_samples), 2) if depth_samples else 0,
+            "max": max(depth_samples, default=0),
+        },
+        # Downtime after a preemption still counts as capacity: it is paid for in a fleet of that size
+        "utilization": round(busy_seconds / capacity_seconds, 4) if capacity_seconds else None,
+        "preemptions": preemptions,
+        "lost_gpu_hours": round(lost_seconds / 3600, 2),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate the job queue under synthetic traffic with a virtual clock")
+    parser.add_argument("--days", type=float, default=7.0, help="Simulated days of arrivals.")
+    parser.add_argument("--drain-hours", type=float, default=24.0, help="Extra simulated time for the backlog to drain.")
+    parser.add_argument("--jobs-per-hour", type=float, default=4.0, help="Mean arrival rate.")
+    parser.add_argument("--diurnal", type=float, default=0.5, help="Daily swing of the arrival rate, 0 to 1.")
+    parser.add_argument("--owners", type=int, default=4, help="Tenants, with Zipf-distributed shares of the traffic.")
+    parser.add_argument("--high-priority-fraction", type=float, default=0.1)
+    parser.add_argument("--models", type=str, default=DEFAULT_MODEL_MIX, help="Base model mix as model:weight,...")
+    parser.add_argument("--dataset-rows", type=int, default=2000, help="Median dataset size in rows.")
+    parser.add_argument("--dataset-rows-sigma", type=float, default=1.0, help="Log-normal spread of dataset sizes.")
+    parser.add_argument("--failure-rate", type=float, default=0.05, help="Fraction of runs that crash partway through.")
+    parser.add_argument("--preemptions-per-day", type=float, default=0.5, help="Preemptions per worker per day.")
+    parser.add_argument("--restart-minutes", type=float, default=5.0, help="Time until a preempted worker is back.")
+    parser.add_argument("--workers", type=str, default="1,2,4", help="Comma-separated worker counts to simulate.")
+    parser.add_argument("--concurrency", type=int, default=None, help="Jobs per worker; defaults to WORKER_MAX_CONCURRENCY.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--database-url", type=str, default=None, help="Scratch database; defaults to SQLite in a temporary directory.")
+    parser.add_argument("--output", type=str, default=None, help="Optional path to write results as JSON.")
+    args = parser.parse_args()
+
+    # worker.py reads its configuration at import time
+    os.environ["WORKER_MODE"] = "CPU_MOCK"
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='capacity-'), 'simulation.db')}"
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ["METRICS_PORT"] = "0"
+    if args.concurrency:
+        os.environ["WORKER_MAX_CONCURRENCY"] = str(args.concurrency)
+
+    import worker
+    from sqlalchemy import event
+
+    args.concurrency = worker.WORKER_MAX_CONCURRENCY
+    if worker.HEARTBEAT_INTERVAL_SECONDS >= worker.JOB_LEASE_SECONDS:
+        sys.exit("HEARTBEAT_INTERVAL_SECONDS must be shorter than JOB_LEASE_SECONDS, or every running job expires.")
+    if os.environ["DATABASE_URL"].startswith("sqlite"):
+        # A scratch database does not need to survive a crash; skipping fsync makes each commit ~10x cheaper
+        event.listen(worker.engine.get(), "connect", lambda connection, _: connection.execute("PRAGMA synchronous=OFF"))
+
+    workload = generate_workload(args)
+    print(f"Simulating {args.days:g} days: {len(workload)} jobs, {args.concurrency} job(s) per worker, seed {args.seed}")
+    print(f"{'workers':>7} {'done':>6} {'failed':>6} {'open':>5} {'wait p50':>9} {'wait p95':>9} {'wait p99':>9} "
+          f"{'turn p95':>9} {'util':>6} {'preempt':>7} {'wall s':>7}")
+    results = []
+    for worker_count in [int(value) for value in args.workers.split(",")]:
+        result = simulate(worker, args, workload, worker_count)
+        results.append(result)
+        statuses = result["jobs"]["statuses"]
+        wait, turnaround = result["queue_wait"], result["turnaround"]
+        print(f"{worker_count:>7} {statuses.get('COMPLETED', 0):>6} {statuses.get('FAILED', 0):>6} "
+              f"{statuses.get('QUEUED', 0) + statuses.get('RUNNING', 0):>5} "
+              f"{wait.get('p50_minutes', 0):>8.1f}m {wait.get('p95_minutes', 0):>8.1f}m {wait.get('p99_minutes', 0):>8.1f}m "
+              f"{turnaround.get('p95_minutes', 0):>8.1f}m {result['utilization'] or 0:>6.1%} {result['preemptions']:>7} "
+              f"{result['wall_seconds']:>7.1f}")
+
+    if args.output:
+        config = {key: value for key, value in vars(args).items() if key not in ("output", "database_url")}
+        scheduler_settings = {key: value for key, value in os.environ.items() if key.startswith(("SCHEDULER_", "JOB_LEASE", "HEARTBEAT", "LEASE_SWEEP", "MAX_JOB", "WORKER_POLL", "CLAIM_"))}
+        with open(args.output, "w") as f:
+            json.dump({"config": config, "environment": scheduler_settings, "results": results}, f, indent=2)
+        print(f"Results written to {args.output}")
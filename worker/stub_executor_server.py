@@ -0,0 +1,283 @@
+# stub_executor_server.py
+# A local stand-in for RunPod, for development and load tests. It exposes:
+#   - the executor server endpoints of a training pod (/execute_script, /job_status/<id>) that
+#     finetune_with_custom_pod.py talks to, and
+#   - the serverless endpoint API (/v2/<endpoint_id>/run, /runsync, /status/<id>) used by
+#     celery_worker/inference_client.py and finetune_pod_serverless.py.
+# Jobs are only simulated: a pod job emits a log line and a training metrics line every tick and
+# finishes after a configurable duration; a serverless job completes after a sampled execution time.
+# Response latency and errors can be injected to see how the platform behaves under a slow or flaky RunPod.
+#
+#   python stub_executor_server.py --port 8888 --duration 60
+#   RUNPOD_IP=http://localhost:8888 WORKER_MODE=GPU python worker.py
+#   RUNPOD_ENDPOINT_BASE_URL=http://localhost:8888/v2 celery -A shared.utils.celery_app worker -Q inference
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+JOBS = {}
+JOBS_LOCK = threading.Lock()
+SERVERLESS_JOBS = {}
+
+# Per-route request log for load tests: route -> list of (start, end, status_code), in time.time() seconds
+STATS = {}
+STATS_LOCK = threading.Lock()
+
+
+def sample_seconds(median_ms, sigma):
+    """
+    Samples a duration from a log-normal distribution with the given median, the usual shape of
+    service latencies (a long right tail). sigma 0 always returns the median.
+    """
+    if median_ms <= 0:
+        return 0.0
+    if sigma <= 0:
+        return median_ms / 1000.0
+    return random.lognormvariate(0.0, sigma) * median_ms / 1000.0
+
+
+def record_request(route, start_time, status_code):
+    with STATS_LOCK:
+        STATS.setdefault(route, []).append((start_time, time.time(), status_code))
+
+
+def snapshot_stats():
+    """
+    :return: A copy of the per-route request log.
+    """
+    with STATS_LOCK:
+        return {route: list(requests) for route, requests in STATS.items()}
+
+
+def simulate_job(job_id, duration, tick, fail):
+    """
+    Appends fake training output to the job until `duration` has passed.
+    """
+    start_time = time.time()
+    total_steps = max(1, int(duration / tick))
+    step = 0
+    while time.time() - start_time < duration:
+        step += 1
+        elapsed = time.time() - start_time
+        # Same format as PlatformMetricsCallback in finetune_template.py
+        metrics = {
+            "step": step,
+            "total_steps": total_steps,
+            "epoch": round(step / total_steps, 4),
+            "elapsed_seconds": round(elapsed, 1),
+            "eta_seconds": round(max(duration - elapsed, 0.0), 1),
+            "loss": round(1.0 / step, 4),
+            "learning_rate": 2e-4,
+            "tokens_per_second": 1000.0,
+        }
+        with JOBS_LOCK:
+            JOBS[job_id]["output"] += f"step {step} - loss {1.0 / step:.4f}\n"
+            JOBS[job_id]["output"] += f"PLATFORM_METRICS {json.dumps(metrics)}\n"
+        time.sleep(tick)
+
+    with JOBS_LOCK:
+        if fail:
+            JOBS[job_id]["status"] = "FAILED"
+            JOBS[job_id]["error"] = "Simulated failure from stub executor server."
+        else:
+            JOBS[job_id]["output"] += "Dynamic fine-tuning process finished successfully.\n"
+            JOBS[job_id]["status"] = "COMPLETED"
+
+
+class StubExecutorHandler(BaseHTTPRequestHandler):
+    duration = 30.0 # Seconds a pod job or serverless finetuning job runs
+    tick = 1.0
+    fail = False
+    latency_ms = 0.0 # Median delay added to every response
+    latency_sigma = 0.0
+    error_rate = 0.0 # Fraction of requests answered with error_status instead of being handled
+    error_status = 500
+    inference_ms = 500.0 # Median execution time of a serverless inference job
+    inference_sigma = 0.0
+
+    def _send_json(self, status_code, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _route(self):
+        """
+        :return: (route name, path arguments) for the request path, or (None, None) if unknown.
+        """
+        parts = urlparse(self.path).path.strip("/").split("/")
+        if parts == ["execute_script"]:
+            return "execute_script", []
+        if len(parts) == 2 and parts[0] == "job_status":
+            return "job_status", parts[1:]
+        if parts == ["stats"]:
+            return "stats", []
+        # Serverless API: /v2/<endpoint_id>/<operation>[/<job_id>]
+        if len(parts) >= 3 and parts[0] == "v2":
+            if len(parts) == 3 and parts[2] in ("run", "runsync"):
+                return parts[2], []
+            if len(parts) == 4 and parts[2] == "status":
+                return "status", parts[3:]
+        return None, None
+
+    def _handle(self, method):
+        start_time = time.time()
+        route, arguments = self._route()
+        if route == "stats":
+            self._send_json(200, snapshot_stats())
+            return
+        if route is None or method != ("POST" if route in ("execute_script", "run", "runsync") else "GET"):
+            self._send_json(404, {"error": "Not found"})
+            return
+
+        # Read the body up front so an injected error still leaves the connection usable
+        length = int(self.headers.get("Content-Length", 0))
+        self.payload = json.loads(self.rfile.read(length) or b"{}") if method == "POST" else {}
+        delay = sample_seconds(self.latency_ms, self.latency_sigma)
+        if delay:
+            time.sleep(delay)
+        if self.error_rate and random.random() < self.error_rate:
+            status_code, body = self.error_status, {"error": "Simulated error from stub RunPod server."}
+        else:
+            status_code, body = getattr(self, f"handle_{route}")(*arguments)
+        self._send_json(status_code, body)
+        record_request(route, start_time, status_code)
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_GET(self):
+        self._handle("GET")
+
+    # --- Pod executor server ---
+    def handle_execute_script(self):
+        if "script_content" not in self.payload:
+            return 400, {"error": "script_content is required"}
+
+        job_id = str(uuid.uuid4())
+        with JOBS_LOCK:
+            JOBS[job_id] = {"status": "IN_PROGRESS", "output": "", "error": ""}
+        threading.Thread(
+            target=simulate_job, args=(job_id, self.duration, self.tick, self.fail), daemon=True
+        ).start()
+        return 200, {"job_id": job_id, "status": "IN_PROGRESS"}
+
+    def handle_job_status(self, job_id):
+        with JOBS_LOCK:
+            job = JOBS.get(job_id)
+            job = dict(job) if job else None
+        if job is None:
+            return 404, {"error": f"Job {job_id} not found"}
+
+        # `since` is a byte offset into the full output; only the tail after it is returned
+        try:
+            since = int(parse_qs(urlparse(self.path).query).get("since", ["0"])[0])
+        except ValueError:
+            since = -1
+        if since < 0:
+            return 400, {"error": "since must be a non-negative integer"}
+        output_bytes = job["output"].encode("utf-8")
+        return 200, {
+            "job_id": job_id,
+            "status": job["status"],
+            "output": output_bytes[since:].decode("utf-8", errors="replace"),
+            "next_offset": len(output_bytes),
+            "error": job["error"],
+        }
+
+    # --- Serverless endpoint API ---
+    def create_serverless_job(self):
+        job_input = self.payload.get("input") or {}
+        # Requests with a prompt are inference calls; anything else is treated as a finetuning run
+        if "prompt" in job_input:
+            execution_seconds = sample_seconds(self.inference_ms, self.inference_sigma)
+            output = {"inference_output": f"Simulated response to a {len(job_input['prompt'] or '')} character prompt.", "status": "success"}
+        else:
+            execution_seconds = self.duration
+            output = {"status": "success", "hf_repo_id": job_input.get("hf_repo_id")}
+        job_id = str(uuid.uuid4())
+        with JOBS_LOCK:
+            SERVERLESS_JOBS[job_id] = {"submitted_at": time.time(), "execution_seconds": execution_seconds, "output": output}
+        return job_id
+
+    def serverless_status(self, job_id):
+        # Computed on read: a job is IN_PROGRESS until its execution time has passed
+        with JOBS_LOCK:
+            job = SERVERLESS_JOBS.get(job_id)
+        if job is None:
+            return None
+        elapsed = time.time() - job["submitted_at"]
+        body = {"id": job_id, "delayTime": 0, "executionTime": int(min(elapsed, job["execution_seconds"]) * 1000)}
+        if elapsed < job["execution_seconds"]:
+            body["status"] = "IN_PROGRESS"
+        elif self.fail:
+            body.update(status="FAILED", error="Simulated failure from stub RunPod server.")
+        else:
+            body.update(status="COMPLETED", output=job["output"])
+        return body
+
+    def handle_run(self):
+        return 200, {"id": self.create_serverless_job(), "status": "IN_QUEUE"}
+
+    def handle_runsync(self):
+        job_id = self.create_serverless_job()
+        with JOBS_LOCK:
+            execution_seconds = SERVERLESS_JOBS[job_id]["execution_seconds"]
+        time.sleep(execution_seconds)
+        return 200, self.serverless_status(job_id)
+
+    def handle_status(self, job_id):
+        body = self.serverless_status(job_id)
+        if body is None:
+            return 404, {"error": f"Job {job_id} not found"}
+        return 200, body
+
+    def log_message(self, format, *args):
+        pass
+
+
+def create_server(host="127.0.0.1", port=8888):
+    """
+    Creates the server without starting it; port 0 picks a free port (see server.server_port).
+    Configure the simulation through the StubExecutorHandler class attributes.
+    """
+    server = ThreadingHTTPServer((host, port), StubExecutorHandler)
+    server.daemon_threads = True
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stub RunPod server (pod executor and serverless API) for local testing")
+    parser.add_argument("--host", type=str, default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8888)
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds each simulated finetuning job runs.")
+    parser.add_argument("--tick", type=float, default=1.0, help="Seconds between simulated output lines.")
+    parser.add_argument("--fail", action="store_true", help="Make every simulated job end in FAILED.")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Median delay added to every response.")
+    parser.add_argument("--latency-sigma", type=float, default=0.0, help="Log-normal spread of the delay; 0 is constant.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with --error-status.")
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--inference-ms", type=float, default=500.0, help="Median execution time of a serverless inference job.")
+    parser.add_argument("--inference-sigma", type=float, default=0.0)
+    args = parser.parse_args()
+
+    StubExecutorHandler.duration = args.duration
+    StubExecutorHandler.tick = args.tick
+    StubExecutorHandler.fail = args.fail
+    StubExecutorHandler.latency_ms = args.latency_ms
+    StubExecutorHandler.latency_sigma = args.latency_sigma
+    StubExecutorHandler.error_rate = args.error_rate
+    StubExecutorHandler.error_status = args.error_status
+    StubExecutorHandler.inference_ms = args.inference_ms
+    StubExecutorHandler.inference_sigma = args.inference_sigma
+
+    server = create_server(args.host, args.port)
+    print(f"Stub RunPod server listening on {args.host}:{args.port}")
+    server.serve_forever()
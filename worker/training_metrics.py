@@ -0,0 +1,70 @@
+import json
+import os
+from datetime import datetime, timezone
+
+# Printed by PlatformMetricsCallback in finetune_template.py, one JSON object per line
+METRICS_LINE_PREFIX = "PLATFORM_METRICS "
+# The stored curve is downsampled to about this many points per job, however long the run is
+METRICS_MAX_POINTS = int(os.getenv("METRICS_MAX_POINTS", "200"))
+
+
+def parse_metrics_lines(output):
+    """
+    Extracts the metrics payloads from a chunk of script output. Other lines are ignored.
+    """
+    metrics = []
+    for line in output.splitlines():
+        index = line.find(METRICS_LINE_PREFIX)
+        if index < 0:
+            continue
+        try:
+            metrics.append(json.loads(line[index + len(METRICS_LINE_PREFIX):]))
+        except json.JSONDecodeError:
+            continue
+    return metrics
+
+
+class TrainingMetricsRecorder:
+    """
+    Turns the metrics lines of one job's output into a buffered training_progress update on the Job
+    and a downsampled series in job_metrics. Call it with each new output chunk.
+    """
+    def __init__(self, job_id, status_writer, max_points=METRICS_MAX_POINTS):
+        self.job_id = job_id
+        self.status_writer = status_writer
+        self.max_points = max(1, max_points)
+        self.last_stored_step = None
+        self.progress = {}
+        self.partial_line = ""
+
+    def __call__(self, output):
+        # A chunk can end in the middle of a line; keep the tail for the next chunk
+        output = self.partial_line + output
+        complete, _, self.partial_line = output.rpartition("\n")
+        metrics = parse_metrics_lines(complete)
+        if not metrics:
+            return
+
+        rows = []
+        for payload in metrics:
+            step = payload.get("step") or 0
+            total_steps = payload.get("total_steps") or 0
+            if payload.get("loss") is None:
+                continue
+            stride = max(1, total_steps // self.max_points)
+            is_last = total_steps and step >= total_steps
+            if self.last_stored_step is None or step - self.last_stored_step >= stride or is_last:
+                rows.append({
+                    "step": step,
+                    "epoch": payload.get("epoch"),
+                    "loss": payload.get("loss"),
+                    "learning_rate": payload.get("learning_rate"),
+                    "tokens_per_second": payload.get("tokens_per_second"),
+                })
+                self.last_stored_step = step
+
+        # Merged into the previous state, so the last loss and throughput stay visible between log events
+        for payload in metrics:
+            self.progress.update({key: value for key, value in payload.items() if value is not None})
+        self.progress["reported_at"] = datetime.now(timezone.utc).isoformat()
+        self.status_writer.record_progress(self.job_id, metric_rows=rows, training_progress=dict(self.progress))
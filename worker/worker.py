@@ -1,10 +1,16 @@
 import time
 import os
-from sqlalchemy import create_engine, update
+import signal
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import create_engine, func, update
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
 import sys
-from shared.utils import logger
+from shared.utils import logger, metrics
+from shared.utils.lazy import LazyResource
 logger = logger.setup_logger('worker')
 
 # Load environment variables from .env file
@@ -12,7 +18,9 @@ load_dotenv()
 
 # Add the parent directory to the path to import from backend
 # sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from shared.db.base import Job
+from shared.db.base import Job, Pod
+from shared.db.status_writer import JobStatusWriter
+import scheduler
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 WORKER_MODE = os.getenv("WORKER_MODE", "GPU") # Default to GPU mode
@@ -21,65 +29,526 @@ WORKER_MODE = os.getenv("WORKER_MODE", "GPU") # Default to GPU mode
 if WORKER_MODE == "GPU-SERVERLESS":
     import finetune_pod_serverless, s3_data_set_upload_service
 elif WORKER_MODE == "GPU":
-    import finetune_with_custom_pod
+    import finetune_with_custom_pod, placement, training_metrics
 elif WORKER_MODE == "CPU_MOCK":
     import finetune_mock
 else:
     raise ValueError("Invalid WORKER_MODE. Choose 'GPU' or 'CPU_MOCK'.")
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# --- Concurrency configuration ---
+# Most of a job's lifetime is spent waiting on a remote pod, so one worker can drive several at once
+WORKER_MAX_CONCURRENCY = max(1, int(os.getenv("WORKER_MAX_CONCURRENCY", "1")))
+WORKER_SHUTDOWN_GRACE_SECONDS = float(os.getenv("WORKER_SHUTDOWN_GRACE_SECONDS", "30"))
+# The executor server cannot cancel a run, so a job whose pod run is still going at shutdown is not requeued;
+# its lease is extended by this much instead, and the lease sweep retries it only once that has passed
+WORKER_SHUTDOWN_LEASE_SECONDS = float(os.getenv("WORKER_SHUTDOWN_LEASE_SECONDS", "3600"))
+POLL_INTERVAL_SECONDS = float(os.getenv("WORKER_POLL_INTERVAL_SECONDS", "10"))
+RECONCILE_INTERVAL_SECONDS = float(os.getenv("RECONCILE_INTERVAL_SECONDS", "30"))
+RECONCILE_BATCH_SIZE = int(os.getenv("RECONCILE_BATCH_SIZE", "100"))
+# Jobs handed off to RunPod that have not reached a terminal status by then (e.g. because their status
+# can no longer be looked up once RunPod's retention window has passed) are failed
+SERVERLESS_JOB_DEADLINE_SECONDS = float(os.getenv("SERVERLESS_JOB_DEADLINE_SECONDS", str(24 * 60 * 60)))
 
-def update_job_status(db, job_id, status, error_message=None):
-    stmt = (
+# --- Lease configuration ---
+# A claimed job stays leased to this worker only as long as it keeps heartbeating
+WORKER_ID = os.getenv("WORKER_ID", f"{socket.gethostname()}-{os.getpid()}")
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "120"))
+HEARTBEAT_INTERVAL_SECONDS = float(os.getenv("HEARTBEAT_INTERVAL_SECONDS", "30"))
+LEASE_SWEEP_INTERVAL_SECONDS = float(os.getenv("LEASE_SWEEP_INTERVAL_SECONDS", "60"))
+MAX_JOB_ATTEMPTS = int(os.getenv("MAX_JOB_ATTEMPTS", "3"))
+
+# Queue an export job after each finetuning run that merges the adapter into the base weights (GPU mode only)
+EXPORT_MERGED_MODELS = os.getenv("EXPORT_MERGED_MODELS", "true").lower() == "true"
+
+# Uploads are always converted to canonical Parquet (ingest_dataset.py) before training; these control the
+# removal of exact and near-duplicate rows that follows (dedup_dataset.py)
+DEDUP_DATASETS = os.getenv("DEDUP_DATASETS", "true").lower() == "true"
+DEDUP_NEAR_DUPLICATES = os.getenv("DEDUP_NEAR_DUPLICATES", "true").lower() == "true"
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "/app/uploads") # Datasets uploaded through the API
+
+# Merged exports run export_template.py on a training pod, so only GPU workers claim them
+EXCLUDED_TASK_TYPES = () if WORKER_MODE == "GPU" else ("export",)
+
+# How many of the scheduler's top picks to try per claim; jobs that fit on no pod are skipped
+CLAIM_CANDIDATE_LIMIT = max(WORKER_MAX_CONCURRENCY, int(os.getenv("CLAIM_CANDIDATE_LIMIT", "20")))
+
+# Every in-flight job holds its own session, plus the polling loop, the serverless reconciler and the heartbeat
+engine = LazyResource(lambda: create_engine(DATABASE_URL, pool_size=WORKER_MAX_CONCURRENCY + 3))
+SessionLocal = LazyResource(lambda: sessionmaker(autocommit=False, autoflush=False, bind=engine.get()))
+status_writer = JobStatusWriter(SessionLocal)
+
+shutdown_event = threading.Event()
+in_flight_jobs = {} # job_id -> Thread driving it
+remote_jobs = set() # Ids of in-flight jobs whose run on a pod has started
+in_flight_lock = threading.Lock()
+
+# simulate_capacity.py replaces this with its virtual clock; all lease and claim times go through it
+def utc_now():
+    return datetime.now(timezone.utc)
+
+def lease_deadline():
+    return utc_now() + timedelta(seconds=JOB_LEASE_SECONDS)
+
+def claim_next_job(db, worker_id=None):
+    """
+    Atomically moves the next QUEUED job picked by the scheduler to RUNNING and returns its id,
+    or None if the queue is empty. The conditional UPDATE makes the claim safe against other
+    workers and threads racing for the same row.
+    In GPU mode with a pod registry, a job is only claimed once a pod with enough free VRAM is found.
+    Workers in other modes never claim export jobs.
+    :param worker_id: Lease owner to record; defaults to this worker.
+    """
+    candidates = scheduler.rank_queued_jobs(
+        db, limit=CLAIM_CANDIDATE_LIMIT, now=utc_now(), exclude_task_types=EXCLUDED_TASK_TYPES,
+    )
+    use_placement = WORKER_MODE == "GPU" and placement.registry_enabled(db)
+    for job_id in candidates:
+        values = {
+            "status": "RUNNING",
+            "error_message": None,
+            "attempts": func.coalesce(Job.attempts, 0) + 1,
+            "started_at": utc_now(),
+            "lease_owner": worker_id or WORKER_ID,
+            "lease_expires_at": lease_deadline(),
+        }
+        if use_placement:
+            job = db.get(Job, job_id)
+            if job.task_type == "export":
+                required_vram_gb = placement.estimate_export_vram_gb(job.base_model)
+            else:
+                required_vram_gb = placement.estimate_training_vram_gb(job.base_model)
+            pod = placement.place_job(db, required_vram_gb)
+            if pod is None:
+                db.rollback()
+                continue
+            values.update(pod_id=pod.id, estimated_vram_gb=required_vram_gb)
+
+        result = db.execute(
+            update(Job)
+            .where(Job.id == job_id, Job.status == "QUEUED")
+            .values(**values)
+        )
+        db.commit()
+        if result.rowcount == 1:
+            logger.info(f"Updated job {job_id} to status RUNNING", extra={"job_id": job_id, "status": "RUNNING"})
+            status_writer.record_history(job_id, "RUNNING")
+            return job_id
+    return None
+
+def execute_job(db, job):
+    """
+    Runs the job with the logic for the configured mode.
+    :return: True when the job finished here, False when it was handed off to RunPod
+             and is now tracked by the serverless reconciler.
+    """
+    if job.task_type != "export":
+        prepare_dataset(db, job)
+
+    if WORKER_MODE == "GPU-SERVERLESS":
+        s3_data_set_upload_service.upload_data_set_to_s3(job)
+        runpod_job_id = finetune_pod_serverless.submit_finetuning_job_serverless(job)
+        # RunPod owns the run from here on; the reconciler, not the lease, tracks it
+        db.execute(
+            update(Job)
+            .where(Job.id == job.id)
+            .values(runpod_job_id=runpod_job_id, lease_owner=None, lease_expires_at=None)
+        )
+        db.commit()
+        return False
+    elif WORKER_MODE == "GPU":
+        pod = db.get(Pod, job.pod_id) if job.pod_id else None
+        with in_flight_lock:
+            remote_jobs.add(job.id)
+        if job.task_type == "export":
+            run_export_job(db, job, server_url=pod.url if pod else None)
+        else:
+            finetune_with_custom_pod.run_finetuning_job(
+                job,
+                server_url=pod.url if pod else None,
+                on_output=training_metrics.TrainingMetricsRecorder(job.id, status_writer),
+            )
+            if EXPORT_MERGED_MODELS:
+                enqueue_export_job(db, job)
+    elif WORKER_MODE == "CPU_MOCK":
+        finetune_mock.run_mock_finetuning_job(job)
+    return True
+
+def prepare_dataset(db, job):
+    """
+    Runs the CPU preprocessing stages on a finetuning job's dataset: conversion of the upload to canonical
+    Parquet (ingest_dataset.py), then deduplication (dedup_dataset.py). The job is pointed at the result
+    through prepared_dataset_filename; a retried job reuses the output of its earlier attempt.
+    """
+    if not job.dataset_filename:
+        return
+    if job.prepared_dataset_filename and os.path.exists(os.path.join(UPLOAD_DIR, job.prepared_dataset_filename)):
+        return
+    # These load pyarrow and numpy, so only once a job needs them rather than at worker start
+    import ingest_dataset, dedup_dataset
+
+    canonical_filename = ingest_dataset.output_filename(job.id)
+    canonical_path = os.path.join(UPLOAD_DIR, canonical_filename)
+    stats = ingest_dataset.convert_to_parquet(os.path.join(UPLOAD_DIR, job.dataset_filename), canonical_path, job.dataset_type)
+    stats["ingest_seconds"] = stats.pop("seconds")
+    prepared_filename = canonical_filename
+    if DEDUP_DATASETS:
+        prepared_filename = dedup_dataset.output_filename(canonical_filename)
+        prepared_path = os.path.join(UPLOAD_DIR, prepared_filename)
+        dedup_stats = dedup_dataset.dedup_parquet(canonical_path, prepared_path, near_duplicates=DEDUP_NEAR_DUPLICATES)
+        os.remove(canonical_path) # Only the final stage's output is kept
+        stats.update(
+            rows_out=dedup_stats["rows_out"],
+            exact_duplicates=dedup_stats["exact_duplicates"],
+            near_duplicates=dedup_stats["near_duplicates"],
+            expected_false_drops=dedup_stats["expected_false_drops"],
+            parquet_bytes=os.path.getsize(prepared_path),
+            dedup_seconds=dedup_stats["seconds"],
+        )
+    stats["removed_fraction"] = round(1 - stats["rows_out"] / stats["rows_in"], 4) if stats["rows_in"] else 0.0
+
+    db.execute(
         update(Job)
-        .where(Job.id == job_id)
-        .values(status=status, error_message=error_message)
+        .where(Job.id == job.id)
+        .values(prepared_dataset_filename=prepared_filename, dataset_stats=stats)
+    )
+    db.commit()
+    for reason in ("exact_duplicates", "near_duplicates", "invalid_rows"):
+        metrics.DATASET_ROWS_REMOVED.labels(reason).inc(stats.get(reason, 0))
+    logger.info(
+        f"Prepared dataset of job {job.id}: kept {stats['rows_out']} of {stats['rows_in']} rows",
+        extra={"job_id": job.id, "dataset_stats": stats},
+    )
+    if stats["rows_out"] == 0:
+        raise RuntimeError(f"Dataset {job.dataset_filename} has no usable rows for dataset type {job.dataset_type}.")
+
+def enqueue_export_job(db, job):
+    """
+    Queues a merged-weights export for a finetuning job. It inherits the job's owner and priority,
+    so it is scheduled like the training run it belongs to.
+    """
+    adapter_repo = finetune_with_custom_pod.finetuned_repo_id(job)
+    export_job = Job(
+        id=str(uuid.uuid4()),
+        task_type="export",
+        status="QUEUED",
+        base_model=job.base_model,
+        owner=job.owner,
+        priority=job.priority,
+        input_data={
+            "source_job_id": job.id,
+            "adapter_repo": adapter_repo,
+            "merged_repo": finetune_with_custom_pod.merged_repo_id(adapter_repo),
+        },
     )
-    db.execute(stmt)
+    db.add(export_job)
     db.commit()
-    print(f"Updated job {job_id} to status {status}")
+    logger.info(f"Queued merged export job {export_job.id} for job {job.id}", extra={"job_id": job.id})
+
+def run_export_job(db, job, server_url=None):
+    """
+    Runs an export job and records the merged repo on both the export job and the finetuning job it came from.
+    """
+    merged_repo = finetune_with_custom_pod.run_export_job(job, server_url=server_url)
+    db.execute(
+        update(Job)
+        .where(Job.id.in_([job.id, job.input_data["source_job_id"]]))
+        .values(merged_model_repo=merged_repo)
+    )
+    db.commit()
+
+def finish_job(job_id, task_type, status, run_seconds, error_message=None, worker_id=None):
+    """
+    Records the terminal status of a job this worker ran and releases its lease. Nothing is written if
+    the lease has meanwhile been swept (and the job possibly claimed again by another worker).
+    :param worker_id: Lease owner the job must still have; defaults to this worker.
+    """
+    status_writer.record(
+        job_id, status, error_message=error_message, if_lease_owner=worker_id or WORKER_ID,
+        lease_owner=None, lease_expires_at=None,
+    )
+    metrics.JOBS_FINISHED.labels(task_type, status).inc()
+    metrics.JOB_RUN_SECONDS.labels(task_type, status).observe(run_seconds)
+
+def run_job(job_id):
+    """
+    Drives a single claimed job to completion on its own DB session.
+    """
+    db = SessionLocal()
+    start_time = time.time()
+    try:
+        job = db.get(Job, job_id)
+        task_type = job.task_type or "finetuning"
+        if job.created_at is not None and job.started_at is not None:
+            metrics.JOB_QUEUE_WAIT_SECONDS.labels(task_type).observe((job.started_at - job.created_at).total_seconds())
+        try:
+            finished = execute_job(db, job)
+        except Exception as e:
+            logger.error(f"Error processing job {job_id}: {e}", exc_info=True, extra={"job_id": job_id})
+            db.rollback()
+            finish_job(job_id, task_type, "FAILED", time.time() - start_time, error_message=str(e))
+        else:
+            # Outside the try above: a failure to write COMPLETED must not turn a successful run into FAILED
+            if finished:
+                finish_job(job_id, task_type, "COMPLETED", time.time() - start_time)
+            # Otherwise handed off to RunPod; the reconciler counts it once it finishes
+    finally:
+        db.close()
+        with in_flight_lock:
+            in_flight_jobs.pop(job_id, None)
+            remote_jobs.discard(job_id)
+
+def reconcile_serverless_jobs():
+    """
+    Polls every RUNNING job that was handed off to RunPod, in batches, and applies terminal states.
+    Jobs still not finished SERVERLESS_JOB_DEADLINE_SECONDS after they started are failed.
+    Tracking lives entirely in the jobs table, so a restarted worker resumes where the last one stopped.
+    """
+    db = SessionLocal()
+    try:
+        last_job_id = ""
+        while True:
+            rows = (
+                db.query(Job.id, Job.runpod_job_id)
+                .filter(Job.status == "RUNNING", Job.runpod_job_id.isnot(None), Job.id > last_job_id)
+                .order_by(Job.id)
+                .limit(RECONCILE_BATCH_SIZE)
+                .all()
+            )
+            if not rows:
+                break
+            last_job_id = rows[-1].id
+
+            statuses = finetune_pod_serverless.fetch_runpod_statuses([row.runpod_job_id for row in rows])
+            for job_id, runpod_job_id in rows:
+                status_data = statuses.get(runpod_job_id)
+                if status_data is None:
+                    continue
+                status, error_message = finetune_pod_serverless.map_runpod_status(status_data)
+                if status is None:
+                    continue
+                result = db.execute(
+                    update(Job)
+                    .where(Job.id == job_id, Job.status == "RUNNING")
+                    .values(status=status, error_message=error_message)
+                )
+                if result.rowcount == 1:
+                    status_writer.record_history(job_id, status, error_message)
+                    metrics.JOBS_FINISHED.labels("finetuning", status).inc()
+                logger.info(
+                    f"Updated job {job_id} to status {status} (RunPod job {runpod_job_id})",
+                    extra={"job_id": job_id, "status": status, "runpod_job_id": runpod_job_id},
+                )
+            db.commit()
+
+        # After the polls above, so a job that finished just before its deadline is still recorded as such
+        error_message = f"RunPod job did not finish within {SERVERLESS_JOB_DEADLINE_SECONDS:.0f}s."
+        expired = db.execute(
+            update(Job)
+            .where(
+                Job.status == "RUNNING",
+                Job.runpod_job_id.isnot(None),
+                Job.started_at < utc_now() - timedelta(seconds=SERVERLESS_JOB_DEADLINE_SECONDS),
+            )
+            .values(status="FAILED", error_message=error_message)
+            .returning(Job.id)
+        ).scalars().all()
+        db.commit()
+        for job_id in expired:
+            status_writer.record_history(job_id, "FAILED", error_message)
+            metrics.JOBS_FINISHED.labels("finetuning", "FAILED").inc()
+        if expired:
+            logger.info(f"Failed {len(expired)} serverless job(s) past their deadline: {expired}")
+    finally:
+        db.close()
+
+def run_serverless_reconciler():
+    logger.info(f"Serverless reconciler started, polling every {RECONCILE_INTERVAL_SECONDS}s")
+    while not shutdown_event.is_set():
+        try:
+            reconcile_serverless_jobs()
+        except Exception as e:
+            logger.error(f"Error reconciling serverless jobs: {e}", exc_info=True)
+        shutdown_event.wait(RECONCILE_INTERVAL_SECONDS)
+
+def requeue_jobs(job_ids):
+    """
+    Releases claims on jobs this worker could not finish so another worker picks them up.
+    """
+    if not job_ids:
+        return
+    db = SessionLocal()
+    try:
+        requeued_ids = db.execute(
+            update(Job)
+            .where(Job.id.in_(job_ids), Job.status == "RUNNING", Job.runpod_job_id.is_(None))
+            # A graceful release is not a failed attempt
+            .values(
+                status="QUEUED",
+                attempts=func.coalesce(Job.attempts, 1) - 1,
+                lease_owner=None,
+                lease_expires_at=None,
+                pod_id=None,
+                estimated_vram_gb=None,
+            )
+            .returning(Job.id)
+        ).scalars().all()
+        db.commit()
+        for job_id in requeued_ids:
+            status_writer.record_history(job_id, "QUEUED", "Released by worker shutdown.")
+        logger.info(f"Requeued {len(requeued_ids)} unfinished job(s): {requeued_ids}")
+    finally:
+        db.close()
+
+def heartbeat_in_flight_jobs():
+    """
+    Extends the lease on every job this worker is still driving.
+    """
+    with in_flight_lock:
+        job_ids = list(in_flight_jobs)
+    extend_leases(job_ids)
+
+def extend_leases(job_ids, worker_id=None, lease_seconds=None):
+    """
+    Extends the lease on the given jobs held by `worker_id` (default: this worker) with a single UPDATE.
+    :param lease_seconds: New lease length; defaults to JOB_LEASE_SECONDS.
+    """
+    if not job_ids:
+        return
+    expires_at = utc_now() + timedelta(seconds=lease_seconds) if lease_seconds is not None else lease_deadline()
+    db = SessionLocal()
+    try:
+        db.execute(
+            update(Job)
+            .where(Job.id.in_(job_ids), Job.status == "RUNNING", Job.lease_owner == (worker_id or WORKER_ID))
+            .values(lease_expires_at=expires_at)
+        )
+        db.commit()
+    finally:
+        db.close()
+
+def sweep_expired_leases():
+    """
+    Requeues RUNNING jobs whose worker stopped heartbeating, or fails them once MAX_JOB_ATTEMPTS is used up.
+    Jobs handed off to RunPod are skipped; the serverless reconciler owns those.
+    """
+    db = SessionLocal()
+    try:
+        expired = (
+            Job.status == "RUNNING",
+            Job.runpod_job_id.is_(None),
+            Job.lease_expires_at.isnot(None),
+            Job.lease_expires_at < utc_now(),
+        )
+        failed_message = f"Worker lease expired after {MAX_JOB_ATTEMPTS} attempts."
+        requeued = db.execute(
+            update(Job)
+            .where(*expired, func.coalesce(Job.attempts, 0) < MAX_JOB_ATTEMPTS)
+            .values(status="QUEUED", lease_owner=None, lease_expires_at=None, pod_id=None, estimated_vram_gb=None)
+            .returning(Job.id)
+        ).scalars().all()
+        failed = db.execute(
+            update(Job)
+            .where(*expired, func.coalesce(Job.attempts, 0) >= MAX_JOB_ATTEMPTS)
+            .values(
+                status="FAILED",
+                error_message=failed_message,
+                lease_owner=None,
+                lease_expires_at=None,
+            )
+            .returning(Job.id)
+        ).scalars().all()
+        db.commit()
+        for job_id in requeued:
+            status_writer.record_history(job_id, "QUEUED", "Worker lease expired.")
+        for job_id in failed:
+            status_writer.record_history(job_id, "FAILED", failed_message)
+        if requeued or failed:
+            logger.info(f"Lease sweep requeued {len(requeued)} and failed {len(failed)} job(s) with expired leases.")
+    finally:
+        db.close()
+
+def run_heartbeat():
+    last_sweep = 0.0
+    while not shutdown_event.is_set():
+        try:
+            heartbeat_in_flight_jobs()
+            if time.time() - last_sweep >= LEASE_SWEEP_INTERVAL_SECONDS:
+                sweep_expired_leases()
+                last_sweep = time.time()
+        except Exception as e:
+            logger.error(f"Error during heartbeat or lease sweep: {e}", exc_info=True)
+        shutdown_event.wait(HEARTBEAT_INTERVAL_SECONDS)
+
+def handle_shutdown(signum, frame):
+    logger.info(f"Received signal {signum}, no new jobs will be claimed.")
+    shutdown_event.set()
+
+def drain_in_flight_jobs():
+    """
+    Waits up to WORKER_SHUTDOWN_GRACE_SECONDS for in-flight jobs, then requeues those that have not
+    started a pod run. Jobs whose pod run is still going keep their claim for WORKER_SHUTDOWN_LEASE_SECONDS,
+    so another worker does not start a second GPU run next to it.
+    """
+    deadline = time.time() + WORKER_SHUTDOWN_GRACE_SECONDS
+    while time.time() < deadline:
+        with in_flight_lock:
+            if not in_flight_jobs:
+                return
+        time.sleep(0.5)
+
+    with in_flight_lock:
+        remaining = list(in_flight_jobs)
+        live = [job_id for job_id in remaining if job_id in remote_jobs]
+    requeue_jobs([job_id for job_id in remaining if job_id not in live])
+    if live:
+        extend_leases(live, lease_seconds=WORKER_SHUTDOWN_LEASE_SECONDS)
+        logger.info(f"Left {len(live)} job(s) with a running pod run leased for {WORKER_SHUTDOWN_LEASE_SECONDS:.0f}s: {live}")
 
 def poll_for_jobs():
-    logger.info('In poll for jobs')
-    print(f"Worker started in {WORKER_MODE} mode. Polling for jobs...")
-    while True:
+    logger.info(f"Worker {WORKER_ID} started in {WORKER_MODE} mode with concurrency {WORKER_MAX_CONCURRENCY}. Polling for jobs...")
+    signal.signal(signal.SIGTERM, handle_shutdown)
+    signal.signal(signal.SIGINT, handle_shutdown)
+    metrics.start_metrics_server()
+
+    if WORKER_MODE == "GPU":
         db = SessionLocal()
         try:
-            job_to_process = db.query(Job).filter(Job.status == "QUEUED").order_by(Job.created_at).first()
-
-            if job_to_process:
-                print(f"Found job: {job_to_process.id}")
-                update_job_status(db, job_to_process.id, "RUNNING")
-
-                try:
-                    # Execute the correct logic based on the mode
-                    if WORKER_MODE == "GPU-SERVERLESS":
-                        #finetune_with_custom_pod.run_finetuning_job(job_to_process)
-                        #finetune_pod_serverless.run_finetuning_job(job_to_process)
-                        s3_data_set_upload_service.upload_data_set_to_s3(job_to_process)
-                        job_response = finetune_pod_serverless.run_finetuning_job(job_to_process)
-                        update_job_status(db, job_to_process.id, "COMPLETED")
-                    elif WORKER_MODE == "GPU":
-                        finetune_with_custom_pod.run_finetuning_job(job_to_process)
-                        update_job_status(db, job_to_process.id, "COMPLETED")
-                        #finetune_pod_serverless.run_finetuning_job(job_to_process)
-                        #s3_data_set_upload_service.upload_data_set_to_s3(job_to_process)
-                        #job_response = finetune_pod_serverless.run_finetuning_job(job_to_process)    
-                    elif WORKER_MODE == "CPU_MOCK":
-                        finetune_mock.run_mock_finetuning_job(job_to_process)
-                        update_job_status(db, job_to_process.id, "COMPLETED")
-                    
-
-                except Exception as e:
-                    print(f"Error processing job {job_to_process.id}: {e}")
-                    import traceback
-                    traceback.print_exc()
-                    update_job_status(db, job_to_process.id, "FAILED", error_message=str(e))
-            else:
-                time.sleep(10)
+            placement.sync_pods_from_file(db)
         finally:
             db.close()
 
+    threading.Thread(target=run_heartbeat, name="heartbeat", daemon=True).start()
+    if WORKER_MODE == "GPU-SERVERLESS":
+        threading.Thread(target=run_serverless_reconciler, name="serverless-reconciler", daemon=True).start()
+
+    while not shutdown_event.is_set():
+        with in_flight_lock:
+            has_free_slot = len(in_flight_jobs) < WORKER_MAX_CONCURRENCY
+        if not has_free_slot:
+            shutdown_event.wait(1)
+            continue
+
+        db = SessionLocal()
+        start_time = time.perf_counter()
+        try:
+            job_id = claim_next_job(db)
+        finally:
+            db.close()
+        metrics.JOB_CLAIM_SECONDS.labels(WORKER_MODE, "claimed" if job_id else "empty").observe(time.perf_counter() - start_time)
+
+        if job_id:
+            logger.info(f"Found job: {job_id}", extra={"job_id": job_id})
+            # Daemon threads so an expired shutdown grace period does not block process exit
+            thread = threading.Thread(target=run_job, args=(job_id,), name=f"job-{job_id}", daemon=True)
+            with in_flight_lock:
+                in_flight_jobs[job_id] = thread
+            thread.start()
+        else:
+            shutdown_event.wait(POLL_INTERVAL_SECONDS)
+
+    drain_in_flight_jobs()
+    status_writer.close()
+    logger.info("Worker shut down.")
+
 if __name__ == "__main__":
-    poll_for_jobs()
\ No newline at end of file
+    poll_for_jobs()